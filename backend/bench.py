@@ -0,0 +1,590 @@
+"""
+Performance benchmarks for the Jupiter Arena backend (bench).
+
+Each benchmark seeds a throwaway database and times a code path before and after an
+optimization, printing p50/p99 latency (peak RSS for exports). The database is dropped
+before seeding, so the name must contain "bench" (default gym_db_bench). Never point this
+at production.
+
+Usage (from backend/):
+  MONGODB_URL=mongodb://localhost:27017 python bench.py dashboard --members 100000
+  MONGODB_URL=mongodb://localhost:27017 python bench.py reminders --members 10000
+  MONGODB_URL=mongodb://localhost:27017 python bench.py export --rows 1000000
+  MONGODB_URL=mongodb://localhost:27017 python bench.py checkin --members 2000
+  MONGODB_URL=mongodb://localhost:27017 python bench.py search --members 50000
+  MONGODB_URL=mongodb://localhost:27017 python bench.py attendance --rows 100000
+  MONGODB_URL=mongodb://localhost:27017 python bench.py lists --members 5000
+  MONGODB_URL=mongodb://localhost:27017 python bench.py stream --rows 200000
+  MONGODB_URL=mongodb://localhost:27017 python bench.py dues --members 50000
+  MONGODB_URL=mongodb://localhost:27017 python bench.py series --rows 300000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("DATABASE_NAME", "gym_db_bench")
+
+SEED_BATCH = 5000
+
+FIRST_NAMES = ["Aarav", "Ananya", "Arjun", "Asha", "Deepak", "Divya", "Farhan", "Gaurav", "Isha", "Karan",
+               "Kavya", "Meera", "Nikhil", "Pooja", "Priya", "Rahul", "Ravi", "Rohan", "Sneha", "Vikram"]
+LAST_NAMES = ["Agarwal", "Bose", "Chopra", "Das", "Gupta", "Iyer", "Joshi", "Kapoor", "Khan", "Kumar",
+              "Menon", "Nair", "Patel", "Rao", "Reddy", "Shah", "Sharma", "Singh", "Verma", "Yadav"]
+
+
+def _main():
+    """Import the app lazily so DATABASE_NAME is set first."""
+    import main
+    if "bench" not in main.DATABASE_NAME:
+        raise SystemExit(f"Refusing to run against {main.DATABASE_NAME!r}: DATABASE_NAME must contain 'bench'")
+    return main
+
+
+def report(label: str, samples_ms: list[float]) -> None:
+    ordered = sorted(samples_ms)
+    p99 = ordered[min(len(ordered) - 1, int(round(0.99 * (len(ordered) - 1))))]
+    print(f"{label:<32} runs={len(ordered):<4} p50={statistics.median(ordered):8.2f} ms  p99={p99:8.2f} ms")
+
+
+async def timed(fn, runs: int) -> list[float]:
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+async def _insert_batched(collection, docs) -> None:
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= SEED_BATCH:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+
+async def seed(main, members: int, attendance_per_member: int = 3, days: int = 365) -> list[str]:
+    """Drop the bench DB and seed members, two payments each, and attendance spread over `days` (plus rollups)."""
+    from indexes import ensure_indexes
+    from rollups import rebuild_daily_stats
+    await main.client.drop_database(main.DATABASE_NAME)
+    await ensure_indexes(main.db)
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+    member_ids = []
+
+    from search import member_search_tokens
+
+    def member_docs():
+        for i in range(members):
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            yield {
+                "name": name,
+                "phone": f"7{i:09d}",
+                "phone_e164": f"+917{i:09d}",
+                "search_tokens": member_search_tokens(name, f"+917{i:09d}"),
+                "email": f"bench{i}@example.com",
+                "membership_type": "PT" if rng.random() < 0.2 else "Regular",
+                "batch": rng.choice(["Morning", "Evening", "Ladies"]),
+                "status": "Active" if rng.random() < 0.8 else "Inactive",
+                "created_at": now - timedelta(days=rng.randint(0, days)),
+            }
+
+    await _insert_batched(main.members_collection, member_docs())
+    async for doc in main.members_collection.find({}, {"_id": 1}):
+        member_ids.append(str(doc["_id"]))
+
+    def payment_docs():
+        for mid in member_ids:
+            for fee_type, amount in (("registration", main.REGISTRATION_FEE), ("monthly", main.MONTHLY_FEE_REGULAR)):
+                status = rng.choice(["Paid", "Paid", "Due", "Overdue"])
+                created = now - timedelta(days=rng.randint(0, days))
+                yield {
+                    "member_id": mid, "member_name": "Bench", "amount": amount, "fee_type": fee_type,
+                    "period": created.strftime("%Y-%m") if fee_type == "monthly" else None,
+                    "status": status, "due_date": created, "paid_at": created if status == "Paid" else None,
+                    "created_at": created,
+                }
+
+    await _insert_batched(main.payments_collection, payment_docs())
+
+    def attendance_docs():
+        for mid in member_ids:
+            for day in rng.sample(range(days), min(days, attendance_per_member)):
+                check_in = (now - timedelta(days=day)).astimezone(main.IST)
+                yield {
+                    "member_id": mid, "member_name": "Bench", "member_phone": None,
+                    "check_in_at_utc": check_in.astimezone(timezone.utc),
+                    "date_ist": check_in.strftime("%Y-%m-%d"), "batch": main.batch_from_ist(check_in),
+                }
+
+    await _insert_batched(main.attendance_collection, attendance_docs())
+    await rebuild_daily_stats(main.attendance_collection, main.daily_stats_collection)
+    return member_ids
+
+
+async def _legacy_dashboard(main, date_from: str, date_to: str) -> dict:
+    """analytics_dashboard before the $facet rewrite: ten sequential round-trips."""
+    m, a, p = main.members_collection, main.attendance_collection, main.payments_collection
+    out = {
+        "active": await m.count_documents({"status": "Active"}),
+        "inactive": await m.count_documents({"status": "Inactive"}),
+        "regular": await m.count_documents({"membership_type": "Regular"}),
+        "pt": await m.count_documents({"membership_type": "PT"}),
+    }
+    async for row in p.aggregate([{"$match": {"status": {"$in": ["Due", "Overdue"]}}}, {"$group": {"_id": None, "total": {"$sum": "$amount"}}}]):
+        out["pending"] = row["total"]
+    async for row in p.aggregate([{"$match": {"status": "Paid"}}, {"$group": {"_id": None, "total": {"$sum": "$amount"}}}]):
+        out["paid"] = row["total"]
+    today = main.today_ist().strftime("%Y-%m-%d")
+    out["today"] = await a.count_documents({"date_ist": today})
+    out["today_out"] = await a.count_documents({"date_ist": today, "check_out_at_utc": {"$ne": None}})
+    start = datetime.strptime(date_from, "%Y-%m-%d").replace(tzinfo=main.IST).astimezone(timezone.utc)
+    end = (datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)).replace(tzinfo=main.IST).astimezone(timezone.utc)
+    out["range"] = await a.count_documents({"check_in_at_utc": {"$gte": start, "$lte": end}})
+    async for row in p.aggregate([{"$match": {"status": "Paid", "paid_at": {"$gte": start, "$lte": end}}}, {"$group": {"_id": None, "total": {"$sum": "$amount"}}}]):
+        out["paid_range"] = row["total"]
+    return out
+
+
+async def bench_dashboard(args) -> None:
+    main = _main()
+    print(f"Seeding {args.members} members ...")
+    await seed(main, args.members)
+    today = main.today_ist()
+    date_from = (today - timedelta(days=30)).strftime("%Y-%m-%d")
+    date_to = today.strftime("%Y-%m-%d")
+
+    async def cold():
+        main.dashboard_cache.clear()
+        await main.analytics_dashboard(date_from, date_to)
+
+    async def warm():
+        await main.analytics_dashboard(date_from, date_to)
+
+    report("before: sequential queries", await timed(lambda: _legacy_dashboard(main, date_from, date_to), args.runs))
+    report("after: $facet + gather (cold)", await timed(cold, args.runs))
+    report("after: cached", await timed(warm, args.runs))
+
+
+async def _legacy_fee_reminders(main) -> int:
+    """run_fee_reminders before batching: group pending fees in Python, then one find_one per member."""
+    from bson import ObjectId
+    member_pending = {}
+    async for doc in main.payments_collection.find({"status": {"$in": ["Due", "Overdue"]}}):
+        member_pending[doc["member_id"]] = member_pending.get(doc["member_id"], 0) + doc["amount"]
+    found = 0
+    for mid, _ in member_pending.items():
+        if await main.members_collection.find_one({"_id": ObjectId(mid)}, main.member_projection("run_fee_reminders")):
+            found += 1
+    return found
+
+
+async def bench_reminders(args) -> None:
+    """Fee reminders with every member overdue (up to queuing in the notification outbox; nothing is sent)."""
+    main = _main()
+    print(f"Seeding {args.members} members ...")
+    await seed(main, args.members, attendance_per_member=0)
+    await main.payments_collection.update_many({"fee_type": "monthly"}, {"$set": {"status": "Overdue", "paid_at": None}})
+    runs = max(1, min(args.runs, 5))  # the legacy path is one round-trip per member
+
+    async def batched():
+        job = main.background_jobs.start("fee_reminders", main._send_fee_reminders)
+        job = await main.background_jobs.wait(job["id"])
+        assert job["status"] == "done", job["error"]
+        await main.notifier.outbox.delete_many({})
+
+    report("before: find_one per member", await timed(lambda: _legacy_fee_reminders(main), runs))
+    samples = await timed(batched, runs)
+    report("after: $group + $in batches", samples)
+    print(f"{'':<32} throughput={args.members / (statistics.median(samples) / 1000):,.0f} members/s")
+
+
+def _rss_mb() -> float:
+    """Resident set size of this process in MB (Linux /proc; falls back to peak RSS elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _sample_rss(fn) -> tuple[float, float, float]:
+    """Run fn() while sampling RSS every 50 ms. Returns (seconds, rss_before_mb, peak_rss_mb)."""
+    before = peak = _rss_mb()
+    done = asyncio.Event()
+
+    async def sampler():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, _rss_mb())
+            await asyncio.sleep(0.05)
+
+    task = asyncio.create_task(sampler())
+    t0 = time.perf_counter()
+    await fn()
+    elapsed = time.perf_counter() - t0
+    done.set()
+    await task
+    return elapsed, before, max(peak, _rss_mb())
+
+
+async def _legacy_export_payments(main) -> int:
+    """export_payments_excel before streaming: list of dicts -> pandas DataFrame -> BytesIO."""
+    from io import BytesIO
+    import pandas as pd
+    rows = []
+    async for doc in main.payments_collection.find().sort("created_at", -1):
+        rows.append({
+            "id": str(doc["_id"]), "member_id": doc.get("member_id", ""), "member_name": doc.get("member_name", ""),
+            "amount": doc.get("amount", 0), "fee_type": doc.get("fee_type", ""), "period": doc.get("period", ""),
+            "status": doc.get("status", ""), "due_date": str(main._to_date(doc.get("due_date")) or ""),
+            "paid_at": str(doc.get("paid_at")) if doc.get("paid_at") else "",
+        })
+    buf = BytesIO()
+    pd.DataFrame(rows).to_excel(buf, index=False, engine="openpyxl")
+    return buf.tell()
+
+
+async def bench_export(args) -> None:
+    """Peak RSS of the payments export at --rows payment rows: streamed xlsx and csv vs the pandas path."""
+    main = _main()
+    from indexes import ensure_indexes
+    print(f"Seeding {args.rows} payments ...")
+    await main.client.drop_database(main.DATABASE_NAME)
+    await ensure_indexes(main.db)
+    now = datetime.now(timezone.utc)
+    await _insert_batched(main.payments_collection, (
+        {
+            "member_id": f"{i % 50000:024x}", "member_name": f"Bench Member {i % 50000}", "amount": 500,
+            "fee_type": "monthly", "period": now.strftime("%Y-%m"), "status": "Paid" if i % 3 else "Due",
+            "due_date": now, "paid_at": now if i % 3 else None, "created_at": now - timedelta(minutes=i),
+        }
+        for i in range(args.rows)
+    ))
+
+    for fmt in ("csv", "xlsx"):
+        async def streamed(fmt=fmt):
+            response = await main.export_payments_excel(format=fmt)
+            size = 0
+            async for chunk in response.body_iterator:
+                size += len(chunk)
+            print(f"{'':<32} {size / 2**20:,.1f} MB written")
+
+        elapsed, before, peak = await _sample_rss(streamed)
+        print(f"{'after: streamed ' + fmt:<32} {elapsed:8.1f} s  rss {before:,.0f} -> peak {peak:,.0f} MB (+{peak - before:,.0f})")
+    try:
+        import pandas  # noqa: F401
+    except ImportError:
+        print("before: pandas is not installed; skipping the DataFrame export")
+        return
+    elapsed, before, peak = await _sample_rss(lambda: _legacy_export_payments(main))
+    print(f"{'before: pandas DataFrame xlsx':<32} {elapsed:8.1f} s  rss {before:,.0f} -> peak {peak:,.0f} MB (+{peak - before:,.0f})")
+
+
+async def bench_checkin(args) -> None:
+    """Opening-hour burst: --members concurrent check-ins (each tapped twice) at a batch with room for a tenth of them."""
+    from fastapi import HTTPException
+    main = _main()
+    print(f"Seeding {args.members} members ...")
+    member_ids = await seed(main, args.members, attendance_per_member=0)
+    await main.attendance_collection.delete_many({})
+    await main.daily_stats_collection.delete_many({})
+    batch = main.batch_from_ist(main.now_ist())
+    capacity = max(1, args.members // 10)
+    main.BATCH_CAPACITY = {batch: capacity}
+
+    samples, outcomes = [], {"ok": 0, "full": 0, "duplicate": 0}
+
+    async def tap(mid):
+        t0 = time.perf_counter()
+        try:
+            await main.check_in(mid)
+            outcomes["ok"] += 1
+        except HTTPException as e:
+            outcomes["full" if e.detail.startswith("Batch full") else "duplicate"] += 1
+        samples.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(tap(mid) for mid in member_ids + member_ids))
+    elapsed = time.perf_counter() - t0
+    report(f"check-in ({2 * len(member_ids)} concurrent)", samples)
+    stored = await main.attendance_collection.count_documents({})
+    print(f"{'':<32} {2 * len(member_ids) / elapsed:,.0f} taps/s  {outcomes}  capacity={capacity} stored={stored}")
+    assert outcomes["ok"] == stored == capacity, "capacity was not enforced exactly"
+
+
+async def bench_search(args) -> None:
+    """Front-desk typeahead: name prefixes as typed (1-4 letters, then "first l") and phone suffixes."""
+    from bson.regex import Regex
+    from search import SEARCH_LIMIT, search_members
+    main = _main()
+    print(f"Seeding {args.members} members ...")
+    await seed(main, args.members, attendance_per_member=0)
+    rng = random.Random(7)
+    projection = main.member_projection("search_members")
+
+    def queries():
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        return [first[:n] for n in range(1, 5)] + [f"{first} {last[0]}", f"{rng.randrange(args.members):04d}"[-4:]]
+
+    samples = [q for _ in range(args.runs) for q in queries()]
+
+    async def legacy(q):
+        # A server-side search without tokens: unanchored case-insensitive regex, scans every member
+        return await main.members_collection.find({"name": Regex(q, "i")}, projection).limit(SEARCH_LIMIT).to_list(None)
+
+    async def tokens(q):
+        return await search_members(main.members_collection, q, SEARCH_LIMIT, projection)
+
+    for label, fn in (("before: regex on name", legacy), ("after: search_tokens", tokens)):
+        per_query = []
+        for q in samples:
+            t0 = time.perf_counter()
+            await fn(q)
+            per_query.append((time.perf_counter() - t0) * 1000)
+        report(f"{label} ({len(samples)} queries)", per_query)
+
+
+async def _legacy_attendance_range(main, date_from: str, date_to: str) -> int:
+    """attendance_by_date_range before native timestamps: fromisoformat per row, AttendanceRecord, pydantic JSON."""
+    from pydantic import TypeAdapter
+    from pagination import paginate
+    adapter = TypeAdapter(list[main.AttendanceRecord])
+    q = {"date_ist": {"$gte": date_from, "$lte": date_to}}
+    rows, cursor = 0, None
+    while True:
+        docs, cursor = await paginate(main.attendance_collection, q, [("date_ist", 1), ("batch", 1), ("check_in_at_utc", 1)], main.MAX_PAGE_SIZE, cursor)
+        records = []
+        for doc in docs:
+            try:
+                check_in = datetime.fromisoformat(doc["check_in_at_ist"])
+            except (KeyError, ValueError):
+                check_in = doc["check_in_at_utc"].replace(tzinfo=timezone.utc).astimezone(main.IST)
+            check_out = datetime.fromisoformat(doc["check_out_at_ist"]) if doc.get("check_out_at_ist") else None
+            records.append(main.AttendanceRecord(
+                id=str(doc["_id"]), member_id=doc["member_id"], member_name=doc.get("member_name", ""),
+                member_phone=doc.get("member_phone"), check_in_at=check_in, date_ist=doc["date_ist"],
+                batch=doc["batch"], check_out_at=check_out,
+            ))
+        adapter.dump_json(records)
+        rows += len(records)
+        if not cursor:
+            return rows
+
+
+async def _attendance_range(main, date_from: str, date_to: str) -> int:
+    from fastapi import Response
+    rows, cursor = 0, None
+    while True:
+        page = await main.attendance_by_date_range(Response(), date_from, date_to, limit=main.MAX_PAGE_SIZE, cursor=cursor)
+        rows += page.body.count(b'{"id":')  # one object per row
+        cursor = page.headers.get(main.NEXT_CURSOR_HEADER)
+        if not cursor:
+            return rows
+
+
+async def bench_attendance(args) -> None:
+    """by-date-range over --rows attendance rows: legacy IST strings parsed per row vs UTC dates formatted by $dateToString."""
+    main = _main()
+    members = max(1, args.rows // 100)
+    print(f"Seeding {members} members x 100 check-ins ...")
+    await seed(main, members, attendance_per_member=100)
+    # Legacy shape: IST strings next to the UTC datetime, as check-in used to write them
+    await main.attendance_collection.update_many({}, [{"$set": {"check_in_at_ist": {
+        "$dateToString": {"date": "$check_in_at_utc", "format": "%Y-%m-%dT%H:%M:%S.%L+05:30", "timezone": "Asia/Kolkata"},
+    }}}])
+    date_from = (main.today_ist() - timedelta(days=365)).isoformat()
+    date_to = main.today_ist().isoformat()
+
+    t0 = time.perf_counter()
+    rows = await _legacy_attendance_range(main, date_from, date_to)
+    before = time.perf_counter() - t0
+    print(f"{'before: fromisoformat + pydantic':<32} {rows:,} rows in {before:6.2f} s  {rows / before:10,.0f} rows/s")
+
+    t0 = time.perf_counter()
+    migrated = await main._migrate_attendance_times({})
+    print(f"{'migrate legacy strings':<32} {migrated['migrated']:,} rows in {time.perf_counter() - t0:6.2f} s")
+
+    t0 = time.perf_counter()
+    rows = await _attendance_range(main, date_from, date_to)
+    after = time.perf_counter() - t0
+    print(f"{'after: $dateToString rows':<32} {rows:,} rows in {after:6.2f} s  {rows / after:10,.0f} rows/s")
+
+
+async def bench_lists(args) -> None:
+    """Serializing one full page of members / payments / invoices: response models + FastAPI vs fastjson rows."""
+    from fastapi.responses import JSONResponse
+    from pydantic import TypeAdapter
+    from fastjson import FastJSONResponse
+    main = _main()
+    print(f"Seeding {args.members} members ...")
+    await seed(main, args.members, attendance_per_member=1)
+    await main.invoices_collection.insert_many([
+        {"member_id": str(doc["_id"]), "member_name": doc["name"], "items": [{"description": "Monthly Fee", "amount": 500}],
+         "total": 500, "status": "Unpaid", "issued_at": doc["created_at"]}
+        async for doc in main.members_collection.find({}, {"name": 1, "created_at": 1}).limit(main.MAX_PAGE_SIZE)
+    ])
+    pages = [
+        ("members", main.MemberResponse, main._member_row, main._doc_to_member_response,
+         await main.members_collection.find({}, main.member_projection("list_members")).limit(500).to_list(None)),
+        ("payments", main.PaymentResponse, main._payment_row, lambda d: main.PaymentResponse(**main._payment_row(d)),
+         await main.payments_collection.find({}).limit(main.MAX_PAGE_SIZE).to_list(None)),
+        ("invoices", main.InvoiceResponse, main._invoice_row, lambda d: main.InvoiceResponse(**main._invoice_row(d)),
+         await main.invoices_collection.find({}).limit(main.MAX_PAGE_SIZE).to_list(None)),
+    ]
+    for name, model, row, to_model, docs in pages:
+        adapter = TypeAdapter(list[model])
+
+        async def before():
+            # handler builds models; FastAPI validates them against response_model, dumps, json.dumps
+            models = adapter.validate_python([to_model(d) for d in docs])
+            return JSONResponse(adapter.dump_python(models, mode="json")).body
+
+        async def after():
+            return FastJSONResponse([row(d) for d in docs]).body
+
+        assert await before() == await after()
+        report(f"before: {name} x{len(docs)} pydantic", await timed(before, args.runs))
+        report(f"after:  {name} x{len(docs)} fastjson", await timed(after, args.runs))
+
+
+async def bench_stream(args) -> None:
+    """by-date-range over a week / quarter / year of --rows check-ins: whole list of models vs ?stream=ndjson (first byte, peak RSS)."""
+    main = _main()
+    members = max(1, args.rows // 100)
+    print(f"Seeding {members} members x 100 check-ins ...")
+    await seed(main, members, attendance_per_member=100)
+    date_to = main.today_ist()
+    for days in (7, 90, 365):
+        date_from = (date_to - timedelta(days=days)).isoformat()
+
+        async def buffered():
+            # before pagination: every row read into a list and validated as a model before the first byte
+            docs = [doc async for doc in main.scan(main.attendance_collection, {"date_ist": {"$gte": date_from, "$lte": date_to.isoformat()}},
+                                                   [("date_ist", 1), ("batch", 1), ("check_in_at_utc", 1)], stages=main.ATTENDANCE_RECORD_STAGES)]
+            models = [main.AttendanceRecord(**main._attendance_row(doc)) for doc in docs]
+            first_byte[0] = time.perf_counter() - t0[0]
+            rows[0] = len(models)
+
+        async def streamed():
+            response = await main.attendance_by_date_range(None, date_from, date_to.isoformat(), stream="ndjson")
+            n = 0
+            async for chunk in response.body_iterator:
+                if not n:
+                    first_byte[0] = time.perf_counter() - t0[0]
+                n += chunk.count(b"\n")
+            rows[0] = n
+
+        for label, fn in (("before: list of models", buffered), ("after:  stream=ndjson", streamed)):
+            first_byte, rows, t0 = [0.0], [0], [time.perf_counter()]
+            elapsed, before, peak = await _sample_rss(fn)
+            print(f"{label + f' {days:>3}d':<32} {rows[0]:>9,} rows  first byte {first_byte[0] * 1000:8.1f} ms  "
+                  f"total {elapsed:6.2f} s  rss {before:,.0f} -> peak {peak:,.0f} MB (+{peak - before:,.0f})")
+
+
+async def _legacy_month_rollover(main, period: str) -> int:
+    """Monthly dues before the generator: one find_one + insert_one per Active member."""
+    from dues import period_due_date
+    due_dt = period_due_date(period)
+    created = 0
+    async for m in main.members_collection.find({"status": "Active"}, {"name": 1, "membership_type": 1}):
+        mid = str(m["_id"])
+        if await main.payments_collection.find_one({"member_id": mid, "fee_type": "monthly", "period": period}, {"_id": 1}):
+            continue
+        await main.payments_collection.insert_one({
+            "member_id": mid, "member_name": m.get("name", ""), "amount": main.monthly_fee(m.get("membership_type")),
+            "fee_type": "monthly", "period": period, "status": "Due", "due_date": due_dt, "paid_at": None,
+            "created_at": datetime.now(timezone.utc),
+        })
+        created += 1
+    return created
+
+
+async def bench_dues(args) -> None:
+    """Monthly dues for --members (80% Active): insert per member vs the bulk upsert generator, then an idempotent rerun."""
+    from dues import generate_monthly_dues
+    main = _main()
+    print(f"Seeding {args.members} members ...")
+    await seed(main, args.members, attendance_per_member=0)
+    legacy_period, period = "2099-01", "2099-02"
+
+    t0 = time.perf_counter()
+    created = await _legacy_month_rollover(main, legacy_period)
+    elapsed = time.perf_counter() - t0
+    print(f"{'before: insert_one per member':<32} {created:>9,} dues  {elapsed:7.2f} s  {created / elapsed:10,.0f} dues/s  {args.members * 0.8 / elapsed:10,.0f} members/s")
+    for label in ("after:  bulk upserts", "after:  rerun (nothing to do)"):
+        result = await generate_monthly_dues(main.members_collection, main.payments_collection, main.dues_runs_collection, main.ledger,
+                                             period, main.MONTHLY_FEE_PLANS)
+        print(f"{label:<32} {result['created_count']:>9,} dues  {result['duration_ms'] / 1000:7.2f} s  "
+              f"{result['dues_per_sec'] or 0:10,.0f} dues/s  {result['members_per_sec'] or 0:10,.0f} members/s")
+
+
+async def bench_series(args) -> None:
+    """A month of check-ins for a chart: download every by-date-range page (bytes) vs /analytics/attendance-series."""
+    main = _main()
+    members = max(1, args.rows // 100)
+    print(f"Seeding {members} members x 100 check-ins ...")
+    await seed(main, members, attendance_per_member=100)
+    await main.series_collection.delete_many({})
+    today = main.today_ist()
+    date_to = (today.replace(day=1) - timedelta(days=1)).isoformat()  # last day of the previous (closed) month
+    date_from = date_to[:8] + "01"
+
+    async def pages() -> int:
+        from fastapi import Response
+        size, cursor = 0, None
+        while True:
+            page = await main.attendance_by_date_range(Response(), date_from, date_to, limit=main.MAX_PAGE_SIZE, cursor=cursor)
+            size += len(page.body)
+            cursor = page.headers.get(main.NEXT_CURSOR_HEADER)
+            if not cursor:
+                return size
+
+    async def series() -> int:
+        from fastjson import dumps
+        return len(dumps(await main.attendance_series("day", date_from, date_to)))
+
+    size = await pages()
+    report(f"before: by-date-range ({size / 1e6:,.1f} MB)", await timed(pages, max(1, min(args.runs, 5))))
+    t0 = time.perf_counter()
+    size = await series()
+    print(f"{'after:  first series call':<32} {(time.perf_counter() - t0) * 1000:8.2f} ms (computes and stores the closed buckets)")
+    report(f"after:  series ({size:,} bytes)", await timed(series, args.runs))
+
+
+BENCHMARKS = {
+    "dashboard": bench_dashboard,
+    "reminders": bench_reminders,
+    "export": bench_export,
+    "checkin": bench_checkin,
+    "search": bench_search,
+    "attendance": bench_attendance,
+    "lists": bench_lists,
+    "stream": bench_stream,
+    "dues": bench_dues,
+    "series": bench_series,
+}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Jupiter Arena backend benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="payment rows (export) or attendance rows (attendance, stream, series)")
+    args = parser.parse_args()
+    asyncio.run(BENCHMARKS[args.benchmark](args))
+
+
+if __name__ == "__main__":
+    main_cli()
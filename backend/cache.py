@@ -0,0 +1,77 @@
+"""
+In-process caches for Jupiter Arena (cache).
+
+The API runs as a single worker, so a small in-memory cache in front of expensive reads
+(analytics dashboard) is enough. Entries expire after ttl seconds; when full, the least
+recently used entry is evicted. Writers call clear() / invalidate() so readers never see
+data older than the last write made through this process.
+
+Usage: from cache import TTLCache
+  dashboard_cache = TTLCache(ttl=30, maxsize=64)
+  hit = dashboard_cache.get(key)
+  dashboard_cache.set(key, value)
+"""
+
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU cache with per-entry time-to-live. Not thread-safe; use from the event loop only."""
+
+    def __init__(self, ttl: float, maxsize: int = 128):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # dropped to stay under maxsize (expired entries are not counted)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key) -> None:
+        self._data.pop(key, None)
+
+    def pop(self, key, default=None):
+        """Remove and return a value (even if expired) without counting a hit or miss."""
+        entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+        }
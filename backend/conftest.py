@@ -1,8 +1,15 @@
 """
 Pytest configuration for backend E2E tests.
 Set DATABASE_NAME before main is imported so tests use a separate DB (default: gym_db_test).
+Member media goes to a temporary local directory instead of GridFS, and the background
+scheduler is off (tests run its jobs directly). Notifications go to the in-memory FakeProvider.
 """
 import os
+import tempfile
 
 # Use test DB so we don't touch production. Override with env DATABASE_NAME if needed.
 os.environ.setdefault("DATABASE_NAME", "gym_db_test")
+os.environ.setdefault("MEDIA_BACKEND", "local")
+os.environ.setdefault("MEDIA_ROOT", tempfile.mkdtemp(prefix="gym_media_"))
+os.environ.setdefault("SCHEDULER_ENABLED", "0")
+os.environ.setdefault("NOTIFICATION_PROVIDER", "fake")
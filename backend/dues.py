@@ -0,0 +1,112 @@
+"""
+Monthly dues generator for Jupiter Arena (dues).
+
+Creates the monthly fee (Due on the 1st) of a YYYY-MM period for every Active member, at the
+amount of the member's plan (MONTHLY_FEE_PLANS in main.py: membership type -> monthly fee).
+Active members are read in _id order, DUES_BATCH_SIZE at a time. Per batch, one indexed read
+drops the members that already have the period's fee (registration month, logged by hand, an
+earlier run), and the rest go to the ledger as one bulk_write of upserts keyed on
+(member_id, fee_type, period), so their balances move with the new fees (ledger.py) and two runs
+racing each other still create each fee once.
+
+Idempotent and resumable: after every batch the run's checkpoint (last member _id written) is
+saved in dues_runs under the period. A run that stopped midway (crash, deploy) resumes after its
+checkpoint; once a run has finished, the next one rescans every member, which writes nothing
+except fees for members activated since.
+
+Usage: from dues import generate_monthly_dues
+  result = await generate_monthly_dues(members_collection, payments_collection, dues_runs_collection, ledger, "2025-03", MONTHLY_FEE_PLANS)
+  result  # {"period": "2025-03", "created_count": 41870, "existing_count": 130, "dues_per_sec": 52000.0, ...}
+"""
+
+import re
+import time
+from datetime import datetime, timezone
+
+DUES_BATCH_SIZE = 1000
+PERIOD_RE = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+
+def period_due_date(period: str) -> datetime:
+    """Monthly fees fall due on the 1st of their period (midnight UTC, like every fee's due_date)."""
+    year, month = (int(part) for part in period.split("-"))
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+async def generate_monthly_dues(
+    members_collection,
+    payments_collection,
+    runs_collection,
+    ledger,
+    period: str,
+    plans: dict[str, int],
+    progress: dict | None = None,
+    default_plan: str = "Regular",
+    batch_size: int = DUES_BATCH_SIZE,
+) -> dict:
+    """
+    Create period's monthly fee for every Active member who has none, at plans[membership_type]
+    (plans[default_plan] for a type without a plan; members with neither are skipped and counted).
+    Returns counts for this run, its duration and throughput.
+    """
+    if not PERIOD_RE.match(period):
+        raise ValueError(f"period must be YYYY-MM, got {period!r}")
+    progress = progress if progress is not None else {}
+    started = time.perf_counter()
+    due_date = period_due_date(period)
+    checkpoint = await runs_collection.find_one({"_id": period})
+    resume_after = checkpoint.get("last_member_id") if checkpoint and checkpoint.get("status") == "running" else None
+    await runs_collection.update_one(
+        {"_id": period},
+        {"$set": {"status": "running", "last_member_id": resume_after, "started_at": datetime.now(timezone.utc), "finished_at": None}},
+        upsert=True,
+    )
+    progress.update({
+        "period": period, "resumed_after": str(resume_after) if resume_after else None,
+        "members_scanned": 0, "created_count": 0, "existing_count": 0, "skipped_count": 0,
+    })
+
+    async def write(batch: list[dict]) -> None:
+        ids = [str(m["_id"]) for m in batch]
+        billed = set(await payments_collection.distinct("member_id", {"member_id": {"$in": ids}, "fee_type": "monthly", "period": period}))
+        now = datetime.now(timezone.utc)
+        lines = []
+        for member in batch:
+            mid = str(member["_id"])
+            amount = plans.get(member.get("membership_type"), plans.get(default_plan))
+            if mid in billed:
+                progress["existing_count"] += 1
+            elif amount is None:
+                progress["skipped_count"] += 1
+            else:
+                lines.append({
+                    "member_id": mid, "member_name": member.get("name", ""), "amount": amount, "fee_type": "monthly",
+                    "period": period, "status": "Due", "due_date": due_date, "paid_at": None, "created_at": now,
+                })
+        created = await ledger.upsert_lines(lines)
+        progress["created_count"] += created
+        progress["existing_count"] += len(lines) - created  # written by someone else since the read above
+        progress["members_scanned"] += len(batch)
+        await runs_collection.update_one({"_id": period}, {"$set": {"last_member_id": batch[-1]["_id"], "updated_at": now}})
+
+    query = {"status": "Active"}
+    if resume_after is not None:
+        query["_id"] = {"$gt": resume_after}
+    batch = []
+    async for member in members_collection.find(query, {"name": 1, "membership_type": 1}).sort("_id", 1).batch_size(batch_size):
+        batch.append(member)
+        if len(batch) >= batch_size:
+            await write(batch)
+            batch = []
+    if batch:
+        await write(batch)
+
+    elapsed = time.perf_counter() - started
+    result = {
+        **progress,
+        "duration_ms": round(elapsed * 1000, 1),
+        "dues_per_sec": round(progress["created_count"] / elapsed, 1) if elapsed > 0 else None,
+        "members_per_sec": round(progress["members_scanned"] / elapsed, 1) if elapsed > 0 else None,
+    }
+    await runs_collection.update_one({"_id": period}, {"$set": {"status": "done", "finished_at": datetime.now(timezone.utc), "result": result}})
+    return result
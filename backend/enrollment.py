@@ -0,0 +1,130 @@
+"""
+Member enrollment for Jupiter Arena (enrollment).
+
+Registering a member (POST /members) and the walk-in desk (POST /billing/issue) both create the
+member, its registration fee and first monthly fee (Due, due today) and the registration
+message; the walk-in also issues the first invoice. enroll() writes all of it as one unit, so a
+crash or error midway never leaves a member without fees, or fees without a member:
+  replica set / mongos: one multi-document transaction (retried on transient errors)
+  standalone server:    ordered writes (member, invoice, payments, balance, message); if a write
+                        fails, the documents already written are deleted again and the error is
+                        re-raised (a process killed between the two can still leave a partial set)
+The member is written first, so a duplicate phone (DuplicateKeyError) fails before anything else.
+The walk-in invoice bills the two fees by payment_id and the member starts with its
+member_balances document (see ledger.py).
+
+The registration message goes to the notification outbox inside the same unit and is handed to
+the dispatcher's workers only after it commits (NotificationDispatcher.offer): the request never
+waits on the provider, and every enrolled member gets the message even if the process restarts.
+
+Usage: from enrollment import EnrollmentService
+  enrollment = EnrollmentService(transactions, members_collection, invoices_collection, payments_collection, balances_collection, notifier)
+  result = await enrollment.enroll(member_doc, REGISTRATION_FEE, MONTHLY_FEE_REGULAR, today_ist(), issue_invoice=True)
+  result["member"], result["invoice"], result["payments"]  # documents as written
+"""
+
+import logging
+from datetime import date, datetime, timezone
+
+from bson import ObjectId
+
+from ledger import opening_balance
+from search import invoice_search_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class EnrollmentService:
+    def __init__(self, transactions, members_collection, invoices_collection, payments_collection, balances_collection, notifier):
+        self.transactions = transactions
+        self.members = members_collection
+        self.invoices = invoices_collection
+        self.payments = payments_collection
+        self.balances = balances_collection
+        self.notifier = notifier
+
+    def _documents(self, member: dict, registration_fee: int, monthly_fee: int, today: date, issue_invoice: bool) -> dict:
+        now = datetime.now(timezone.utc)
+        member = {"_id": ObjectId(), **member}
+        member.setdefault("created_at", now)
+        mid, name = str(member["_id"]), member["name"]
+        due = datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
+        fee = {"member_id": mid, "member_name": name, "status": "Due", "due_date": due, "paid_at": None, "created_at": now}
+        payments = [
+            {"_id": ObjectId(), **fee, "amount": registration_fee, "fee_type": "registration", "period": None},
+            {"_id": ObjectId(), **fee, "amount": monthly_fee, "fee_type": "monthly", "period": today.strftime("%Y-%m")},
+        ]
+        invoice = None
+        if issue_invoice:
+            inv_id = ObjectId()
+            for payment in payments:
+                payment["invoice_id"] = str(inv_id)
+            invoice = {
+                "_id": inv_id,
+                "member_id": mid,
+                "member_name": name,
+                "search_tokens": invoice_search_tokens(inv_id, name),
+                "items": [
+                    {"description": "Registration", "amount": registration_fee, "payment_id": str(payments[0]["_id"])},
+                    {"description": "First Month", "amount": monthly_fee, "payment_id": str(payments[1]["_id"])},
+                ],
+                "total": registration_fee + monthly_fee,
+                "status": "Unpaid",
+                "issued_at": now,
+                "paid_at": None,
+            }
+        user = {"name": name, "phone": member.get("phone", ""), "email": member.get("email", "")}
+        message = self.notifier.message("registration", user)
+        return {"member": member, "invoice": invoice, "payments": payments, "balance": opening_balance(mid, payments), "message": message}
+
+    def _steps(self, docs: dict) -> list[tuple]:
+        """(collection, documents) in write order."""
+        steps = [(self.members, [docs["member"]])]
+        if docs["invoice"] is not None:
+            steps.append((self.invoices, [docs["invoice"]]))
+        steps.append((self.payments, docs["payments"]))
+        steps.append((self.balances, [docs["balance"]]))
+        steps.append((self.notifier.outbox, [docs["message"]]))
+        return steps
+
+    @staticmethod
+    async def _insert(collection, batch: list[dict], session=None) -> None:
+        # insert_one for single documents so a duplicate phone surfaces as DuplicateKeyError
+        if len(batch) == 1:
+            await collection.insert_one(batch[0], session=session)
+        else:
+            await collection.insert_many(batch, ordered=True, session=session)
+
+    async def _write_compensated(self, steps: list[tuple]) -> None:
+        written = []
+        try:
+            for collection, batch in steps:
+                written.append((collection, [doc["_id"] for doc in batch]))  # before the insert: it may half-succeed
+                await self._insert(collection, batch)
+        except BaseException:
+            for collection, ids in reversed(written):
+                try:
+                    await collection.delete_many({"_id": {"$in": ids}})
+                except Exception:
+                    logger.exception("Enrollment rollback failed on %s for %s", collection.name, ids)
+            raise
+
+    async def enroll(self, member: dict, registration_fee: int, monthly_fee: int, today: date, issue_invoice: bool = False) -> dict:
+        """
+        Write a new member (gym_members document without _id), its registration and first monthly
+        fee, the first invoice if issue_invoice, and the registration message, all or nothing.
+        Returns {"member", "invoice", "payments"} as written (invoice None unless issued).
+        Raises DuplicateKeyError if the phone is already registered.
+        """
+        docs = self._documents(member, registration_fee, monthly_fee, today, issue_invoice)
+        steps = self._steps(docs)
+        if await self.transactions.supported():
+            async def write(session):
+                for collection, batch in steps:
+                    await self._insert(collection, batch, session=session)
+
+            await self.transactions.run(write)
+        else:
+            await self._write_compensated(steps)
+        self.notifier.offer(docs["message"]["_id"])
+        return {"member": docs["member"], "invoice": docs["invoice"], "payments": docs["payments"]}
@@ -0,0 +1,72 @@
+"""
+Fast JSON list responses for Jupiter Arena (fastjson).
+
+FastAPI serializes a response_model endpoint in three passes: the handler builds Pydantic
+models, FastAPI validates them again against response_model, dumps them to Python objects and
+only then json.dumps() them. For the big list endpoints (members, payments, invoices,
+attendance ranges; up to 1000 rows per page) that costs more than the MongoDB query.
+
+The fast path skips all of it: handlers build plain dicts straight from the BSON documents,
+with the response model's fields in the response model's order, and FastJSONResponse writes
+them with orjson. orjson formats datetimes and dates exactly like Pydantic's JSON mode (naive
+datetimes without an offset, UTC as "Z"), so the bytes are the same as before; see
+tests/test_fastjson.py. Without orjson installed the stdlib json module writes identical
+bytes, only slower.
+
+ndjson_chunks() writes the same rows as newline-delimited JSON (one object per line) for
+endpoints that stream their result instead of returning one list.
+
+Usage: from fastjson import NDJSON_MEDIA_TYPE, FastJSONResponse, ndjson_chunks
+  return FastJSONResponse([{"id": str(doc["_id"]), "created_at": doc["created_at"]} for doc in docs])
+  StreamingResponse(ndjson_chunks(row(doc) async for doc in cursor), media_type=NDJSON_MEDIA_TYPE)
+"""
+
+import json
+from datetime import date, datetime, timedelta
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional; requirements.txt installs it
+    orjson = None
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NDJSON_CHUNK_ROWS = 500
+
+
+def _default(value):
+    """Pydantic JSON-mode text for the non-JSON values a row may hold (stdlib fallback only)."""
+    if isinstance(value, datetime):
+        text = value.isoformat()
+        return text[:-6] + "Z" if value.utcoffset() == timedelta(0) else text
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    """JSON bytes of content, byte-for-byte what FastAPI's JSONResponse writes for the validated models."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """JSON response for content already in response-model shape; nothing is validated again."""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+async def ndjson_chunks(rows, chunk_rows: int = NDJSON_CHUNK_ROWS):
+    """Yield rows (async iterable of dicts) as newline-delimited JSON bytes, chunk_rows lines per chunk."""
+    lines = []
+    async for row in rows:
+        lines.append(dumps(row))
+        if len(lines) >= chunk_rows:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
@@ -0,0 +1,170 @@
+"""
+Member identity cache for Jupiter Arena (identity).
+
+Check-in, check-out, payments, billing and reminders all read the same small member identity
+(name, phone, email, status, membership_type). This cache keeps it in memory, keyed by member
+id, with a second map from canonical phone (phone_e164, see phones.py) to member id for logins:
+  by_id:    TTLCache  "<member_id>"  -> identity dict
+  by_phone: TTLCache  "<phone_e164>" -> "<member_id>"
+
+Coherence: when MongoDB supports change streams (replica set / Atlas), a watcher task drops
+entries for every member that is updated, replaced or deleted, in any worker. Without change
+streams (standalone server) the watcher stops itself and the cache relies on explicit
+invalidate() calls from the endpoints that write members, plus the TTL as a bound for writes
+made by other processes.
+
+Usage: from identity import MemberIdentityCache
+  identity_cache = MemberIdentityCache(members_collection)
+  member = await identity_cache.get(member_id)       # None if no such member; treat as read-only
+  member = await identity_cache.get_by_phone(e164)   # member login (GET /members/by-phone)
+  identity_cache.invalidate(member_id)               # after writing the member
+  identity_cache.invalidate(member_id, phone_e164)   # after creating one: the phone may map to an earlier member
+"""
+
+import asyncio
+import logging
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from cache import TTLCache
+from projections import member_projection
+
+logger = logging.getLogger(__name__)
+
+# Server error codes meaning "change streams are not available here" (standalone, unsupported)
+_NO_CHANGE_STREAMS = {40573, 40324, 115}
+
+
+class MemberIdentityCache:
+    def __init__(self, members_collection, ttl: float = 60, maxsize: int = 10_000):
+        self.members = members_collection
+        self.projection = member_projection("identity")
+        self.by_id = TTLCache(ttl=ttl, maxsize=maxsize)
+        self.by_phone = TTLCache(ttl=ttl, maxsize=maxsize)
+        self.invalidations = 0
+        self.change_stream = "stopped"  # stopped | running | unavailable | reconnecting
+        self._task: asyncio.Task | None = None
+
+    def _put(self, doc: dict, generation: int) -> dict:
+        """Cache a freshly read document unless an invalidation happened while it was being read."""
+        if generation != self.invalidations:
+            return doc
+        mid = str(doc["_id"])
+        self.by_id.set(mid, doc)
+        if doc.get("phone_e164"):
+            self.by_phone.set(doc["phone_e164"], mid)
+        return doc
+
+    async def get(self, member_id) -> dict | None:
+        """Identity of a member by id (str or ObjectId). None for a malformed id or a missing member."""
+        mid = str(member_id)
+        doc = self.by_id.get(mid)
+        if doc is not None:
+            return doc
+        try:
+            oid = member_id if isinstance(member_id, ObjectId) else ObjectId(mid)
+        except Exception:
+            return None
+        generation = self.invalidations
+        doc = await self.members.find_one({"_id": oid}, self.projection)
+        return self._put(doc, generation) if doc else None
+
+    async def get_many(self, member_ids) -> dict[str, dict]:
+        """Identities for many ids: cache hits plus one $in query for the misses. Unknown ids are left out."""
+        out, missing = {}, []
+        for member_id in member_ids:
+            mid = str(member_id)
+            doc = self.by_id.get(mid)
+            if doc is not None:
+                out[mid] = doc
+                continue
+            try:
+                missing.append(ObjectId(mid))
+            except Exception:
+                continue
+        if missing:
+            generation = self.invalidations
+            async for doc in self.members.find({"_id": {"$in": missing}}, self.projection):
+                out[str(doc["_id"])] = self._put(doc, generation)
+        return out
+
+    async def get_by_phone(self, phone_e164: str) -> dict | None:
+        """Identity of the member with this canonical phone (phones.normalize_phone)."""
+        mid = self.by_phone.get(phone_e164)
+        if mid is not None:
+            doc = await self.get(mid)
+            if doc is not None and doc.get("phone_e164") == phone_e164:
+                return doc
+        generation = self.invalidations
+        doc = await self.members.find_one({"phone_e164": phone_e164}, self.projection)
+        return self._put(doc, generation) if doc else None
+
+    def invalidate(self, member_id=None, phone_e164: str | None = None) -> None:
+        """Forget a member (by id and/or canonical phone). Call after any write to gym_members."""
+        self.invalidations += 1
+        if member_id is not None:
+            doc = self.by_id.pop(str(member_id))
+            if doc and doc.get("phone_e164"):
+                self.by_phone.invalidate(doc["phone_e164"])
+        if phone_e164:
+            self.by_phone.invalidate(phone_e164)
+
+    def clear(self) -> None:
+        """Forget everything (after bulk member updates such as the inactive sweep)."""
+        self.invalidations += 1
+        self.by_id.clear()
+        self.by_phone.clear()
+
+    # ----- change stream -----
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch(), name="member-identity-watch")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.change_stream != "unavailable":
+            self.change_stream = "stopped"
+
+    async def _watch(self) -> None:
+        delay = 1.0
+        while True:
+            try:
+                async with self.members.watch(
+                    [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+                ) as stream:
+                    # Events missed while disconnected cannot be replayed: start from a clean cache
+                    self.clear()
+                    self.change_stream = "running"
+                    delay = 1.0
+                    async for change in stream:
+                        self.invalidate(change["documentKey"]["_id"])
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code in _NO_CHANGE_STREAMS:
+                    logger.info("Change streams unavailable (%s); member cache uses explicit invalidation", e)
+                    self.change_stream = "unavailable"
+                    return
+                logger.warning("Member change stream failed: %s", e)
+            except PyMongoError as e:
+                logger.warning("Member change stream disconnected: %s", e)
+            except Exception:
+                logger.exception("Member change stream failed")
+            self.change_stream = "reconnecting"
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+    def stats(self) -> dict:
+        return {
+            "change_stream": self.change_stream,
+            "invalidations": self.invalidations,
+            "by_id": self.by_id.stats(),
+            "by_phone": self.by_phone.stats(),
+        }
@@ -0,0 +1,173 @@
+"""
+MongoDB index registry for Jupiter Arena (indexes).
+
+Every hot query in main.py has a matching index declared here, keyed by collection name
+(the names match main.COLLECTION_*). ensure_indexes() runs from the app lifespan hook:
+it creates declared indexes that are missing, drops the indexes a declared one replaced
+(RETIRED_INDEXES) once the replacement exists, and logs indexes that exist in MongoDB but
+are not declared. Other extra indexes are never dropped automatically; remove them by hand
+once you have confirmed nothing uses them.
+
+Usage: from indexes import ensure_indexes
+  report = await ensure_indexes(db)
+"""
+
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+logger = logging.getLogger(__name__)
+
+INDEXES: dict[str, list[IndexModel]] = {
+    "gym_members": [
+        # Member login (by-phone) and duplicate-registration check on the canonical phone (phones.py).
+        # Partial: members not yet backfilled have no phone_e164. Replaces phone_unique on the raw
+        # phone, which missed "+91 98765 43210" vs "9876543210" (RETIRED_INDEXES).
+        IndexModel(
+            [("phone_e164", ASCENDING)], name="phone_e164_unique", unique=True,
+            partialFilterExpression={"phone_e164": {"$type": "string"}},
+        ),
+        # list_members (keyset: created_at, _id) / export_members sort
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id_desc"),
+        # export_members(status=...) sorted newest first
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)], name="status_created_at"),
+        # Dashboard Active/Inactive and Regular/PT counts
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("membership_type", ASCENDING)], name="membership_type"),
+        # 90-day inactive sweep
+        IndexModel([("last_attendance_date", ASCENDING)], name="last_attendance_date"),
+        # GET /members/search: multikey index over name-prefix / phone-suffix tokens (search.py)
+        IndexModel([("search_tokens", ASCENDING)], name="search_tokens"),
+        # Media blob reference checks before deleting a replaced photo / ID document
+        IndexModel([("photo.sha256", ASCENDING)], name="photo_sha256", sparse=True),
+        IndexModel([("id_document.sha256", ASCENDING)], name="id_document_sha256", sparse=True),
+    ],
+    "attendance_logs": [
+        # One check-in per member per IST day: check_in, check_out, today_status lookups
+        IndexModel([("member_id", ASCENDING), ("date_ist", ASCENDING)], name="member_date_unique", unique=True),
+        # by-date, by-date-range (sorted by batch then time, _id for keyset pages), today/week counts
+        IndexModel(
+            [("date_ist", ASCENDING), ("batch", ASCENDING), ("check_in_at_utc", ASCENDING), ("_id", ASCENDING)],
+            name="date_batch_check_in_id",
+        ),
+        # Dashboard attendance_count_in_range
+        IndexModel([("check_in_at_utc", ASCENDING)], name="check_in_at_utc"),
+    ],
+    "payments": [
+        # list_payments(member_id=...) pages, newest first (keyset: created_at, _id)
+        IndexModel([("member_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="member_created_at_id"),
+        # list_payments(status=...) pages, newest first; fee reminders and pending totals
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="status_created_at_id"),
+        # list_payments() pages / export_payments sort
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id_desc"),
+        # Due -> Overdue transition
+        IndexModel([("status", ASCENDING), ("due_date", ASCENDING)], name="status_due_date"),
+        # Dashboard payments_received_in_range
+        IndexModel([("status", ASCENDING), ("paid_at", ASCENDING)], name="status_paid_at"),
+        # One monthly fee per member and period: the dues generator's upsert key (dues.py), its
+        # "already billed" check and log-monthly. Replaces period_fee_type_member (RETIRED_INDEXES);
+        # duplicates from before it existed are merged at startup (ledger.merge_duplicate_monthly_fees).
+        IndexModel(
+            [("member_id", ASCENDING), ("fee_type", ASCENDING), ("period", ASCENDING)], name="member_monthly_period_unique",
+            unique=True, partialFilterExpression={"fee_type": "monthly"},
+        ),
+    ],
+    "invoices": [
+        # billing_history(member_id=...) pages, newest first (keyset: issued_at, _id)
+        IndexModel([("member_id", ASCENDING), ("issued_at", DESCENDING), ("_id", DESCENDING)], name="member_issued_at_id"),
+        # billing_history() pages / export_billing sort and date filters
+        IndexModel([("issued_at", DESCENDING), ("_id", DESCENDING)], name="issued_at_id_desc"),
+        # export_billing(status=...) sorted newest first
+        IndexModel([("status", ASCENDING), ("issued_at", DESCENDING)], name="status_issued_at"),
+        # billing_history(search=...): member-name prefix / invoice-id suffix tokens (search.py), newest first
+        IndexModel([("search_tokens", ASCENDING), ("issued_at", DESCENDING), ("_id", DESCENDING)], name="search_tokens_issued_at_id"),
+    ],
+    "member_balances": [
+        # Fee reminders: members with unpaid fees (most members owe nothing at any time)
+        IndexModel([("pending_amount", ASCENDING)], name="pending_amount"),
+    ],
+    "attendance_event_keys": [
+        # POST /attendance/bulk idempotency keys (_id) are kept 30 days
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=30 * 24 * 3600),
+    ],
+    "notification_outbox": [
+        # Sweeper: due pending messages, stale "sending" claims
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt_at"),
+        # Worker loads the batch it just claimed
+        IndexModel([("claim", ASCENDING)], name="claim", sparse=True),
+    ],
+}
+
+# Indexes superseded by a declared one, per collection: old name -> name of its replacement.
+# The old index is dropped only once the replacement exists, so a failed build never leaves
+# the queries it served without an index.
+RETIRED_INDEXES: dict[str, dict[str, str]] = {
+    # Keyset pagination: the list indexes gained a trailing _id
+    "gym_members": {"created_at_desc": "created_at_id_desc", "phone_unique": "phone_e164_unique"},
+    "attendance_logs": {"date_batch_check_in": "date_batch_check_in_id"},
+    "payments": {
+        "member_created_at": "member_created_at_id",
+        "status_created_at": "status_created_at_id",
+        "created_at_desc": "created_at_id_desc",
+        "period_fee_type_member": "member_monthly_period_unique",
+    },
+    "invoices": {"member_issued_at": "member_issued_at_id", "issued_at_desc": "issued_at_id_desc"},
+}
+
+
+def _key_list(key) -> list:
+    """Normalize an index key (SON, dict or list of pairs) to a list of (field, direction)."""
+    items = key.items() if hasattr(key, "items") else key
+    return [(field, direction) for field, direction in items]
+
+
+async def ensure_indexes(db, registry: dict[str, list[IndexModel]] | None = None, retired: dict[str, dict[str, str]] | None = None) -> dict:
+    """
+    Reconcile declared indexes with MongoDB. Idempotent: safe to run on every startup.
+    Returns {collection: {"created": [...], "existing": [...], "dropped": [...], "extra": [...], "failed": [...]}}.
+    A failure (e.g. duplicate data blocking a unique index) is logged and does not stop startup;
+    the index it would have replaced is then kept.
+    """
+    registry = INDEXES if registry is None else registry
+    retired = RETIRED_INDEXES if retired is None else retired
+    report = {}
+    for coll_name, models in registry.items():
+        coll = db[coll_name]
+        info = await coll.index_information()
+        existing_keys = {name: _key_list(spec["key"]) for name, spec in info.items()}
+        declared_names = set()
+        created, existing, failed = [], [], []
+        for model in models:
+            spec = model.document
+            name = spec["name"]
+            declared_names.add(name)
+            keys = _key_list(spec["key"])
+            if name in existing_keys:
+                if existing_keys[name] != keys:
+                    logger.warning("Index %s.%s exists with different keys %s (declared %s)", coll_name, name, existing_keys[name], keys)
+                existing.append(name)
+                continue
+            same_keys = [n for n, k in existing_keys.items() if k == keys]
+            if same_keys:
+                logger.warning("Index %s.%s missing, but %s has the same keys; not creating", coll_name, name, same_keys[0])
+                existing.append(name)
+                declared_names.add(same_keys[0])
+                continue
+            logger.info("Creating missing index %s.%s %s", coll_name, name, keys)
+            try:
+                await coll.create_indexes([model])
+                created.append(name)
+            except Exception as e:
+                logger.error("Could not create index %s.%s: %s", coll_name, name, e)
+                failed.append(name)
+        dropped = []
+        for old_name, replacement in retired.get(coll_name, {}).items():
+            if old_name in existing_keys and replacement in existing + created:
+                logger.info("Dropping index %s.%s, replaced by %s", coll_name, old_name, replacement)
+                await coll.drop_index(old_name)
+                dropped.append(old_name)
+        extra = sorted(n for n in existing_keys if n != "_id_" and n not in declared_names and n not in dropped)
+        for name in extra:
+            logger.warning("Extra index %s.%s is not declared in the registry", coll_name, name)
+        report[coll_name] = {"created": created, "existing": existing, "dropped": dropped, "extra": extra, "failed": failed}
+    return report
@@ -0,0 +1,74 @@
+"""
+Background jobs for Jupiter Arena (jobs).
+
+Admin actions that touch many members (e.g. month-end fee reminders) run as asyncio tasks in
+the API process instead of blocking the HTTP request. The endpoint returns a job id at once;
+GET /admin/jobs/{job_id} reports status, live progress counters and the final result.
+Only the most recent jobs are kept (in memory, per worker).
+
+Usage: from jobs import JobRegistry
+  background_jobs = JobRegistry()
+  job = background_jobs.start("fee_reminders", send_reminders)  # send_reminders(progress: dict) -> result
+  background_jobs.get(job["id"])
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class JobRegistry:
+    def __init__(self, maxlen: int = 100):
+        self.maxlen = maxlen
+        self._jobs: OrderedDict[str, dict] = OrderedDict()
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def start(self, kind: str, func) -> dict:
+        """Schedule func(progress) on the running loop. progress is a dict the job updates as it goes."""
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "status": "running",
+            "started_at": datetime.now(timezone.utc),
+            "finished_at": None,
+            "duration_ms": None,
+            "progress": {},
+            "result": None,
+            "error": None,
+        }
+        self._jobs[job_id] = job
+        while len(self._jobs) > self.maxlen:
+            old_id, _ = self._jobs.popitem(last=False)
+            self._tasks.pop(old_id, None)
+        self._tasks[job_id] = asyncio.create_task(self._run(job, func), name=f"job:{kind}:{job_id}")
+        return job
+
+    async def _run(self, job: dict, func) -> None:
+        t0 = time.perf_counter()
+        try:
+            job["result"] = await func(job["progress"])
+            job["status"] = "done"
+        except Exception as e:
+            logger.exception("Background job %s (%s) failed", job["id"], job["kind"])
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = datetime.now(timezone.utc)
+            job["duration_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            self._tasks.pop(job["id"], None)
+
+    def get(self, job_id: str) -> dict | None:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job_id: str) -> dict | None:
+        """Wait for a job to finish (tests, benchmarks). Returns the job."""
+        task = self._tasks.get(job_id)
+        if task is not None:
+            await asyncio.shield(task)
+        return self.get(job_id)
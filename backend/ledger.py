@@ -0,0 +1,522 @@
+"""
+Member fee ledger for Jupiter Arena (ledger).
+
+payments are the ledger lines: one per fee (registration, monthly), status Due | Overdue | Paid.
+invoices bill those lines: every item carries the payment_id of the line it bills, and every
+billed line carries its invoice_id. Status changes flow both ways and are written together
+(one transaction where the server supports it, see transactions.py):
+  paying an invoice pays its unpaid lines;
+  paying a line pays its invoice once every line on it is Paid; setting a line back to Due or
+  Overdue makes its invoice Unpaid again.
+member_balances keeps one document per member with its running totals per status, moved with
+$inc by the same writes, so "what does this member owe" is one _id lookup and the global totals
+(dashboard, fees summary) are a sum over one small document per member:
+  {"_id": "<member_id>", "due_amount": 500, "due_count": 1, "overdue_amount": 2000, "overdue_count": 1,
+   "pending_amount": 2500, "pending_count": 2, "paid_amount": 1000, "paid_count": 1,
+   "oldest_due_date": <utc>, "updated_at": <utc>}
+pending is due + overdue. oldest_due_date is the earliest due_date of an unpaid fee (absent when
+nothing is unpaid); the scheduler's Due -> Overdue sweep goes through mark_overdue() too.
+
+On a standalone server these writes are ordered but not atomic. reconcile() (the nightly
+reconcile_ledger job, POST /admin/reconcile-ledger) repairs what a crash can leave behind: it
+links invoices issued before the ledger to their lines, makes invoice and line status agree
+(a Paid invoice pays its lines; an invoice whose lines are all Paid is Paid) and recomputes
+balances from the lines. It starts with merge_duplicate_monthly_fees(), which also runs at
+startup before member_monthly_period_unique is built: before the dues generator, registration
+created a Due monthly fee and log-monthly inserted a second, Paid one for the same period.
+Both report the IST days ("paid_days") of the Paid lines they changed, for the caller to
+invalidate the stored revenue chart buckets (series.py).
+
+Usage: from ledger import Ledger
+  ledger = Ledger(transactions, payments_collection, invoices_collection, balances_collection)
+  invoice = await ledger.pay_invoice(invoice_oid, paid_at)
+  balance = await ledger.balance(member_id)
+  await ledger.mark_overdue(today_utc)
+"""
+
+import re
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from search import invoice_search_tokens
+from series import ist_day
+
+PENDING = ["Due", "Overdue"]
+# member_balances field prefix per line status
+BUCKETS = {"Due": "due", "Overdue": "overdue", "Paid": "paid"}
+BALANCE_FIELDS = [f"{bucket}_{kind}" for bucket in ("due", "overdue", "pending", "paid") for kind in ("amount", "count")]
+
+_IST = ZoneInfo("Asia/Kolkata")
+_MONTHLY_ITEM = re.compile(r"^Monthly Fee \((\d{4}-\d{2})\)$")
+
+
+def _is_pending(line: dict | None) -> bool:
+    return bool(line) and line.get("status") in PENDING
+
+
+def balance_delta(before: dict | None, after: dict | None) -> dict[str, int]:
+    """$inc for a member's balance when a line goes from before to after (None: absent). Zero fields left out."""
+    inc: dict[str, int] = {}
+    for line, sign in ((before, -1), (after, 1)):
+        if not line or line.get("status") not in BUCKETS:
+            continue
+        buckets = [BUCKETS[line["status"]]] + (["pending"] if _is_pending(line) else [])
+        for bucket in buckets:
+            inc[f"{bucket}_amount"] = inc.get(f"{bucket}_amount", 0) + sign * line.get("amount", 0)
+            inc[f"{bucket}_count"] = inc.get(f"{bucket}_count", 0) + sign
+    return {field: value for field, value in inc.items() if value}
+
+
+def _oldest_due(lines) -> datetime | None:
+    return min((p["due_date"] for p in lines if _is_pending(p) and p.get("due_date")), default=None)
+
+
+def opening_balance(member_id: str, lines: list[dict]) -> dict:
+    """member_balances document for a new member whose only fees are `lines`."""
+    doc = {"_id": member_id, **dict.fromkeys(BALANCE_FIELDS, 0)}
+    for line in lines:
+        for field, value in balance_delta(None, line).items():
+            doc[field] += value
+    oldest = _oldest_due(lines)
+    if oldest is not None:
+        doc["oldest_due_date"] = oldest
+    doc["updated_at"] = datetime.now(timezone.utc)
+    return doc
+
+
+class Ledger:
+    def __init__(self, transactions, payments_collection, invoices_collection, balances_collection):
+        self.transactions = transactions
+        self.payments = payments_collection
+        self.invoices = invoices_collection
+        self.balances = balances_collection
+
+    # ----- balances -----
+    async def balance(self, member_id: str) -> dict:
+        """The member's balance document; all zeros for a member without fees."""
+        doc = await self.balances.find_one({"_id": member_id})
+        empty = {"_id": member_id, **dict.fromkeys(BALANCE_FIELDS, 0), "oldest_due_date": None, "updated_at": None}
+        return {**empty, **(doc or {})}
+
+    @staticmethod
+    def _adjustment(inc: dict[str, int], oldest_due: datetime | None = None) -> dict:
+        update = {"$set": {"updated_at": datetime.now(timezone.utc)}}
+        if inc:
+            update["$inc"] = inc
+        if oldest_due is not None:
+            # $min on a missing field sets it (oldest_due_date is unset, never null, when nothing is owed)
+            update["$min"] = {"oldest_due_date": oldest_due}
+        return update
+
+    async def _move(self, member_id: str, before: dict | None, after: dict | None, session) -> None:
+        """Move the member's balance for one line going from before to after."""
+        inc = balance_delta(before, after)
+        oldest = after.get("due_date") if _is_pending(after) and not _is_pending(before) else None
+        if inc or oldest is not None:
+            await self.balances.update_one({"_id": member_id}, self._adjustment(inc, oldest), upsert=True, session=session)
+        if _is_pending(before) and not _is_pending(after):
+            await self._refresh_oldest_due(member_id, session)
+
+    async def _refresh_oldest_due(self, member_id: str, session) -> None:
+        line = await self.payments.find_one(
+            {"member_id": member_id, "status": {"$in": PENDING}}, {"due_date": 1}, sort=[("due_date", 1)], session=session,
+        )
+        if line and line.get("due_date"):
+            update = {"$set": {"oldest_due_date": line["due_date"]}}
+        else:
+            update = {"$unset": {"oldest_due_date": ""}}
+        await self.balances.update_one({"_id": member_id}, update, session=session)
+
+    # ----- lines -----
+    async def _update_line(self, query: dict, update: dict, session) -> dict | None:
+        """$set update on one line matching query, moving the member's balance. Returns the line after, or None."""
+        before = await self.payments.find_one_and_update(query, {"$set": update}, session=session)
+        if before is None:
+            return None
+        after = {**before, **update}
+        await self._move(before["member_id"], before, after, session)
+        return after
+
+    async def _sync_invoice(self, invoice_id: str, paid_at: datetime | None, session) -> None:
+        """Invoice status from its lines: Paid once every line is Paid, otherwise Unpaid."""
+        invoice = await self.invoices.find_one({"_id": ObjectId(invoice_id)}, {"items": 1, "status": 1}, session=session)
+        if invoice is None:
+            return
+        ids = [ObjectId(item["payment_id"]) for item in invoice.get("items", []) if item.get("payment_id")]
+        if not ids:
+            return
+        unpaid = await self.payments.count_documents({"_id": {"$in": ids}, "status": {"$ne": "Paid"}}, session=session)
+        status = "Unpaid" if unpaid else "Paid"
+        if status != invoice.get("status"):
+            await self.invoices.update_one(
+                {"_id": invoice["_id"]}, {"$set": {"status": status, "paid_at": paid_at if status == "Paid" else None}}, session=session,
+            )
+
+    def _balance_ops(self, lines: list[dict]) -> list[UpdateOne]:
+        """One balance update per member adding new lines."""
+        by_member: dict[str, list[dict]] = {}
+        for line in lines:
+            by_member.setdefault(line["member_id"], []).append(line)
+        ops = []
+        for mid, member_lines in by_member.items():
+            inc: dict[str, int] = {}
+            for line in member_lines:
+                for field, value in balance_delta(None, line).items():
+                    inc[field] = inc.get(field, 0) + value
+            ops.append(UpdateOne({"_id": mid}, self._adjustment(inc, _oldest_due(member_lines)), upsert=True))
+        return ops
+
+    async def upsert_lines(self, lines: list[dict]) -> int:
+        """
+        Insert the fee lines (e.g. monthly dues) that do not exist yet, keyed on (member_id, fee_type,
+        period), as one bulk_write of upserts, and add the new ones to their members' balances.
+        Returns the number of lines created.
+        """
+        if not lines:
+            return 0
+        key = ("member_id", "fee_type", "period")
+        ops = [
+            UpdateOne({k: line[k] for k in key}, {"$setOnInsert": {k: v for k, v in line.items() if k not in key}}, upsert=True)
+            for line in lines
+        ]
+
+        async def write(session):
+            result = await self.payments.bulk_write(ops, ordered=False, session=session)
+            created = [lines[i] for i in result.upserted_ids]
+            if created:
+                await self.balances.bulk_write(self._balance_ops(created), ordered=False, session=session)
+            return len(created)
+
+        return await self.transactions.run(write)
+
+    async def mark_overdue(self, before: datetime, batch_size: int = 1000) -> int:
+        """
+        Due -> Overdue for lines due before `before`, moving their amounts from due to overdue. Returns lines moved.
+        Per batch: read the lines, update each one only if it is still Due at the amount read, stamping
+        overdue_at, then move balances by the lines carrying this sweep's stamp. A payment that lands
+        between the read and the update is left alone; one that lands after it moves the line out of
+        overdue itself. Either way the balance moves once.
+        """
+        query = {"status": "Due", "due_date": {"$lt": before}}
+        now = datetime.now(timezone.utc)
+        overdue_at = now.replace(microsecond=now.microsecond // 1000 * 1000)  # as stored, so it matches below
+
+        async def move(lines: list[dict], session) -> int:
+            ops = [
+                UpdateOne({"_id": line["_id"], "status": "Due", "amount": line.get("amount")}, {"$set": {"status": "Overdue", "overdue_at": overdue_at}})
+                for line in lines
+            ]
+            result = await self.payments.bulk_write(ops, ordered=False, session=session)
+            if result.modified_count < len(lines):
+                stamped = {
+                    doc["_id"] async for doc in self.payments.find(
+                        {"_id": {"$in": [line["_id"] for line in lines]}, "overdue_at": overdue_at}, {"_id": 1}, session=session,
+                    )
+                }
+                lines = [line for line in lines if line["_id"] in stamped]
+            shift: dict[str, dict[str, int]] = {}
+            for line in lines:
+                row = shift.setdefault(line["member_id"], {"amount": 0, "count": 0})
+                row["amount"] += line.get("amount", 0)
+                row["count"] += 1
+            if shift:
+                await self.balances.bulk_write([
+                    UpdateOne({"_id": mid}, self._adjustment({
+                        "due_amount": -row["amount"], "due_count": -row["count"], "overdue_amount": row["amount"], "overdue_count": row["count"],
+                    }), upsert=True)
+                    for mid, row in shift.items()
+                ], ordered=False, session=session)
+            return len(lines)
+
+        async def write(session):
+            moved, batch = 0, []
+            async for line in self.payments.find(query, {"member_id": 1, "amount": 1}, session=session):
+                batch.append(line)
+                if len(batch) >= batch_size:
+                    moved += await move(batch, session)
+                    batch = []
+            if batch:
+                moved += await move(batch, session)
+            return moved
+
+        return await self.transactions.run(write)
+
+    async def pay_line(self, payment_id: ObjectId, paid_at: datetime, member_id: str | None = None) -> dict | None:
+        """Mark a Due/Overdue line Paid (and its invoice, once fully paid). None if there is no such unpaid line."""
+        query = {"_id": payment_id, "status": {"$in": PENDING}}
+        if member_id is not None:
+            query["member_id"] = member_id
+
+        async def write(session):
+            line = await self._update_line(query, {"status": "Paid", "paid_at": paid_at}, session)
+            if line and line.get("invoice_id"):
+                await self._sync_invoice(line["invoice_id"], paid_at, session)
+            return line
+
+        return await self.transactions.run(write)
+
+    async def set_line_status(self, payment_id: ObjectId, status: str, paid_at: datetime | None) -> dict | None:
+        """Admin correction: set a line's status (paid_at only kept for Paid) and its invoice's. None if no such line."""
+        update = {"status": status, "paid_at": paid_at if status == "Paid" else None}
+
+        async def write(session):
+            line = await self._update_line({"_id": payment_id}, update, session)
+            if line and line.get("invoice_id"):
+                await self._sync_invoice(line["invoice_id"], paid_at, session)
+            return line
+
+        return await self.transactions.run(write)
+
+    async def record_monthly(self, member_id: str, member_name: str, period: str, amount: int, paid_at: datetime) -> dict:
+        """
+        Settle the member's unpaid monthly fee for period at amount, or record a new Paid one if none
+        is outstanding. A line already billed on an invoice is settled there; any other line gets a
+        Paid receipt invoice of its own. Returns the line.
+        """
+        async def write(session):
+            line = await self._update_line(
+                {"member_id": member_id, "fee_type": "monthly", "period": period, "status": {"$in": PENDING}},
+                {"amount": amount, "status": "Paid", "paid_at": paid_at},
+                session,
+            )
+            if line and line.get("invoice_id"):
+                await self._sync_invoice(line["invoice_id"], paid_at, session)
+                return line
+            invoice_id = ObjectId()
+            if line is None:
+                line = {
+                    "_id": ObjectId(),
+                    "member_id": member_id,
+                    "member_name": member_name,
+                    "amount": amount,
+                    "fee_type": "monthly",
+                    "period": period,
+                    "status": "Paid",
+                    "due_date": paid_at,
+                    "paid_at": paid_at,
+                    "created_at": datetime.now(timezone.utc),
+                    "invoice_id": str(invoice_id),
+                }
+                await self.payments.insert_one(line, session=session)
+                await self._move(member_id, None, line, session)
+            else:
+                await self.payments.update_one({"_id": line["_id"]}, {"$set": {"invoice_id": str(invoice_id)}}, session=session)
+                line["invoice_id"] = str(invoice_id)
+            await self.invoices.insert_one({
+                "_id": invoice_id,
+                "member_id": member_id,
+                "member_name": member_name,
+                "search_tokens": invoice_search_tokens(invoice_id, member_name),
+                "items": [{"description": f"Monthly Fee ({period})", "amount": amount, "payment_id": str(line["_id"])}],
+                "total": amount,
+                "status": "Paid",
+                "issued_at": datetime.now(timezone.utc),
+                "paid_at": paid_at,
+            }, session=session)
+            return line
+
+        return await self.transactions.run(write)
+
+    # ----- invoices -----
+    async def pay_invoice(self, invoice_id: ObjectId, paid_at: datetime) -> dict | None:
+        """Mark an unpaid invoice Paid together with its unpaid lines. None if there is no such unpaid invoice."""
+        async def write(session):
+            invoice = await self.invoices.find_one_and_update(
+                {"_id": invoice_id, "status": {"$ne": "Paid"}},
+                {"$set": {"status": "Paid", "paid_at": paid_at}},
+                return_document=ReturnDocument.AFTER,
+                session=session,
+            )
+            if invoice is None:
+                return None
+            for item in invoice.get("items", []):
+                if item.get("payment_id"):
+                    await self._update_line(
+                        {"_id": ObjectId(item["payment_id"]), "status": {"$in": PENDING}}, {"status": "Paid", "paid_at": paid_at}, session,
+                    )
+            return invoice
+
+        return await self.transactions.run(write)
+
+    # ----- reconciliation -----
+    async def reconcile(self, progress: dict | None = None, batch_size: int = 500) -> dict:
+        """
+        Link legacy invoices, make invoices and lines agree, recompute drifted balances. Idempotent.
+        paid_days: IST days of the Paid lines changed, whose revenue buckets are stale.
+        """
+        progress = progress if progress is not None else {}
+        progress.update({"invoices_linked": 0, "invoices_fixed": 0, "lines_fixed": 0, "balances_fixed": 0})
+        progress["duplicates"] = await self.merge_duplicate_monthly_fees()
+        paid_days = set(progress["duplicates"]["paid_days"])
+        await self._link_legacy_invoices(progress)
+        await self._reconcile_invoices(progress, batch_size, paid_days)
+        await self._reconcile_balances(progress, batch_size)
+        progress["paid_days"] = sorted(paid_days)
+        return dict(progress)
+
+    async def merge_duplicate_monthly_fees(self) -> dict:
+        """
+        Leave one monthly fee per member and period: the first Paid line, else the oldest. Unpaid
+        extras are deleted and the invoice items billing them point at the kept line instead.
+        Further Paid lines are money received twice: they are kept for review as fee_type
+        "monthly_duplicate" (duplicate_of: the kept line). Touched members' balances are recomputed.
+        paid_days: IST days of those Paid lines.
+        """
+        pipeline = [
+            {"$match": {"fee_type": "monthly"}},
+            {"$project": {"member_id": 1, "period": 1, "status": 1, "created_at": 1, "paid_at": 1, "invoice_id": 1}},
+            {"$group": {"_id": {"member_id": "$member_id", "period": "$period"}, "lines": {"$push": "$$ROOT"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ]
+        result = {"periods": 0, "deleted": 0, "paid_duplicates": 0}
+        touched, invoices, paid_days = set(), {}, set()
+        async for group in self.payments.aggregate(pipeline, allowDiskUse=True):
+            lines = group["lines"]
+            paid = sorted((p for p in lines if p.get("status") == "Paid"), key=lambda p: (p.get("paid_at") is None, p.get("paid_at") or 0, p["_id"]))
+            keep = paid[0] if paid else min(lines, key=lambda p: (p.get("created_at") is None, p.get("created_at") or 0, p["_id"]))
+            for line in lines:
+                if line["_id"] == keep["_id"]:
+                    continue
+                if line.get("status") == "Paid":
+                    await self.payments.update_one({"_id": line["_id"]}, {"$set": {"fee_type": "monthly_duplicate", "duplicate_of": str(keep["_id"])}})
+                    result["paid_duplicates"] += 1
+                    if line.get("paid_at"):
+                        paid_days.add(ist_day(line["paid_at"]))
+                    continue
+                async for invoice in self.invoices.find({"items.payment_id": str(line["_id"])}, {"_id": 1}):
+                    await self.invoices.update_one(
+                        {"_id": invoice["_id"], "items.payment_id": str(line["_id"])}, {"$set": {"items.$.payment_id": str(keep["_id"])}},
+                    )
+                    invoices[str(invoice["_id"])] = keep.get("paid_at")
+                if line.get("invoice_id") and not keep.get("invoice_id"):
+                    await self.payments.update_one({"_id": keep["_id"]}, {"$set": {"invoice_id": line["invoice_id"]}})
+                    keep["invoice_id"] = line["invoice_id"]
+                await self.payments.delete_one({"_id": line["_id"]})
+                result["deleted"] += 1
+            result["periods"] += 1
+            touched.add(group["_id"]["member_id"])
+        for invoice_id, paid_at in invoices.items():
+            await self._sync_invoice(invoice_id, paid_at, None)
+        await self._rewrite_balances(list(touched))
+        result["paid_days"] = sorted(paid_days)
+        return result
+
+    async def _legacy_line(self, invoice: dict, description: str) -> dict | None:
+        """The unbilled line an item of a pre-ledger invoice was for, matched by its description."""
+        query = {"member_id": invoice["member_id"], "invoice_id": {"$exists": False}}
+        month = _MONTHLY_ITEM.match(description or "")
+        if description == "Registration":
+            query["fee_type"] = "registration"
+        elif description == "First Month":
+            issued = invoice["issued_at"].replace(tzinfo=invoice["issued_at"].tzinfo or timezone.utc)
+            query.update({"fee_type": "monthly", "period": issued.astimezone(_IST).strftime("%Y-%m")})
+        elif month:
+            query.update({"fee_type": "monthly", "period": month.group(1)})
+        else:
+            return None
+        return await self.payments.find_one(query, {"_id": 1}, sort=[("created_at", 1)])
+
+    async def _link_legacy_invoices(self, progress: dict) -> None:
+        # Items that match no line get payment_id None, so each invoice is looked at once
+        async for invoice in self.invoices.find({"items.payment_id": {"$exists": False}}, {"member_id": 1, "items": 1, "issued_at": 1}):
+            items = []
+            for item in invoice.get("items", []):
+                line = await self._legacy_line(invoice, item.get("description"))
+                if line is not None:
+                    result = await self.payments.update_one(
+                        {"_id": line["_id"], "invoice_id": {"$exists": False}}, {"$set": {"invoice_id": str(invoice["_id"])}},
+                    )
+                    if not result.modified_count:
+                        line = None
+                items.append({**item, "payment_id": str(line["_id"]) if line else None})
+            await self.invoices.update_one({"_id": invoice["_id"]}, {"$set": {"items": items}})
+            progress["invoices_linked"] += any(item["payment_id"] for item in items)
+
+    async def _reconcile_invoices(self, progress: dict, batch_size: int, paid_days: set[str]) -> None:
+        async def check(batch: list[dict]) -> None:
+            ids = [ObjectId(item["payment_id"]) for inv in batch for item in inv["items"] if item.get("payment_id")]
+            lines = {str(p["_id"]): p async for p in self.payments.find({"_id": {"$in": ids}}, {"status": 1, "paid_at": 1})}
+            invoice_ops, line_ops = [], []
+            for inv in batch:
+                billed = [lines[item["payment_id"]] for item in inv["items"] if item.get("payment_id") in lines]
+                unpaid = [p for p in billed if p["status"] != "Paid"]
+                if inv.get("status") == "Paid" and unpaid:
+                    line_ops += [UpdateOne({"_id": p["_id"], "status": {"$in": PENDING}}, {"$set": {"status": "Paid", "paid_at": inv.get("paid_at")}}) for p in unpaid]
+                    if inv.get("paid_at"):
+                        paid_days.add(ist_day(inv["paid_at"]))
+                elif inv.get("status") != "Paid" and billed and not unpaid:
+                    paid_at = max((p["paid_at"] for p in billed if p.get("paid_at")), default=None)
+                    invoice_ops.append(UpdateOne({"_id": inv["_id"]}, {"$set": {"status": "Paid", "paid_at": paid_at}}))
+            if line_ops:
+                progress["lines_fixed"] += (await self.payments.bulk_write(line_ops, ordered=False)).modified_count
+            if invoice_ops:
+                progress["invoices_fixed"] += (await self.invoices.bulk_write(invoice_ops, ordered=False)).modified_count
+
+        batch = []
+        async for invoice in self.invoices.find({"items.payment_id": {"$type": "string"}}, {"items": 1, "status": 1, "paid_at": 1}):
+            batch.append(invoice)
+            if len(batch) >= batch_size:
+                await check(batch)
+                batch = []
+        if batch:
+            await check(batch)
+
+    async def _balances_by_member(self, match: dict) -> dict[str, dict]:
+        """Balance fields (BALANCE_FIELDS + oldest_due_date) per member, computed from the lines."""
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": {"member_id": "$member_id", "status": "$status"},
+                "amount": {"$sum": "$amount"}, "count": {"$sum": 1}, "oldest": {"$min": "$due_date"},
+            }},
+        ]
+        out: dict[str, dict] = {}
+        async for row in self.payments.aggregate(pipeline):
+            status = row["_id"].get("status")
+            if status not in BUCKETS:
+                continue
+            fields = out.setdefault(row["_id"]["member_id"], {**dict.fromkeys(BALANCE_FIELDS, 0), "oldest_due_date": None})
+            for bucket in [BUCKETS[status]] + (["pending"] if status in PENDING else []):
+                fields[f"{bucket}_amount"] += row["amount"]
+                fields[f"{bucket}_count"] += row["count"]
+            if status in PENDING and row.get("oldest") is not None:
+                current = fields["oldest_due_date"]
+                fields["oldest_due_date"] = row["oldest"] if current is None else min(current, row["oldest"])
+        return out
+
+    async def _reconcile_balances(self, progress: dict, batch_size: int) -> None:
+        empty = {**dict.fromkeys(BALANCE_FIELDS, 0), "oldest_due_date": None}
+        expected = await self._balances_by_member({})
+        drifted = []
+        async for doc in self.balances.find({}, {"updated_at": 0}):
+            stored = {field: doc.get(field, default) for field, default in empty.items()}
+            if stored != expected.pop(doc["_id"], empty):
+                drifted.append(doc["_id"])
+        drifted += list(expected)
+        progress["balances_fixed"] += await self._rewrite_balances(drifted, batch_size)
+
+    async def _rewrite_balances(self, member_ids: list[str], batch_size: int = 500) -> int:
+        """Recompute the members' balances from their lines. Returns the number written."""
+        empty = {**dict.fromkeys(BALANCE_FIELDS, 0), "oldest_due_date": None}
+        written = 0
+        # Re-read the members just before fixing them, so writes made during a scan are kept
+        for start in range(0, len(member_ids), batch_size):
+            chunk = member_ids[start:start + batch_size]
+            fresh = await self._balances_by_member({"member_id": {"$in": chunk}})
+            now = datetime.now(timezone.utc)
+            ops = []
+            for mid in chunk:
+                fields = dict(fresh.get(mid, empty))
+                oldest = fields.pop("oldest_due_date")
+                update = {"$set": {**fields, "updated_at": now}}
+                if oldest is None:
+                    update["$unset"] = {"oldest_due_date": ""}
+                else:
+                    update["$set"]["oldest_due_date"] = oldest
+                ops.append(UpdateOne({"_id": mid}, update, upsert=True))
+            await self.balances.bulk_write(ops, ordered=False)
+            written += len(ops)
+        return written
@@ -6,26 +6,51 @@ This FastAPI application provides REST endpoints for:
 - Attendance: check-in/check-out (IST), daily and date-range reports
 - Payments: registration + monthly fees (₹500 Regular / ₹2000 PT), log monthly with date
 - Billing: walk-in (new member + first invoice), invoice history, mark paid
-- Analytics: dashboard counts (active/inactive, today's check-ins, etc.)
+- Analytics: dashboard counts (active/inactive, today's check-ins, etc.), attendance / revenue series
 - Export: members, payments, billing to Excel
 
 All timestamps and "today" are in Asia/Kolkata (IST). MongoDB collections:
-gym_members, attendance_logs, payments, invoices.
+gym_members, attendance_logs, payments, invoices, member_balances, dues_runs,
+daily_attendance_stats, analytics_series, notification_outbox. Fee writes go through the ledger (ledger.py).
+Member photos and ID documents live in the media store (GridFS bucket member_media, see media.py).
 """
 
+import asyncio
+import json
+import logging
 import os
 from contextlib import asynccontextmanager
 from datetime import datetime, date, timedelta
 from enum import Enum
-from io import BytesIO
 from zoneinfo import ZoneInfo
 
-from fastapi import BackgroundTasks, FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError
 from pydantic import BaseModel, EmailStr, Field, field_serializer
 
+from cache import TTLCache
+from enrollment import EnrollmentService
+from fastjson import NDJSON_MEDIA_TYPE, FastJSONResponse, ndjson_chunks
+from identity import MemberIdentityCache
+from jobs import JobRegistry
+from ledger import Ledger
+from media import content_hash, decode_base64, media_store_from_env
+from notifications import NotificationDispatcher, provider_from_env
+from pagination import NEXT_CURSOR_HEADER, paginate, scan
+from phones import normalize_phone
+from projections import ATTENDANCE_TODAY_STATUS, member_projection, member_stages
+from search import member_search_tokens
+from rollups import (
+    duration_sec, member_stats_update, read_daily_stats, read_member_stats, record_check_in, record_check_out,
+    record_delete, record_member_delete, record_member_duration, record_member_visit, reserve_check_in,
+)
+from scheduler import Scheduler
+from series import AnalyticsSeries, ist_day
+from transactions import Transactions
+
 # ---------------------------------------------------------------------------
 # Configuration & database
 # ---------------------------------------------------------------------------
@@ -36,20 +61,61 @@ COLLECTION_MEMBERS = "gym_members"
 COLLECTION_ATTENDANCE = "attendance_logs"
 COLLECTION_PAYMENTS = "payments"
 COLLECTION_INVOICES = "invoices"
+COLLECTION_DAILY_ATTENDANCE_STATS = "daily_attendance_stats"
+COLLECTION_SCHEDULER_LEASES = "scheduler_leases"
+COLLECTION_NOTIFICATION_OUTBOX = "notification_outbox"
+COLLECTION_ATTENDANCE_EVENT_KEYS = "attendance_event_keys"
+COLLECTION_MEMBER_ATTENDANCE_STATS = "member_attendance_stats"
+COLLECTION_MEMBER_BALANCES = "member_balances"
+COLLECTION_DUES_RUNS = "dues_runs"
+COLLECTION_ANALYTICS_SERIES = "analytics_series"
+
+# Background scheduler (overdue fees, inactive sweep, month rollover). Set SCHEDULER_ENABLED=0 to disable (tests).
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") != "0"
 
 # Fee constants (used for registration, monthly dues, walk-in first bill)
 REGISTRATION_FEE = 1000
 MONTHLY_FEE_REGULAR = 500
 MONTHLY_FEE_PT = 2000
+# Monthly fee per membership type: new members' first month and the dues generator (dues.py).
+# MONTHLY_FEE_PLANS='{"Regular": 600, "PT": 2500}' overrides; a type without a plan pays Regular.
+MONTHLY_FEE_PLANS = {"Regular": MONTHLY_FEE_REGULAR, "PT": MONTHLY_FEE_PT, **json.loads(os.environ.get("MONTHLY_FEE_PLANS", "{}"))}
 
 IST = ZoneInfo("Asia/Kolkata")
 
+logger = logging.getLogger(__name__)
+
 client = AsyncIOMotorClient(MONGODB_URL)
 db = client[DATABASE_NAME]
 members_collection = db[COLLECTION_MEMBERS]
 attendance_collection = db[COLLECTION_ATTENDANCE]
 payments_collection = db[COLLECTION_PAYMENTS]
 invoices_collection = db[COLLECTION_INVOICES]
+daily_stats_collection = db[COLLECTION_DAILY_ATTENDANCE_STATS]  # per-IST-date attendance rollups (rollups.py)
+member_stats_collection = db[COLLECTION_MEMBER_ATTENDANCE_STATS]  # per-member visit / duration totals (rollups.py)
+attendance_event_keys_collection = db[COLLECTION_ATTENDANCE_EVENT_KEYS]  # POST /attendance/bulk idempotency keys (TTL)
+balances_collection = db[COLLECTION_MEMBER_BALANCES]  # per-member pending dues (ledger.py)
+dues_runs_collection = db[COLLECTION_DUES_RUNS]  # monthly dues generator checkpoints, one per period (dues.py)
+series_collection = db[COLLECTION_ANALYTICS_SERIES]  # closed chart buckets, computed once (series.py)
+# name/phone/email/status/membership_type by member id and phone, for check-in, payments and billing.
+# Kept coherent by a change stream when available; every gym_members write below also invalidates it.
+identity_cache = MemberIdentityCache(members_collection)
+# Member photos / ID documents (GridFS, or local files with MEDIA_BACKEND=local)
+media_store = media_store_from_env(db)
+# Jobs are registered next to their definitions below; only the lease holder runs them
+scheduler = Scheduler(db[COLLECTION_SCHEDULER_LEASES])
+# Long admin actions (fee reminders) run as background jobs; GET /admin/jobs/{job_id} for progress
+background_jobs = JobRegistry()
+# WhatsApp/Email: handlers enqueue to the durable outbox; worker tasks send (NOTIFICATION_PROVIDER=console|fake)
+notifier = NotificationDispatcher(db[COLLECTION_NOTIFICATION_OUTBOX], provider_from_env())
+# Multi-document transactions where the server supports them (replica set / Atlas)
+transactions = Transactions(client)
+# Fee lines (payments), the invoices that bill them and member balances change together
+ledger = Ledger(transactions, payments_collection, invoices_collection, balances_collection)
+# New member + first fees (+ walk-in invoice) + registration message, written all or nothing
+enrollment = EnrollmentService(transactions, members_collection, invoices_collection, payments_collection, balances_collection, notifier)
+# Dashboard charts: attendance / revenue per IST day, week or month; closed buckets stored once
+analytics_series = AnalyticsSeries(attendance_collection, payments_collection, members_collection, series_collection)
 
 
 # ---------------------------------------------------------------------------
@@ -68,6 +134,25 @@ def today_ist() -> date:
     return now_ist().date()
 
 
+def monthly_fee(membership_type: str) -> int:
+    """Monthly fee of a membership type from MONTHLY_FEE_PLANS."""
+    return MONTHLY_FEE_PLANS.get(membership_type, MONTHLY_FEE_PLANS["Regular"])
+
+
+# How API responses show attendance times: IST with milliseconds, "2025-02-14T07:00:05.123+05:30".
+# Same text from Python (ist_iso) and from MongoDB ($dateToString); India has no DST, so the offset is fixed.
+IST_ISO_FORMAT = "%Y-%m-%dT%H:%M:%S.%L+05:30"
+
+
+def ist_iso(dt: datetime) -> str:
+    """IST_ISO_FORMAT text of a datetime (naive datetimes, as read from MongoDB, are UTC)."""
+    from datetime import timezone
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    local = dt.astimezone(IST)
+    return f"{local:%Y-%m-%dT%H:%M:%S}.{local.microsecond // 1000:03d}+05:30"
+
+
 def batch_from_ist(dt: datetime) -> str:
     """Return Morning, Evening, or Ladies based on IST hour. Morning 4-11, Evening 12-16, Ladies 17-23, else Evening."""
     h = dt.hour
@@ -79,23 +164,41 @@ def batch_from_ist(dt: datetime) -> str:
 
 
 # ---------------------------------------------------------------------------
-# App lifecycle: auto-mark inactive members who haven't visited in 90 days
+# App lifecycle: index bootstrap, rollups, background scheduler
 # ---------------------------------------------------------------------------
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """On startup: mark members as Inactive if last_attendance_date is older than 90 days (IST)."""
-    from datetime import timezone
-    today = today_ist()
-    cutoff = today - timedelta(days=90)
-    cutoff_dt = datetime(cutoff.year, cutoff.month, cutoff.day, tzinfo=timezone.utc)
-    await members_collection.update_many(
-        {"last_attendance_date": {"$exists": True, "$lt": cutoff_dt}},
-        {"$set": {"status": "Inactive"}},
-    )
+    """
+    On startup: merge duplicate monthly fees and reconcile MongoDB indexes, build attendance rollups on first deploy, backfill
+    canonical phones and search tokens and build member_balances on first deploy (background job),
+    and start the background scheduler (90-day inactive sweep, Due -> Overdue, month rollover,
+    nightly ledger reconcile) and the notification
+    workers and the member identity cache's change-stream watcher. Stop them on shutdown; unsent
+    notifications stay in the outbox.
+    """
+    from indexes import ensure_indexes
+    from rollups import rebuild_daily_stats, rebuild_member_stats
+    if "member_monthly_period_unique" not in await payments_collection.index_information():
+        # Older databases can hold two monthly fees for one period; merge them so the unique index builds
+        merged = await ledger.merge_duplicate_monthly_fees()
+        if merged["periods"]:
+            logger.warning("Merged duplicate monthly fees before building member_monthly_period_unique: %s", merged)
+            await analytics_series.invalidate("revenue", merged["paid_days"], today_ist())
+    await ensure_indexes(db)
+    if await daily_stats_collection.estimated_document_count() == 0:
+        await rebuild_daily_stats(attendance_collection, daily_stats_collection)
+    if await member_stats_collection.estimated_document_count() == 0:
+        await rebuild_member_stats(attendance_collection, member_stats_collection)
+    background_jobs.start("startup_backfill", _startup_backfill)
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+    notifier.start()
+    identity_cache.start()
     yield
-    # shutdown if needed
-    pass
+    await identity_cache.stop()
+    await notifier.stop()
+    await scheduler.stop()
 
 
 app = FastAPI(title="Gym API", lifespan=lifespan)
@@ -107,6 +210,7 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 
@@ -156,7 +260,9 @@ class MemberResponse(BaseModel):
     last_attendance_date: date | None = None
     workout_schedule: str | None = None
     diet_chart: str | None = None
-    photo_base64: str | None = None
+    photo_url: str | None = None  # GET this for the photo bytes (ETag/Range supported)
+    id_document_url: str | None = None
+    photo_base64: str | None = None  # only filled by GET /members/{id} (include_media=true)
     id_document_base64: str | None = None
     id_document_type: str | None = None
     today_status: TodayAttendance | None = None
@@ -201,6 +307,22 @@ class PaymentResponse(BaseModel):
     due_date: date | None = None
     paid_at: datetime | None = None
     created_at: datetime
+    invoice_id: str | None = None  # invoice billing this fee, if any
+
+
+class MemberBalanceResponse(BaseModel):
+    """What a member owes (due + overdue = pending) and has paid to date, from member_balances."""
+    member_id: str
+    due_amount: int = 0
+    due_count: int = 0
+    overdue_amount: int = 0
+    overdue_count: int = 0
+    pending_amount: int = 0
+    pending_count: int = 0
+    paid_amount: int = 0
+    paid_count: int = 0
+    oldest_due_date: datetime | None = None  # earliest due date of an unpaid fee
+    updated_at: datetime | None = None
 
 
 class InvoiceItem(BaseModel):
@@ -229,38 +351,48 @@ class AttendanceRecord(BaseModel):
     member_id: str
     member_name: str
     member_phone: str | None = None
-    check_in_at: datetime  # IST, for display
+    check_in_at: datetime  # shown in IST (IST_ISO_FORMAT)
     date_ist: str
     batch: str
     check_out_at: datetime | None = None  # IST, when member checked out
 
     @field_serializer("check_in_at")
     def serialize_check_in_at(self, dt: datetime) -> str:
-        return dt.isoformat()
+        return ist_iso(dt)
 
     @field_serializer("check_out_at")
     def serialize_check_out_at(self, dt: datetime | None) -> str | None:
-        return dt.isoformat() if dt else None
+        return ist_iso(dt) if dt else None
 
 
-# ---------- Notifications (utils.send_notification) ----------
-def _notify_registration(name: str, email: str, phone: str):
-    from utils import send_notification
-    send_notification("registration", {"name": name, "phone": phone, "email": email})
+class AttendanceEventType(str, Enum):
+    check_in = "check_in"
+    check_out = "check_out"
 
-def _notify_payment_received(name: str, amount: int, email: str, phone: str):
-    from utils import send_notification
-    send_notification("payment_received", {"name": name, "phone": phone, "email": email}, {"amount": amount})
 
-def _notify_status_change(name: str, new_status: str, email: str, phone: str):
-    from utils import send_notification
-    send_notification("status_change", {"name": name, "phone": phone, "email": email}, {"new_status": new_status})
+class AttendanceEvent(BaseModel):
+    """One buffered kiosk tap. `at` is when it happened (naive times are IST); it decides date_ist and batch."""
+    idempotency_key: str = Field(..., min_length=1, max_length=100)
+    member_id: str
+    type: AttendanceEventType
+    at: datetime
+
+
+class AttendanceBulkRequest(BaseModel):
+    events: list[AttendanceEvent] = Field(..., min_length=1, max_length=1000)
+
+
+# ---------- Notifications (notifications.py: outbox + worker pool; handlers only enqueue) ----------
+async def _notify(notification_type: str, member: dict, extra: dict | None = None) -> None:
+    user = {"name": member.get("name", ""), "phone": member.get("phone", ""), "email": member.get("email", "")}
+    await notifier.enqueue(notification_type, user, extra)
 
 
 # Minimum app version the backend supports (app should prompt update if below this).
 MIN_APP_VERSION = "1.0.0"
 
 # Optional: max check-ins per batch per day (None = no limit). Set e.g. {"Morning": 30, "Evening": 30, "Ladies": 20}.
+# Enforced atomically on the daily_attendance_stats batch counter (rollups.reserve_check_in).
 BATCH_CAPACITY = None  # or {"Morning": 30, "Evening": 30, "Ladies": 20}
 
 
@@ -275,149 +407,211 @@ def version():
     return {"min_app_version": MIN_APP_VERSION, "api_version": "1"}
 
 
+# ---------- Pagination (pagination.py: keyset cursor over (sort key, _id)) ----------
+MAX_PAGE_SIZE = 1000
+
+
+async def _paginate(response: Response, collection, query: dict, sort: list, limit: int, cursor: str | None, projection: dict | None = None, skip: int = 0, stages: list[dict] | None = None) -> list[dict]:
+    """One page of documents; sets X-Next-Cursor when there are more. skip (legacy) applies only without a cursor."""
+    try:
+        docs, next_cursor = await paginate(collection, query, sort, limit, cursor, projection=projection, skip=skip, stages=stages)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return docs
+
+
+def _stream_mode(stream: str | None) -> bool:
+    """True for ?stream=ndjson; 400 for any other stream value."""
+    if stream is None:
+        return False
+    if stream != "ndjson":
+        raise HTTPException(status_code=400, detail="stream must be ndjson")
+    return True
+
+
+def _ndjson_response(collection, query: dict, sort: list, row, cursor: str | None = None, projection: dict | None = None, stages: list[dict] | None = None) -> StreamingResponse:
+    """
+    Every matching document (after cursor, if given) as newline-delimited JSON, one row(doc) per line.
+    Rows are written as the Motor cursor yields them, one batch at a time (pagination.scan), so
+    memory and time to first byte do not grow with the size of the result.
+    """
+    try:
+        docs = scan(collection, query, sort, cursor, projection=projection, stages=stages)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return StreamingResponse(ndjson_chunks(row(doc) async for doc in docs), media_type=NDJSON_MEDIA_TYPE)
+
+
 # ---------- Members: CRUD, lookup, attendance stats ----------
 
+async def _find_member(query: dict, endpoint: str) -> dict | None:
+    """The member matching query, read with endpoint's profile (projections.member_stages)."""
+    async for doc in members_collection.aggregate([{"$match": query}, {"$limit": 1}, *member_stages(endpoint)]):
+        return doc
+    return None
+
+
+def _canonical_phone(phone: str) -> str:
+    """E.164 form of a phone from a request (phones.py); 400 if it is not a phone number."""
+    canonical = normalize_phone(phone)
+    if canonical is None:
+        raise HTTPException(status_code=400, detail="Invalid phone number")
+    return canonical
+
+
 @app.post("/members", response_model=MemberResponse)
 async def create_member(member: MemberCreate):
     from datetime import timezone
     doc = member.model_dump()
-    # Normalize phone for consistent lookup (member login uses by-phone)
+    # phone as entered for display; phone_e164 is the canonical form member login looks up
     doc["phone"] = (doc.get("phone") or "").strip()
+    doc["phone_e164"] = _canonical_phone(doc["phone"])
+    doc["search_tokens"] = member_search_tokens(doc["name"], doc["phone_e164"])
+    # Photo / ID document go to the media store; the member keeps only {sha256, size, content_type}
+    uploads = {}
+    for field in ("photo", "id_document"):
+        raw = doc.pop(f"{field}_base64", None)
+        if raw:
+            uploads[field] = _decode_upload(raw)
+    if "id_document" not in uploads:
+        doc.pop("id_document_type", None)
     doc["created_at"] = datetime.now(timezone.utc)
     mt = doc["membership_type"].value if isinstance(doc["membership_type"], MembershipType) else doc["membership_type"]
     doc["workout_schedule"] = doc.get("workout_schedule")
     doc["diet_chart"] = doc.get("diet_chart")
-    result = await members_collection.insert_one(doc)
-    mid = str(result.inserted_id)
-    doc["_id"] = result.inserted_id
+    # Member + registration fee (Due) + first monthly fee (Due) + registration message, all or nothing
+    monthly_amount = monthly_fee(mt)
+    try:
+        async with media_store.guard(*(content_hash(data) for data in uploads.values())):
+            for field, data in uploads.items():
+                doc[field] = await media_store.put(data)
+            result = await enrollment.enroll(doc, REGISTRATION_FEE, monthly_amount, today_ist())
+    except Exception as e:
+        # No member was created: drop the blobs just stored unless another member has the same content
+        for field in uploads:
+            await _release_media(doc.get(field))
+        if isinstance(e, DuplicateKeyError):
+            raise HTTPException(status_code=409, detail="A member with this phone is already registered")
+        raise
+    # The phone may still map to an earlier member in the identity cache
+    identity_cache.invalidate(result["member"]["_id"], phone_e164=doc["phone_e164"])
+    _invalidate_dashboard()
+    return _doc_to_member_response(result["member"])
 
-    # Create registration fee (Due) and first monthly fee (Due)
-    today = today_ist()
-    due_dt = datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
-    monthly_amount = MONTHLY_FEE_PT if mt == "PT" else MONTHLY_FEE_REGULAR
-    period = today.strftime("%Y-%m")
-    await payments_collection.insert_many([
-        {"member_id": mid, "member_name": doc["name"], "amount": REGISTRATION_FEE, "fee_type": "registration", "period": None, "status": "Due", "due_date": due_dt, "paid_at": None, "created_at": datetime.now(timezone.utc)},
-        {"member_id": mid, "member_name": doc["name"], "amount": monthly_amount, "fee_type": "monthly", "period": period, "status": "Due", "due_date": due_dt, "paid_at": None, "created_at": datetime.now(timezone.utc)},
-    ])
-    _notify_registration(doc["name"], doc["email"], doc["phone"])
-
-    return MemberResponse(
-        id=mid,
-        name=doc["name"],
-        phone=doc["phone"],
-        email=doc["email"],
-        membership_type=mt,
-        batch=doc["batch"].value if isinstance(doc["batch"], Batch) else doc["batch"],
-        status=doc["status"],
-        created_at=doc["created_at"],
-        last_attendance_date=doc.get("last_attendance_date"),
-        workout_schedule=doc.get("workout_schedule"),
-        diet_chart=doc.get("diet_chart"),
-        photo_base64=doc.get("photo_base64"),
-        id_document_base64=doc.get("id_document_base64"),
-        id_document_type=doc.get("id_document_type"),
-    )
+
+async def _today_attendance_map(member_ids: list[str]) -> dict[str, dict]:
+    """Today's (IST) attendance rows for the given members, keyed by member_id: one $in query on member_date_unique."""
+    if not member_ids:
+        return {}
+    date_ist_str = today_ist().strftime("%Y-%m-%d")
+    cursor = attendance_collection.find({"member_id": {"$in": member_ids}, "date_ist": date_ist_str}, ATTENDANCE_TODAY_STATUS)
+    return {doc["member_id"]: doc async for doc in cursor}
+
+
+@app.get("/members/search", response_model=list[MemberResponse])
+async def search_members(q: str, limit: int = 20):
+    """
+    Typeahead: members whose name words start with the query words, or whose phone ends with the
+    query digits (search.py). Best matches first, at most limit (max 50). Brief profile, no media.
+    """
+    from search import MAX_SEARCH_LIMIT, search_members as run_search
+    limit = min(max(1, limit), MAX_SEARCH_LIMIT)
+    docs = await run_search(members_collection, q, limit, projection=member_projection("search_members"))
+    attendance_map = await _today_attendance_map([str(doc["_id"]) for doc in docs])
+    return [_doc_to_member_response(doc, include_photos=False, attendance_map=attendance_map) for doc in docs]
 
 
 @app.get("/members/{member_id}", response_model=MemberResponse)
-async def get_member_by_id(member_id: str):
-    """Get a single member by ID."""
+async def get_member_by_id(member_id: str, include_media: bool = True):
+    """Get a single member by ID. include_media=True also inlines photo/ID document as base64 (read from the media store)."""
     from bson import ObjectId
     try:
         oid = ObjectId(member_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid member ID")
-    doc = await members_collection.find_one({"_id": oid})
+    # Both reads are keyed by the path id, so they run concurrently
+    doc, attendance_map = await asyncio.gather(
+        _find_member({"_id": oid}, "get_member_by_id_media" if include_media else "get_member_by_id"),
+        _today_attendance_map([member_id]),
+    )
     if not doc:
         raise HTTPException(status_code=404, detail="Member not found")
-        
-    date_ist_str = today_ist().strftime("%Y-%m-%d")
-    att_doc = await attendance_collection.find_one({"member_id": member_id, "date_ist": date_ist_str})
-    attendance_map = {member_id: att_doc} if att_doc else None
-    
-    return _doc_to_member_response(doc, attendance_map=attendance_map)
+
+    resp = _doc_to_member_response(doc, attendance_map=attendance_map)
+    if include_media:
+        resp.photo_base64 = await _media_base64(doc, "photo")
+        resp.id_document_base64 = await _media_base64(doc, "id_document")
+    return resp
 
 
 @app.get("/members/{member_id}/attendance-stats")
 async def member_attendance_stats(member_id: str):
-    """Total visits, visits this month, and avg workout duration (minutes) for a member."""
+    """Total visits, visits this month, and avg workout duration (minutes) for a member. Reads one stats document."""
     from bson import ObjectId
     try:
         oid = ObjectId(member_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid member ID")
-    if await members_collection.find_one({"_id": oid}) is None:
+    member, stats = await asyncio.gather(identity_cache.get(oid), read_member_stats(member_stats_collection, member_id))
+    if member is None:
         raise HTTPException(status_code=404, detail="Member not found")
-    total_visits = await attendance_collection.count_documents({"member_id": member_id})
-    today = today_ist()
-    month_start = today.replace(day=1).strftime("%Y-%m-%d")
-    month_end = today.strftime("%Y-%m-%d")
-    visits_this_month = await attendance_collection.count_documents({
-        "member_id": member_id,
-        "date_ist": {"$gte": month_start, "$lte": month_end},
-    })
-    cursor = attendance_collection.find(
-        {"member_id": member_id, "check_out_at_utc": {"$exists": True, "$ne": None}}
-    )
-    durations_min = []
-    async for doc in cursor:
-        try:
-            ci = doc.get("check_in_at_utc") or datetime.fromisoformat(doc.get("check_in_at_ist", ""))
-            co = doc.get("check_out_at_utc") or datetime.fromisoformat(doc.get("check_out_at_ist", ""))
-            if hasattr(ci, "timestamp") and hasattr(co, "timestamp"):
-                durations_min.append((co - ci).total_seconds() / 60)
-        except Exception:
-            pass
-    avg_duration_minutes = round(sum(durations_min) / len(durations_min), 1) if durations_min else None
+    count = stats.get("duration_count", 0)
+    avg_duration_minutes = round(stats["duration_sec_sum"] / count / 60, 1) if count else None
     return {
-        "total_visits": total_visits,
-        "visits_this_month": visits_this_month,
+        "total_visits": stats.get("total_visits", 0),
+        "visits_this_month": stats.get("by_month", {}).get(today_ist().strftime("%Y-%m"), 0),
         "avg_duration_minutes": avg_duration_minutes,
     }
 
 
+@app.get("/members/{member_id}/balance", response_model=MemberBalanceResponse)
+async def member_balance(member_id: str):
+    """Due, overdue and paid-to-date amounts and the oldest unpaid due date for a member. Reads one balance document."""
+    from bson import ObjectId
+    try:
+        oid = ObjectId(member_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid member ID")
+    member, balance = await asyncio.gather(identity_cache.get(oid), ledger.balance(member_id))
+    if member is None:
+        raise HTTPException(status_code=404, detail="Member not found")
+    return MemberBalanceResponse(member_id=member_id, **{k: v for k, v in balance.items() if k != "_id"})
+
+
 @app.get("/members/by-phone/{phone}", response_model=MemberResponse)
 async def get_member_by_phone(phone: str):
-    """For member login: lookup by phone. Phone is normalized (stripped) for lookup."""
-    phone_normalized = phone.strip() if phone else ""
-    if not phone_normalized:
+    """
+    For member login: lookup by phone in any common format ("98765 43210", "+91 98765 43210").
+    The phone resolves to a member id through the identity cache; the profile is then read by _id.
+    """
+    if not phone or not phone.strip():
         raise HTTPException(status_code=400, detail="Phone required")
-    doc = await members_collection.find_one({"phone": phone_normalized})
-    if not doc:
-        # Try with original in case DB has different formatting
-        doc = await members_collection.find_one({"phone": phone})
+    identity = await identity_cache.get_by_phone(_canonical_phone(phone))
+    doc = await _find_member({"_id": identity["_id"]}, "get_member_by_phone") if identity else None
     if not doc:
         raise HTTPException(status_code=404, detail="Member not found")
-        
-    mid = str(doc["_id"])
-    date_ist_str = today_ist().strftime("%Y-%m-%d")
-    att_doc = await attendance_collection.find_one({"member_id": mid, "date_ist": date_ist_str})
-    attendance_map = {mid: att_doc} if att_doc else None
-    
+
+    attendance_map = await _today_attendance_map([str(doc["_id"])])
     return _doc_to_member_response(doc, attendance_map=attendance_map)
 
 
 @app.get("/members", response_model=list[MemberResponse])
-async def list_members(skip: int = 0, limit: int = 100, brief: bool = False):
-    """List members. brief=True omits photo_base64 and id_document_base64 for faster list load. Use skip/limit for pagination."""
+async def list_members(response: Response, skip: int = 0, limit: int = 100, brief: bool = False, cursor: str | None = None):
+    """
+    List members, newest first. brief=True omits photo/ID document URLs and type. Media bytes are never inlined: fetch photo_url.
+    Paginate with limit and the X-Next-Cursor response header (?cursor=...); skip still works but is slow for deep pages.
+    """
     skip = max(0, skip)
     limit = min(max(1, limit), 500)  # Cap at 500 for performance/security
-    cursor = members_collection.find().sort("created_at", -1).skip(skip).limit(limit)
-    
-    # Fetch today's attendance for these members
-    date_ist_str = today_ist().strftime("%Y-%m-%d")
-    att_cursor = attendance_collection.find({"date_ist": date_ist_str})
-    attendance_map = {}
-    async for doc in att_cursor:
-        attendance_map[doc["member_id"]] = doc
-
-    members = []
-    async for doc in cursor:
-        members.append(
-            _doc_to_member_response(doc, include_photos=not brief, attendance_map=attendance_map)
-        )
-    return members
+    docs = await _paginate(
+        response, members_collection, {}, [("created_at", -1)], limit, cursor,
+        stages=member_stages("list_members_brief" if brief else "list_members"), skip=skip,
+    )
+    # Today's check-in/out for this page only (not every check-in of the day)
+    attendance_map = await _today_attendance_map([str(doc["_id"]) for doc in docs])
+    return _rows_response(response, [_member_row(doc, include_photos=not brief, attendance_map=attendance_map) for doc in docs])
 
 
 @app.patch("/members/{member_id}", response_model=MemberResponse)
@@ -432,7 +626,8 @@ async def update_member(member_id: str, body: MemberUpdate):
     if body.name is not None:
         update["name"] = body.name
     if body.phone is not None:
-        update["phone"] = body.phone
+        update["phone"] = body.phone.strip()
+        update["phone_e164"] = _canonical_phone(update["phone"])
     if body.email is not None:
         update["email"] = body.email
     if body.membership_type is not None:
@@ -446,20 +641,32 @@ async def update_member(member_id: str, body: MemberUpdate):
     if body.diet_chart is not None:
         update["diet_chart"] = body.diet_chart
     if not update:
-        result = await members_collection.find_one({"_id": oid})
+        result = await _find_member({"_id": oid}, "update_member")
         if not result:
             raise HTTPException(status_code=404, detail="Member not found")
         return _doc_to_member_response(result)
-    result = await members_collection.find_one_and_update(
-        {"_id": oid},
-        {"$set": update},
-        return_document=True,
-    )
+    try:
+        updated = await members_collection.find_one_and_update(
+            {"_id": oid},
+            {"$set": update},
+            projection={"name": 1, "phone_e164": 1},
+            return_document=True,
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="A member with this phone is already registered")
+    _invalidate_dashboard()
+    identity_cache.invalidate(oid)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Member not found")
+    if "name" in update or "phone" in update:
+        tokens = member_search_tokens(updated.get("name"), updated.get("phone_e164"))
+        await members_collection.update_one({"_id": oid}, {"$set": {"search_tokens": tokens}})
+    result = await _find_member({"_id": oid}, "update_member")
     if not result:
         raise HTTPException(status_code=404, detail="Member not found")
         
     date_ist_str = today_ist().strftime("%Y-%m-%d")
-    att_doc = await attendance_collection.find_one({"member_id": member_id, "date_ist": date_ist_str})
+    att_doc = await attendance_collection.find_one({"member_id": member_id, "date_ist": date_ist_str}, ATTENDANCE_TODAY_STATUS)
     attendance_map = {member_id: att_doc} if att_doc else None
     
     return _doc_to_member_response(result, attendance_map=attendance_map)
@@ -474,15 +681,19 @@ async def update_member_photo(member_id: str, body: PhotoUpdate):
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid member ID")
     if body.photo_base64 is None:
-        await members_collection.update_one({"_id": oid}, {"$unset": {"photo_base64": ""}})
+        before = await members_collection.find_one_and_update({"_id": oid}, {"$unset": {"photo": "", "photo_base64": ""}}, projection={"photo": 1})
     else:
-        await members_collection.update_one({"_id": oid}, {"$set": {"photo_base64": body.photo_base64}})
-    doc = await members_collection.find_one({"_id": oid})
+        before = await _attach_media(oid, "photo", body.photo_base64, {}, {"photo_base64": ""})
+    if not before:
+        raise HTTPException(status_code=404, detail="Member not found")
+    identity_cache.invalidate(oid)
+    await _release_media(before.get("photo"))
+    doc = await _find_member({"_id": oid}, "update_member_photo")
     if not doc:
         raise HTTPException(status_code=404, detail="Member not found")
         
     date_ist_str = today_ist().strftime("%Y-%m-%d")
-    att_doc = await attendance_collection.find_one({"member_id": member_id, "date_ist": date_ist_str})
+    att_doc = await attendance_collection.find_one({"member_id": member_id, "date_ist": date_ist_str}, ATTENDANCE_TODAY_STATUS)
     attendance_map = {member_id: att_doc} if att_doc else None
     
     return _doc_to_member_response(doc, attendance_map=attendance_map)
@@ -497,53 +708,110 @@ async def update_member_id_document(member_id: str, body: IdDocumentUpdate):
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid member ID")
     if body.id_document_base64 is None:
-        await members_collection.update_one({"_id": oid}, {"$unset": {"id_document_base64": "", "id_document_type": ""}})
+        update = {"$unset": {"id_document": "", "id_document_base64": "", "id_document_type": ""}}
+        before = await members_collection.find_one_and_update({"_id": oid}, update, projection={"id_document": 1})
     else:
-        update = {"id_document_base64": body.id_document_base64}
-        if body.id_document_type is not None:
-            update["id_document_type"] = body.id_document_type
-        await members_collection.update_one({"_id": oid}, {"$set": update})
-    doc = await members_collection.find_one({"_id": oid})
+        fields = {"id_document_type": body.id_document_type} if body.id_document_type is not None else {}
+        before = await _attach_media(oid, "id_document", body.id_document_base64, fields, {"id_document_base64": ""})
+    if not before:
+        raise HTTPException(status_code=404, detail="Member not found")
+    identity_cache.invalidate(oid)
+    await _release_media(before.get("id_document"))
+    doc = await _find_member({"_id": oid}, "update_member_id_document")
     if not doc:
         raise HTTPException(status_code=404, detail="Member not found")
         
     date_ist_str = today_ist().strftime("%Y-%m-%d")
-    att_doc = await attendance_collection.find_one({"member_id": member_id, "date_ist": date_ist_str})
+    att_doc = await attendance_collection.find_one({"member_id": member_id, "date_ist": date_ist_str}, ATTENDANCE_TODAY_STATUS)
     attendance_map = {member_id: att_doc} if att_doc else None
     
     return _doc_to_member_response(doc, attendance_map=attendance_map)
 
 
-def _doc_to_member_response(doc, include_photos: bool = True, attendance_map: dict | None = None) -> MemberResponse:
+@app.get("/members/{member_id}/photo")
+async def get_member_photo(member_id: str, request: Request):
+    """Member photo bytes. Supports If-None-Match (ETag = content SHA-256) and single-range Range requests."""
+    return await _serve_member_media(member_id, "photo", request)
+
+
+@app.get("/members/{member_id}/id-document")
+async def get_member_id_document(member_id: str, request: Request):
+    """Identity document bytes (PDF or image). Same caching/Range behaviour as the photo endpoint."""
+    return await _serve_member_media(member_id, "id_document", request)
+
+
+async def _serve_member_media(member_id: str, field: str, request: Request) -> Response:
+    from bson import ObjectId
+    from media import parse_range
+    try:
+        oid = ObjectId(member_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid member ID")
+    doc = await members_collection.find_one({"_id": oid}, {field: 1, f"{field}_base64": 1})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Member not found")
+    meta, inline = _load_member_media(doc, field)
+    if not meta:
+        raise HTTPException(status_code=404, detail="No photo" if field == "photo" else "No ID document")
+    etag = f'"{meta["sha256"]}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    size = meta["size"]
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        body = inline if inline is not None else await media_store.read(meta["sha256"])
+        return Response(content=body, media_type=meta["content_type"], headers=headers)
+    start, end = byte_range
+    body = inline[start:end + 1] if inline is not None else await media_store.read(meta["sha256"], start, end)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content=body, status_code=206, media_type=meta["content_type"], headers=headers)
+
+
+def _member_row(doc, include_photos: bool = True, attendance_map: dict | None = None) -> dict:
+    """MemberResponse-shaped dict (fields in model order) for a member document."""
     today_status = None
+    mid = str(doc["_id"])
     if attendance_map:
-        mid = str(doc["_id"])
         if mid in attendance_map:
             rec = attendance_map[mid]
-            today_status = TodayAttendance(
-                checked_in=True,
-                checked_out=bool(rec.get("check_out_at_ist")),
-                check_in_time=rec.get("check_in_at_ist"),
-                check_out_time=rec.get("check_out_at_ist"),
-            )
-    
-    return MemberResponse(
-                id=str(doc["_id"]),
-                name=doc["name"],
-                phone=doc["phone"],
-                email=doc["email"],
-                membership_type=doc["membership_type"] if isinstance(doc["membership_type"], str) else doc["membership_type"].value,
-                batch=doc["batch"] if isinstance(doc["batch"], str) else doc["batch"].value,
-                status=doc.get("status", "Active"),
-                created_at=doc["created_at"],
-        last_attendance_date=_to_date(doc.get("last_attendance_date")),
-        workout_schedule=doc.get("workout_schedule"),
-        diet_chart=doc.get("diet_chart"),
-        photo_base64=doc.get("photo_base64") if include_photos else None,
-        id_document_base64=doc.get("id_document_base64") if include_photos else None,
-        id_document_type=doc.get("id_document_type") if include_photos else None,
-        today_status=today_status,
-    )
+            today_status = {
+                "checked_in": True,
+                "checked_out": rec.get("check_out_at_utc") is not None,
+                "check_in_time": ist_iso(rec["check_in_at_utc"]),
+                "check_out_time": ist_iso(rec["check_out_at_utc"]) if rec.get("check_out_at_utc") else None,
+            }
+
+    # Members not moved to the media store yet: the blob itself (media profile) or its flag (full profile)
+    has_photo = bool(doc.get("photo") or doc.get("photo_base64") or doc.get("has_legacy_photo"))
+    has_id_document = bool(doc.get("id_document") or doc.get("id_document_base64") or doc.get("has_legacy_id_document"))
+    return {
+        "id": mid,
+        "name": doc["name"],
+        "phone": doc["phone"],
+        "email": doc["email"],
+        "membership_type": doc["membership_type"] if isinstance(doc["membership_type"], str) else doc["membership_type"].value,
+        "batch": doc["batch"] if isinstance(doc["batch"], str) else doc["batch"].value,
+        "status": doc.get("status", "Active"),
+        "created_at": doc["created_at"],
+        "last_attendance_date": _to_date(doc.get("last_attendance_date")),
+        "workout_schedule": doc.get("workout_schedule"),
+        "diet_chart": doc.get("diet_chart"),
+        "photo_url": f"/members/{mid}/photo" if include_photos and has_photo else None,
+        "id_document_url": f"/members/{mid}/id-document" if include_photos and has_id_document else None,
+        "photo_base64": None,
+        "id_document_base64": None,
+        "id_document_type": doc.get("id_document_type") if include_photos else None,
+        "today_status": today_status,
+    }
+
+
+def _doc_to_member_response(doc, include_photos: bool = True, attendance_map: dict | None = None) -> MemberResponse:
+    return MemberResponse(**_member_row(doc, include_photos=include_photos, attendance_map=attendance_map))
 
 
 def _to_date(v):
@@ -553,6 +821,79 @@ def _to_date(v):
     return v.date() if hasattr(v, "date") else v
 
 
+# ---------- Member media (photo, ID document) ----------
+
+def _decode_upload(data_base64: str) -> bytes:
+    """Bytes of a base64 upload; 422 if it is not valid base64 or is empty."""
+    try:
+        data = decode_base64(data_base64)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid base64 file data")
+    if not data:
+        raise HTTPException(status_code=422, detail="Empty file")
+    return data
+
+
+async def _attach_media(oid, field: str, data_base64: str, set_fields: dict, unset_fields: dict) -> dict | None:
+    """
+    Store an upload and point the member's field at it. Returns the member's previous field
+    (None if there is no such member, in which case the new blob is released again).
+    """
+    data = _decode_upload(data_base64)
+    async with media_store.guard(content_hash(data)):
+        meta = await media_store.put(data)
+        before = await members_collection.find_one_and_update(
+            {"_id": oid}, {"$set": {field: meta, **set_fields}, "$unset": unset_fields}, projection={field: 1}
+        )
+    if before is None:
+        await _release_media(meta)
+    return before
+
+
+async def _release_media(meta: dict | None):
+    """Delete a replaced/cleared blob unless a member still references the same content."""
+    if not meta:
+        return
+    sha256 = meta["sha256"]
+    async with media_store.guard(sha256):
+        still_used = await members_collection.find_one(
+            {"$or": [{"photo.sha256": sha256}, {"id_document.sha256": sha256}]}, {"_id": 1}
+        )
+        if not still_used:
+            await media_store.delete(sha256)
+
+
+def _load_member_media(doc: dict, field: str) -> tuple[dict | None, bytes | None]:
+    """
+    (descriptor, inline bytes) for field "photo" or "id_document".
+    Migrated members return (descriptor, None): read bytes from the media store.
+    Members not yet migrated still carry <field>_base64: decode it in place.
+    """
+    import hashlib
+    from media import sniff_content_type
+    if doc.get(field):
+        return doc[field], None
+    legacy = doc.get(f"{field}_base64")
+    if not legacy:
+        return None, None
+    try:
+        data = decode_base64(legacy)
+    except ValueError:
+        return None, None
+    return {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data), "content_type": sniff_content_type(data)}, data
+
+
+async def _media_base64(doc: dict, field: str) -> str | None:
+    """Base64 of a member's photo/ID document, for clients that still expect it inline."""
+    import base64
+    if doc.get(f"{field}_base64"):
+        return doc[f"{field}_base64"]
+    meta = doc.get(field)
+    if not meta:
+        return None
+    return base64.b64encode(await media_store.read(meta["sha256"])).decode("ascii")
+
+
 # ---------- Attendance ----------
 
 
@@ -560,7 +901,12 @@ def _to_date(v):
 
 @app.post("/attendance/check-in/{member_id}", response_model=AttendanceRecord)
 async def check_in(member_id: str):
-    """Record check-in in IST. One check-in per member per calendar day (IST)."""
+    """
+    Record check-in in IST. One check-in per member per calendar day (IST).
+    Race-free: the unique (member_id, date_ist) index rejects a second check-in, and the batch
+    capacity counter (daily_attendance_stats, see rollups.reserve_check_in) is taken atomically.
+    Independent steps run together, so a check-in is two round-trip stages instead of five.
+    """
     from bson import ObjectId
     from datetime import timezone
 
@@ -570,52 +916,67 @@ async def check_in(member_id: str):
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid member ID")
 
-        member = await members_collection.find_one({"_id": oid})
-        if not member:
-            raise HTTPException(status_code=404, detail="Member not found")
-
         now = now_ist()
         date_ist_str = now.strftime("%Y-%m-%d")
         batch = batch_from_ist(now)
+        capacity = BATCH_CAPACITY.get(batch) if BATCH_CAPACITY else None
 
-        already_today = await attendance_collection.find_one(
-            {"member_id": member_id, "date_ist": date_ist_str},
+        member, reserved = await asyncio.gather(
+            identity_cache.get(oid),
+            reserve_check_in(daily_stats_collection, date_ist_str, batch, capacity),
         )
-        if already_today:
-            raise HTTPException(
-                status_code=400,
-                detail="Already checked in today. One check-in per day allowed.",
-            )
-
-        if BATCH_CAPACITY and batch in BATCH_CAPACITY:
-            cap = BATCH_CAPACITY[batch]
-            count_today_batch = await attendance_collection.count_documents(
-                {"date_ist": date_ist_str, "batch": batch}
-            )
-            if count_today_batch >= cap:
+        if not member:
+            if reserved:
+                await record_check_in(daily_stats_collection, date_ist_str, batch, delta=-1)
+            raise HTTPException(status_code=404, detail="Member not found")
+        if not reserved:
+            # Full batch; a member who already checked in should hear that instead
+            if await attendance_collection.find_one({"member_id": member_id, "date_ist": date_ist_str}, {"_id": 1}):
                 raise HTTPException(
                     status_code=400,
-                    detail=f"Batch full. {batch} batch has reached capacity ({cap}). Try another batch.",
+                    detail="Already checked in today. One check-in per day allowed.",
                 )
+            raise HTTPException(
+                status_code=400,
+                detail=f"Batch full. {batch} batch has reached capacity ({capacity}). Try another batch.",
+            )
 
         check_in_at_utc = now.astimezone(timezone.utc)
         doc = {
             "member_id": member_id,
             "check_in_at_utc": check_in_at_utc,
-            "check_in_at_ist": now.isoformat(),
             "date_ist": date_ist_str,
             "batch": batch,
             "member_name": member.get("name", ""),
             "member_phone": member.get("phone"),
         }
-        result = await attendance_collection.insert_one(doc)
-        # Store as datetime at midnight UTC so MongoDB (BSON) can encode it
+        # Store as datetime at midnight UTC so MongoDB (BSON) can encode it. Setting it is harmless
+        # if the insert turns out to be a duplicate: the member did check in today.
         today_date = now.date()
         last_attendance_dt = datetime(today_date.year, today_date.month, today_date.day, tzinfo=timezone.utc)
-        await members_collection.update_one(
-            {"_id": oid},
-            {"$set": {"last_attendance_date": last_attendance_dt}},
+        result, touched, counted = await asyncio.gather(
+            attendance_collection.insert_one(doc),
+            members_collection.update_one({"_id": oid}, {"$set": {"last_attendance_date": last_attendance_dt}}),
+            record_member_visit(member_stats_collection, member_id, date_ist_str),
+            return_exceptions=True,
         )
+        if isinstance(result, BaseException):
+            # Give the capacity back and take the visit off the member's stats
+            await asyncio.gather(
+                record_check_in(daily_stats_collection, date_ist_str, batch, delta=-1),
+                *([] if isinstance(counted, BaseException) else [record_member_visit(member_stats_collection, member_id, date_ist_str, delta=-1)]),
+            )
+            if isinstance(result, DuplicateKeyError):
+                # Second tap (possibly concurrent): unique (member_id, date_ist) index rejected it
+                raise HTTPException(
+                    status_code=400,
+                    detail="Already checked in today. One check-in per day allowed.",
+                )
+            raise result
+        for outcome in (touched, counted):
+            if isinstance(outcome, BaseException):
+                raise outcome
+        _invalidate_dashboard()
 
         return AttendanceRecord(
             id=str(result.inserted_id),
@@ -633,73 +994,61 @@ async def check_in(member_id: str):
         raise HTTPException(status_code=500, detail=f"Server error during check-in: {e!s}")
 
 
-async def _attendance_docs_to_records(cursor) -> list:
-    out = []
-    async for doc in cursor:
-        # Prefer the IST string if available (it was stored as now_ist().isoformat())
-        # Otherwise fallback to utc field.
-        check_in_at_ist = None
-        if doc.get("check_in_at_ist"):
-            try:
-                check_in_at_ist = datetime.fromisoformat(doc["check_in_at_ist"])
-            except ValueError:
-                pass
-        
-        if not check_in_at_ist:
-            check_in_at_ist = doc["check_in_at_utc"]
-            # If naive, it's UTC from Mongo. Convert to IST.
-            if hasattr(check_in_at_ist, "tzinfo") and check_in_at_ist.tzinfo is None:
-                from datetime import timezone
-                check_in_at_ist = check_in_at_ist.replace(tzinfo=timezone.utc).astimezone(IST)
-            elif hasattr(check_in_at_ist, "astimezone"):
-                check_in_at_ist = check_in_at_ist.astimezone(IST)
-
-        check_out_at = None
-        if doc.get("check_out_at_ist"):
-            try:
-                check_out_at = datetime.fromisoformat(doc["check_out_at_ist"])
-            except ValueError:
-                pass
-        
-        if not check_out_at and doc.get("check_out_at_utc"):
-            check_out_at = doc["check_out_at_utc"]
-            # If naive, it's UTC. Convert to IST.
-            if hasattr(check_out_at, "tzinfo") and check_out_at.tzinfo is None:
-                from datetime import timezone
-                check_out_at = check_out_at.replace(tzinfo=timezone.utc).astimezone(IST)
-            elif hasattr(check_out_at, "astimezone"):
-                check_out_at = check_out_at.astimezone(IST)
-
-        out.append(
-            AttendanceRecord(
-                id=str(doc["_id"]),
-                member_id=doc["member_id"],
-                member_name=doc.get("member_name", ""),
-                member_phone=doc.get("member_phone"),
-                check_in_at=check_in_at_ist,
-                date_ist=doc["date_ist"],
-                batch=doc["batch"],
-                check_out_at=check_out_at,
-            )
-        )
-    return out
+# Attendance rows are stored with UTC datetimes only (check_in_at_utc, check_out_at_utc). List
+# endpoints format them in MongoDB and send the rows as-is; single records go through AttendanceRecord.
+ATTENDANCE_FIELDS = ["id", "member_id", "member_name", "member_phone", "check_in_at", "date_ist", "batch", "check_out_at"]
+ATTENDANCE_RECORD_STAGES = [{"$project": {
+    "member_id": 1,
+    "member_name": {"$ifNull": ["$member_name", ""]},
+    "member_phone": {"$ifNull": ["$member_phone", None]},
+    "check_in_at": {"$dateToString": {"date": "$check_in_at_utc", "format": IST_ISO_FORMAT, "timezone": "Asia/Kolkata"}},
+    "date_ist": 1,
+    "batch": 1,
+    "check_out_at": {"$dateToString": {"date": "$check_out_at_utc", "format": IST_ISO_FORMAT, "timezone": "Asia/Kolkata"}},
+    "check_in_at_utc": 1,  # sort key, for the next-page cursor
+}}]
+
+
+def _attendance_record(doc: dict) -> AttendanceRecord:
+    return AttendanceRecord(
+        id=str(doc["_id"]),
+        member_id=doc["member_id"],
+        member_name=doc.get("member_name", ""),
+        member_phone=doc.get("member_phone"),
+        check_in_at=doc["check_in_at_utc"],
+        date_ist=doc["date_ist"],
+        batch=doc["batch"],
+        check_out_at=doc.get("check_out_at_utc"),
+    )
+
+
+def _attendance_row(doc: dict) -> dict:
+    """AttendanceRecord-shaped dict from a document formatted by ATTENDANCE_RECORD_STAGES."""
+    doc["id"] = str(doc["_id"])
+    return {field: doc.get(field) for field in ATTENDANCE_FIELDS}
+
+
+def _attendance_rows(docs: list[dict]) -> list[dict]:
+    return [_attendance_row(doc) for doc in docs]
+
+
+def _rows_response(response: Response, rows: list[dict]) -> FastJSONResponse:
+    """JSON list response for rows already in response-model shape (skips re-validating every row, see fastjson.py)."""
+    cursor = response.headers.get(NEXT_CURSOR_HEADER)
+    return FastJSONResponse(rows, headers={NEXT_CURSOR_HEADER: cursor} if cursor else None)
 
 
 @app.get("/attendance/summary")
 async def attendance_summary():
-    """Today's check-ins, currently in gym, this week count, average daily (for dashboard cards)."""
+    """Today's check-ins, currently in gym, this week count, average daily (for dashboard cards). Reads <= 7 rollup docs."""
     from datetime import timedelta
     date_ist_str = today_ist().strftime("%Y-%m-%d")
-    today_count = await attendance_collection.count_documents({"date_ist": date_ist_str})
-    today_check_outs = await attendance_collection.count_documents({
-        "date_ist": date_ist_str,
-        "check_out_at_ist": {"$exists": True, "$ne": None, "$ne": ""},
-    })
-    currently_in = today_count - today_check_outs
     week_start = (today_ist() - timedelta(days=6)).strftime("%Y-%m-%d")
-    this_week = await attendance_collection.count_documents({
-        "date_ist": {"$gte": week_start, "$lte": date_ist_str},
-    })
+    days = await read_daily_stats(daily_stats_collection, week_start, date_ist_str)
+    today = days.get(date_ist_str, {})
+    today_count = today.get("check_ins", 0)
+    currently_in = today_count - today.get("check_outs", 0)
+    this_week = sum(d.get("check_ins", 0) for d in days.values())
     average_daily = round(this_week / 7.0, 1) if this_week else 0
     return {
         "today_check_ins": today_count,
@@ -713,7 +1062,7 @@ async def attendance_summary():
 async def attendance_today():
     """All check-ins for current date in IST."""
     date_ist_str = today_ist().strftime("%Y-%m-%d")
-    return await attendance_by_date(date_ist_str)
+    return FastJSONResponse(await attendance_by_date(date_ist_str))
 
 
 @app.get("/attendance/by-date", response_model=list[AttendanceRecord])
@@ -721,20 +1070,27 @@ async def attendance_by_date_endpoint(date: str):
     """All check-ins for a given date (YYYY-MM-DD). Use for date picker."""
     if len(date) != 10 or date[4] != "-" or date[7] != "-":
         raise HTTPException(status_code=400, detail="date must be YYYY-MM-DD")
-    return await attendance_by_date(date)
+    return FastJSONResponse(await attendance_by_date(date))
 
 
 @app.get("/attendance/by-date-range", response_model=list[AttendanceRecord])
-async def attendance_by_date_range(date_from: str, date_to: str):
-    """All check-ins in date range (YYYY-MM-DD). For daily/monthly/historical view."""
+async def attendance_by_date_range(response: Response, date_from: str, date_to: str, limit: int = 1000, cursor: str | None = None, stream: str | None = None):
+    """
+    Check-ins in date range (YYYY-MM-DD), by date, batch and time. For daily/monthly/historical view.
+    Up to limit (max 1000) rows per call; the X-Next-Cursor response header continues (?cursor=...).
+    stream=ndjson: every row in the range instead (limit ignored), one JSON object per line.
+    """
     if len(date_from) != 10 or date_from[4] != "-" or date_from[7] != "-" or len(date_to) != 10 or date_to[4] != "-" or date_to[7] != "-":
         raise HTTPException(status_code=400, detail="date_from and date_to must be YYYY-MM-DD")
     if date_from > date_to:
         raise HTTPException(status_code=400, detail="date_from must be <= date_to")
-    cursor = attendance_collection.find(
-        {"date_ist": {"$gte": date_from, "$lte": date_to}}
-    ).sort([("date_ist", 1), ("batch", 1), ("check_in_at_utc", 1)])
-    return await _attendance_docs_to_records(cursor)
+    q = {"date_ist": {"$gte": date_from, "$lte": date_to}}
+    sort = [("date_ist", 1), ("batch", 1), ("check_in_at_utc", 1)]
+    if _stream_mode(stream):
+        return _ndjson_response(attendance_collection, q, sort, _attendance_row, cursor, stages=ATTENDANCE_RECORD_STAGES)
+    limit = min(max(1, limit), MAX_PAGE_SIZE)
+    docs = await _paginate(response, attendance_collection, q, sort, limit, cursor, stages=ATTENDANCE_RECORD_STAGES)
+    return _rows_response(response, _attendance_rows(docs))
 
 
 @app.post("/attendance/check-out/{member_id}", response_model=AttendanceRecord)
@@ -746,37 +1102,291 @@ async def check_out(member_id: str):
         oid = ObjectId(member_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid member ID")
-    member = await members_collection.find_one({"_id": oid})
+    member = await identity_cache.get(oid)
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
     date_ist_str = today_ist().strftime("%Y-%m-%d")
     doc = await attendance_collection.find_one({"member_id": member_id, "date_ist": date_ist_str})
     if not doc:
         raise HTTPException(status_code=400, detail="No check-in found for today. Check in first.")
-    if doc.get("check_out_at_ist"):
+    if doc.get("check_out_at_utc"):
         raise HTTPException(status_code=400, detail="Already checked out today.")
-    now = now_ist()
-    check_out_utc = now.astimezone(timezone.utc)
-    await attendance_collection.update_one(
-        {"_id": doc["_id"]},
-        {"$set": {"check_out_at_ist": now.isoformat(), "check_out_at_utc": check_out_utc}},
+    check_out_utc = now_ist().astimezone(timezone.utc)
+    seconds = duration_sec(doc["check_in_at_utc"], check_out_utc)
+    result = await attendance_collection.update_one(
+        {"_id": doc["_id"], "check_out_at_utc": None},
+        {"$set": {"check_out_at_utc": check_out_utc, "duration_sec": seconds}},
+    )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=400, detail="Already checked out today.")  # concurrent second tap
+    await asyncio.gather(
+        record_check_out(daily_stats_collection, doc["date_ist"], doc["batch"]),
+        record_member_duration(member_stats_collection, member_id, seconds),
     )
-    updated = await attendance_collection.find_one({"_id": doc["_id"]})
-    # Build record from single doc (cursor helper expects async iterable)
-    records = await _attendance_docs_to_records(
-        _async_iter([updated])
+    _invalidate_dashboard()
+    return _attendance_record({**doc, "check_out_at_utc": check_out_utc})
+
+
+# Bulk events further in the future than this (kiosk clock skew) are rejected
+BULK_EVENT_MAX_SKEW = timedelta(minutes=5)
+
+
+async def _claim_event_keys(keys: list[str]) -> set[str]:
+    """Insert claims for bulk attendance idempotency keys; returns the keys another request claimed first."""
+    from datetime import timezone
+    from pymongo.errors import BulkWriteError
+    if not keys:
+        return set()
+    now = datetime.now(timezone.utc)
+    try:
+        await attendance_event_keys_collection.insert_many([{"_id": key, "result": None, "created_at": now} for key in keys], ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in errors):
+            raise
+        return {keys[err["index"]] for err in errors}
+    return set()
+
+
+@app.post("/attendance/bulk")
+async def attendance_bulk(body: AttendanceBulkRequest):
+    """
+    Replay buffered kiosk taps (check-in / check-out) in one call. Each event is filed under the IST
+    date and batch of its own time `at`, not server time. idempotency_key makes replays safe: an event
+    already applied returns status "duplicate" with its original result.
+    Round-trips: one stage of reads (keys, members via $in, existing attendance), one insert claiming
+    the keys to apply, one unordered bulk_write (inserts of check-ins plus a conditional update per
+    check-out of an earlier row, applied only while the row is still open), one $in read of the
+    check-outs when some did not apply, then rollups / last_attendance_date / key bookkeeping together.
+    Batch capacity is not enforced: these taps already happened at the desk.
+    Returns {"results": [{"idempotency_key", "status", ...} in request order], "counts": {status: n}}.
+    Status: ok | duplicate | invalid_member | invalid_time | already_checked_in | no_check_in | already_checked_out | error.
+    """
+    from bson import ObjectId
+    from datetime import timezone
+    from pymongo import DeleteOne, InsertOne, UpdateOne
+    from pymongo.errors import BulkWriteError
+
+    now = now_ist()
+    results: dict[str, dict] = {}
+    events: list[tuple[AttendanceEvent, datetime]] = []
+    keys_in_request = set()
+    for ev in body.events:
+        if ev.idempotency_key in keys_in_request:
+            continue  # same key twice in one request: first one wins
+        keys_in_request.add(ev.idempotency_key)
+        at = (ev.at.replace(tzinfo=IST) if ev.at.tzinfo is None else ev.at).astimezone(IST)
+        if at > now + BULK_EVENT_MAX_SKEW:
+            results[ev.idempotency_key] = {"status": "invalid_time"}
+            continue
+        events.append((ev, at))
+
+    oids = {}
+    for ev, _ in events:
+        try:
+            oids[ev.member_id] = ObjectId(ev.member_id)
+        except Exception:
+            pass
+    day_keys = {(ev.member_id, at.strftime("%Y-%m-%d")) for ev, at in events}
+    seen_keys, members_by_id, existing = await asyncio.gather(
+        _find_list(attendance_event_keys_collection, {"_id": {"$in": [ev.idempotency_key for ev, _ in events]}}),
+        identity_cache.get_many(oids.values()),
+        _find_list(attendance_collection, {"$or": [{"member_id": m, "date_ist": d} for m, d in day_keys]} if day_keys else None,
+                   {"member_id": 1, "date_ist": 1, "batch": 1, "check_in_at_utc": 1, "check_out_at_utc": 1}),
     )
-    return records[0]
+    seen = {doc["_id"]: doc["result"] or {} for doc in seen_keys}  # {} while another request is applying it
+    attendance_by_day = {(d["member_id"], d["date_ist"]): d for d in existing}
+
+    # Plan writes in event-time order. A check-in and check-out for the same member and day in this
+    # request become one insert (unordered bulk writes have no order between operations).
+    inserts: dict[tuple, dict] = {}
+    insert_keys: dict[tuple, list[str]] = {}
+    checkouts: dict[tuple, tuple[str, datetime]] = {}
+    for ev, at in sorted(events, key=lambda pair: pair[1]):
+        key = ev.idempotency_key
+        if key in seen:
+            results[key] = {**seen[key], "status": "duplicate"}
+            continue
+        member = members_by_id.get(ev.member_id)
+        if member is None:
+            results[key] = {"status": "invalid_member"}
+            continue
+        day = (ev.member_id, at.strftime("%Y-%m-%d"))
+        stored = attendance_by_day.get(day)
+        if ev.type == AttendanceEventType.check_in:
+            if stored or day in inserts:
+                results[key] = {"status": "already_checked_in", "date_ist": day[1]}
+                continue
+            inserts[day] = {
+                "member_id": ev.member_id,
+                "check_in_at_utc": at.astimezone(timezone.utc),
+                "date_ist": day[1],
+                "batch": batch_from_ist(at),
+                "member_name": member.get("name", ""),
+                "member_phone": member.get("phone"),
+            }
+            insert_keys[day] = [key]
+            results[key] = {"status": "ok", "date_ist": day[1], "batch": inserts[day]["batch"]}
+        else:
+            if day in inserts:
+                if "check_out_at_utc" in inserts[day]:
+                    results[key] = {"status": "already_checked_out", "date_ist": day[1]}
+                    continue
+                inserts[day].update({
+                    "check_out_at_utc": at.astimezone(timezone.utc),
+                    "duration_sec": duration_sec(inserts[day]["check_in_at_utc"], at.astimezone(timezone.utc)),
+                })
+                insert_keys[day].append(key)
+                results[key] = {"status": "ok", "date_ist": day[1], "batch": inserts[day]["batch"]}
+            elif not stored:
+                results[key] = {"status": "no_check_in", "date_ist": day[1]}
+            elif stored.get("check_out_at_utc") or day in checkouts:
+                results[key] = {"status": "already_checked_out", "date_ist": day[1]}
+            else:
+                checkouts[day] = (key, at)
+                results[key] = {"status": "ok", "date_ist": day[1], "batch": stored["batch"], "attendance_id": str(stored["_id"])}
+
+    # Claim the keys of the events about to be applied before writing anything: of two concurrent
+    # replays of the same taps, only the request whose claim lands applies them; the other reports
+    # them as duplicates. Claims carry result None until the writes are done.
+    planned = [key for key, res in results.items() if res["status"] == "ok" and key not in seen]
+    lost = await _claim_event_keys(planned)
+    if lost:
+        for day in [day for day, keys in insert_keys.items() if lost.intersection(keys)]:
+            del inserts[day]
+            for key in insert_keys.pop(day):
+                # A check-in merged with its check-out: the other half cannot be applied alone
+                results[key] = {"status": "duplicate", "date_ist": day[1]} if key in lost else {
+                    "status": "error", "date_ist": day[1], "detail": "Replayed concurrently; retry",
+                }
+        for day in [day for day, (key, _) in checkouts.items() if key in lost]:
+            results[checkouts.pop(day)[0]] = {"status": "duplicate", "date_ist": day[1]}
+
+    insert_ops, insert_op_keys = [], []
+    for day, doc in inserts.items():
+        doc["_id"] = ObjectId()
+        insert_ops.append(InsertOne(doc))
+        insert_op_keys.append(insert_keys[day])
+        for key in insert_keys[day]:
+            results[key]["attendance_id"] = str(doc["_id"])
+    checkout_ops, checkout_days = [], list(checkouts)
+    checkout_at: dict[tuple, datetime] = {}
+    checkout_seconds: dict[tuple, int] = {}
+    for day in checkout_days:
+        at = checkouts[day][1].astimezone(timezone.utc)
+        # Millisecond precision, as MongoDB stores it, so the value read back below compares equal
+        checkout_at[day] = at.replace(microsecond=at.microsecond // 1000 * 1000)
+        checkout_seconds[day] = duration_sec(attendance_by_day[day]["check_in_at_utc"], checkout_at[day])
+        checkout_ops.append(UpdateOne(
+            {"_id": attendance_by_day[day]["_id"], "check_out_at_utc": None},
+            {"$set": {"check_out_at_utc": checkout_at[day], "duration_sec": checkout_seconds[day]}},
+        ))
+
+    failed_inserts: set[int] = set()
+    failed_checkouts: set[tuple] = set()
+    modified = len(checkout_ops)
+    try:
+        if insert_ops or checkout_ops:
+            try:
+                result = await attendance_collection.bulk_write(insert_ops + checkout_ops, ordered=False)
+                modified = result.modified_count
+            except BulkWriteError as e:
+                modified = e.details.get("nModified", 0)
+                for err in e.details.get("writeErrors", []):
+                    index = err["index"]
+                    if index >= len(insert_ops):
+                        day = checkout_days[index - len(insert_ops)]
+                        failed_checkouts.add(day)
+                        key = checkouts[day][0]
+                        results[key] = {"status": "error", "date_ist": day[1], "detail": err.get("errmsg", "")}
+                        continue
+                    # A check-in written since the read above, or an error
+                    failed_inserts.add(index)
+                    for key in insert_op_keys[index]:
+                        duplicate = err.get("code") == 11000
+                        results[key] = {"status": "already_checked_in" if duplicate else "error", "date_ist": results[key].get("date_ist")}
+                        if not duplicate:
+                            results[key]["detail"] = err.get("errmsg", "")
+        # Check-outs of rows someone else closed first matched nothing: find them by the value written
+        closed_days = [day for day in checkout_days if day not in failed_checkouts]
+        if modified < len(closed_days):
+            rows = await _find_list(attendance_collection, {"_id": {"$in": [attendance_by_day[day]["_id"] for day in closed_days]}},
+                                    {"check_out_at_utc": 1})
+            written = {row["_id"]: row.get("check_out_at_utc") for row in rows}
+            for day in list(closed_days):
+                value = written.get(attendance_by_day[day]["_id"])
+                if value is None or value.replace(tzinfo=timezone.utc) != checkout_at[day]:
+                    closed_days.remove(day)
+                    results[checkouts[day][0]] = {"status": "already_checked_out", "date_ist": day[1]}
+    except BaseException:
+        await attendance_event_keys_collection.delete_many({"_id": {"$in": [key for key in planned if key not in lost]}})
+        raise
+
+    # Rollups, member stats and last_attendance_date for what was written
+    check_ins: dict[tuple, int] = {}
+    check_outs: dict[tuple, int] = {}
+    member_ops = []
+    last_seen: dict[str, datetime] = {}
+    for index, (day, doc) in enumerate(inserts.items()):
+        if index in failed_inserts:
+            continue
+        check_ins[(doc["date_ist"], doc["batch"])] = check_ins.get((doc["date_ist"], doc["batch"]), 0) + 1
+        if "check_out_at_utc" in doc:
+            check_outs[(doc["date_ist"], doc["batch"])] = check_outs.get((doc["date_ist"], doc["batch"]), 0) + 1
+        with_duration = "duration_sec" in doc
+        member_ops.append(member_stats_update(
+            doc["member_id"], doc["date_ist"], visits=1, duration=doc.get("duration_sec", 0), durations=int(with_duration),
+        ))
+        # Midnight UTC of the IST date, as check_in stores it
+        d = date.fromisoformat(doc["date_ist"])
+        seen_at = datetime(d.year, d.month, d.day, tzinfo=timezone.utc)
+        if doc["member_id"] not in last_seen or seen_at > last_seen[doc["member_id"]]:
+            last_seen[doc["member_id"]] = seen_at
+    for day in closed_days:
+        batch = attendance_by_day[day]["batch"]
+        check_outs[(day[1], batch)] = check_outs.get((day[1], batch), 0) + 1
+        member_ops.append(member_stats_update(day[0], duration=checkout_seconds[day], durations=1))
+    writes = [record_check_in(daily_stats_collection, d, b, delta=n) for (d, b), n in check_ins.items()]
+    writes += [record_check_out(daily_stats_collection, d, b, delta=n) for (d, b), n in check_outs.items()]
+    if member_ops:
+        writes.append(member_stats_collection.bulk_write(member_ops, ordered=False))
+    if last_seen:
+        writes.append(members_collection.bulk_write(
+            [UpdateOne({"_id": ObjectId(mid)}, {"$max": {"last_attendance_date": dt}}) for mid, dt in last_seen.items()],
+            ordered=False,
+        ))
+    # Claimed keys keep the result of what was applied; the rest are released, so a retry is evaluated afresh
+    claims = [
+        UpdateOne({"_id": key}, {"$set": {"result": results[key]}}) if results[key]["status"] == "ok" else DeleteOne({"_id": key})
+        for key in planned if key not in lost
+    ]
+    if claims:
+        writes.append(attendance_event_keys_collection.bulk_write(claims, ordered=False))
+    await asyncio.gather(*writes)
+    if check_ins or check_outs:
+        _invalidate_dashboard()
+        # Replayed taps can land in past days whose chart buckets are already stored
+        await analytics_series.invalidate("attendance", {d for d, _ in check_ins}, today_ist())
+
+    ordered = []
+    for ev in body.events:
+        ordered.append({"idempotency_key": ev.idempotency_key, **results[ev.idempotency_key]})
+    counts: dict[str, int] = {}
+    for r in ordered:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return {"results": ordered, "counts": counts}
 
 
-async def _async_iter(items):
-    for x in items:
-        yield x
+async def _find_list(collection, query: dict | None, projection: dict | None = None) -> list[dict]:
+    """All documents matching query (none when query is None), for asyncio.gather."""
+    if query is None:
+        return []
+    return [doc async for doc in collection.find(query, projection)]
 
 
-async def attendance_by_date(date_ist_str: str) -> list:
-    cursor = attendance_collection.find({"date_ist": date_ist_str}).sort([("batch", 1), ("check_in_at_utc", 1)])
-    return await _attendance_docs_to_records(cursor)
+async def attendance_by_date(date_ist_str: str) -> list[dict]:
+    pipeline = [{"$match": {"date_ist": date_ist_str}}, {"$sort": {"batch": 1, "check_in_at_utc": 1}}] + ATTENDANCE_RECORD_STAGES
+    return _attendance_rows([doc async for doc in attendance_collection.aggregate(pipeline)])
 
 
 @app.delete("/attendance/{attendance_id}")
@@ -787,9 +1397,17 @@ async def delete_attendance(attendance_id: str):
         oid = ObjectId(attendance_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid attendance ID")
-    result = await attendance_collection.delete_one({"_id": oid})
-    if result.deleted_count == 0:
+    deleted = await attendance_collection.find_one_and_delete(
+        {"_id": oid}, projection={"member_id": 1, "date_ist": 1, "batch": 1, "check_out_at_utc": 1, "duration_sec": 1}
+    )
+    if not deleted:
         raise HTTPException(status_code=404, detail="Attendance record not found")
+    await asyncio.gather(
+        record_delete(daily_stats_collection, deleted),
+        record_member_delete(member_stats_collection, deleted),
+        analytics_series.invalidate("attendance", [deleted["date_ist"]], today_ist()),
+    )
+    _invalidate_dashboard()
     return {"message": "Attendance record deleted"}
 
 
@@ -801,95 +1419,329 @@ async def mark_inactive_by_attendance():
     """
     Only mark Inactive when last_attendance_date exists and is older than 90 days (IST).
     Members who have never checked in (no last_attendance_date) are left unchanged.
+    Also runs hourly in the background scheduler; this endpoint triggers it now.
     """
+    return await _mark_inactive_members()
+
+
+# ---------- Scheduled jobs (scheduler.py): inactive sweep, Due -> Overdue, month rollover ----------
+
+async def _mark_inactive_members() -> dict:
     from datetime import timezone
 
     today = today_ist()
     cutoff = today - timedelta(days=INACTIVE_DAYS_THRESHOLD)
     cutoff_dt = datetime(cutoff.year, cutoff.month, cutoff.day, tzinfo=timezone.utc)
     result = await members_collection.update_many(
-        {"last_attendance_date": {"$exists": True, "$lt": cutoff_dt}},
+        {"last_attendance_date": {"$exists": True, "$lt": cutoff_dt}, "status": {"$ne": "Inactive"}},
         {"$set": {"status": "Inactive"}},
     )
+    if result.modified_count:
+        _invalidate_dashboard()
+        identity_cache.clear()
     return {"updated_count": result.modified_count, "cutoff_date_ist": cutoff.isoformat()}
 
 
+async def _mark_overdue_payments() -> dict:
+    """Due -> Overdue where due_date is before today (IST); member balances move from due to overdue."""
+    from datetime import timezone
+    today = today_ist()
+    today_dt = datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
+    updated = await ledger.mark_overdue(today_dt)
+    if updated:
+        _invalidate_dashboard()
+    return {"updated_count": updated}
+
+
+async def _reconcile_ledger(progress: dict | None = None) -> dict:
+    """ledger.reconcile(); past revenue buckets of the days whose Paid lines it changed are recomputed on next read."""
+    result = await ledger.reconcile(progress)
+    if result["paid_days"]:
+        _invalidate_dashboard()
+        await analytics_series.invalidate("revenue", result["paid_days"], today_ist())
+    return result
+
+
+async def _month_rollover() -> dict:
+    """This IST month's monthly fee (Due on the 1st) for every Active member who has none yet (dues.py). Idempotent."""
+    result = await _generate_dues(today_ist().strftime("%Y-%m"), {})
+    return {"period": result["period"], "created_count": result["created_count"], "duration_ms": result["duration_ms"]}
+
+
+async def _generate_dues(period: str, progress: dict) -> dict:
+    from dues import generate_monthly_dues
+    result = await generate_monthly_dues(members_collection, payments_collection, dues_runs_collection, ledger, period, MONTHLY_FEE_PLANS, progress)
+    if result["created_count"]:
+        _invalidate_dashboard()
+    return result
+
+
+scheduler.add_job("mark_inactive", _mark_inactive_members, interval_seconds=3600)
+scheduler.add_job("mark_overdue", _mark_overdue_payments, interval_seconds=600)
+scheduler.add_job("month_rollover", _month_rollover, interval_seconds=3600)
+scheduler.add_job("reconcile_ledger", _reconcile_ledger, interval_seconds=86400)
+
+
+@app.get("/admin/scheduler")
+async def scheduler_status():
+    """Background scheduler: current leader, jobs, last run (result, duration_ms) and recent runs on this worker."""
+    return await scheduler.status()
+
+
+@app.post("/admin/ensure-indexes")
+async def admin_ensure_indexes():
+    """Re-run index reconciliation (also done at startup). Returns created/existing/dropped/extra/failed per collection."""
+    from indexes import ensure_indexes
+    return await ensure_indexes(db)
+
+
+@app.post("/admin/rebuild-attendance-stats")
+async def rebuild_attendance_stats(date_from: str | None = None, date_to: str | None = None):
+    """Repair: recompute daily_attendance_stats from attendance_logs (optionally only for IST dates date_from..date_to)."""
+    from rollups import rebuild_daily_stats
+    for d in (date_from, date_to):
+        if d is not None and (len(d) != 10 or d[4] != "-" or d[7] != "-"):
+            raise HTTPException(status_code=400, detail="date_from and date_to must be YYYY-MM-DD")
+    result = await rebuild_daily_stats(attendance_collection, daily_stats_collection, date_from, date_to)
+    _invalidate_dashboard()
+    return result
+
+
+async def _backfill_phones(progress: dict) -> dict:
+    from phones import backfill_phone_e164
+    result = await backfill_phone_e164(members_collection, progress)
+    if result["updated"]:
+        identity_cache.clear()
+    if result["invalid"] or result["conflicts"]:
+        logger.warning("Phone backfill: %d invalid, %d conflicting numbers need fixing by hand", len(result["invalid"]), len(result["conflicts"]))
+    return result
+
+
+async def _backfill_search(progress: dict) -> dict:
+    from search import backfill_search_tokens
+    return await backfill_search_tokens(members_collection, invoices_collection, progress)
+
+
+async def _startup_backfill(progress: dict) -> dict:
+    """Phones first: member search tokens include the canonical phone."""
+    phones = await _backfill_phones(progress.setdefault("phones", {}))
+    search = await _backfill_search(progress.setdefault("search", {}))
+    attendance = await _migrate_attendance_times(progress.setdefault("attendance", {}))
+    out = {"phones": phones, "search": search, "attendance": attendance}
+    if await balances_collection.find_one({"paid_count": {"$exists": False}}, {"_id": 1}) or await balances_collection.estimated_document_count() == 0:
+        # First deploy of the ledger (or balances from before the due/overdue/paid split): link old invoices, build balances
+        out["ledger"] = await _reconcile_ledger(progress.setdefault("ledger", {}))
+    return out
+
+
+async def _migrate_attendance_times(progress: dict, batch_size: int = 1000) -> dict:
+    """
+    Legacy attendance rows carry check_in_at_ist / check_out_at_ist ISO strings next to the UTC
+    datetimes. Fill any missing check_*_at_utc from the string, then drop the strings.
+    Rows whose only check-in time is an unparseable string are left alone and reported.
+    """
+    from datetime import timezone
+    from pymongo import UpdateOne
+
+    progress.update({"scanned": 0, "migrated": 0})
+    failed, ops = [], []
+
+    def parse(value):
+        try:
+            dt = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+        return (dt if dt.tzinfo else dt.replace(tzinfo=IST)).astimezone(timezone.utc)
+
+    async def flush():
+        progress["migrated"] += (await attendance_collection.bulk_write(ops, ordered=False)).modified_count
+        ops.clear()
+
+    cursor = attendance_collection.find(
+        {"$or": [{"check_in_at_ist": {"$exists": True}}, {"check_out_at_ist": {"$exists": True}}]},
+        {"check_in_at_utc": 1, "check_in_at_ist": 1, "check_out_at_utc": 1, "check_out_at_ist": 1},
+    )
+    async for doc in cursor:
+        progress["scanned"] += 1
+        set_fields = {}
+        if not doc.get("check_in_at_utc"):
+            set_fields["check_in_at_utc"] = parse(doc.get("check_in_at_ist"))
+            if set_fields["check_in_at_utc"] is None:
+                failed.append({"id": str(doc["_id"]), "check_in_at_ist": doc.get("check_in_at_ist")})
+                continue
+        if not doc.get("check_out_at_utc") and doc.get("check_out_at_ist"):
+            check_out = parse(doc["check_out_at_ist"])
+            if check_out is not None:
+                set_fields["check_out_at_utc"] = check_out
+        update = {"$unset": {"check_in_at_ist": "", "check_out_at_ist": ""}}
+        if set_fields:
+            update["$set"] = set_fields
+        ops.append(UpdateOne({"_id": doc["_id"]}, update))
+        if len(ops) >= batch_size:
+            await flush()
+    if ops:
+        await flush()
+    return {"scanned": progress["scanned"], "migrated": progress["migrated"], "failed": failed}
+
+
+@app.post("/admin/migrate-phones")
+async def migrate_phones():
+    """
+    Backfill phone_e164 (canonical phone used by member login) for members created before it existed.
+    Runs as a background job (also started on every startup); poll GET /admin/jobs/{job_id}.
+    The result lists numbers that could not be normalized or collide with another member's.
+    """
+    job = background_jobs.start("phone_backfill", _backfill_phones)
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+@app.post("/admin/backfill-search-tokens")
+async def backfill_search():
+    """Add search tokens (member / invoice search) to documents written before search existed. Background job."""
+    job = background_jobs.start("search_backfill", _backfill_search)
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+@app.post("/admin/rebuild-member-attendance-stats")
+async def rebuild_member_attendance_stats(member_id: str | None = None):
+    """Repair: recompute member_attendance_stats (and missing duration_sec) from attendance_logs, for one member or all."""
+    from rollups import rebuild_member_stats
+    return await rebuild_member_stats(attendance_collection, member_stats_collection, member_id)
+
+
+@app.post("/admin/generate-dues")
+async def generate_dues(period: str | None = None):
+    """
+    Create the monthly fee of period (YYYY-MM, default this IST month) for every Active member
+    who has none, at the MONTHLY_FEE_PLANS amount (the hourly month_rollover does this for the
+    current month). Idempotent; a run that stopped midway resumes. Background job; poll
+    GET /admin/jobs/{job_id} for progress and the result (counts, dues_per_sec).
+    """
+    from dues import PERIOD_RE
+    period = period or today_ist().strftime("%Y-%m")
+    if not PERIOD_RE.match(period):
+        raise HTTPException(status_code=400, detail="period must be YYYY-MM")
+    job = background_jobs.start("generate_dues", lambda progress: _generate_dues(period, progress))
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+@app.post("/admin/reconcile-ledger")
+async def reconcile_ledger():
+    """
+    Repair: link pre-ledger invoices to their fee lines, make invoice and line status agree and
+    recompute member_balances (also runs nightly). Background job; poll GET /admin/jobs/{job_id}.
+    """
+    job = background_jobs.start("reconcile_ledger", _reconcile_ledger)
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+@app.post("/admin/migrate-attendance-times")
+async def migrate_attendance_times():
+    """
+    One-shot: convert legacy attendance IST strings to UTC datetimes and drop the strings (also
+    runs on startup). Background job; poll GET /admin/jobs/{job_id}.
+    """
+    job = background_jobs.start("attendance_times", _migrate_attendance_times)
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+@app.post("/admin/migrate-inline-media")
+async def migrate_inline_media():
+    """
+    One-shot: move legacy photo_base64 / id_document_base64 out of gym_members into the media store.
+    Idempotent; members whose inline data cannot be decoded are left untouched and reported.
+    Background job; poll GET /admin/jobs/{job_id}.
+    """
+    job = background_jobs.start("inline_media", _migrate_inline_media)
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+async def _migrate_inline_media(progress: dict) -> dict:
+    progress.update({"scanned": 0, "migrated": 0})
+    failed = []
+    cursor = members_collection.find(
+        {"$or": [{"photo_base64": {"$exists": True}}, {"id_document_base64": {"$exists": True}}]},
+        {"photo_base64": 1, "id_document_base64": 1},
+    ).batch_size(20)  # documents are large; keep each batch small
+    async for doc in cursor:
+        progress["scanned"] += 1
+        blobs, unset_fields = {}, {}
+        for field in ("photo", "id_document"):
+            raw = doc.get(f"{field}_base64")
+            if raw:
+                try:
+                    blobs[field] = decode_base64(raw)
+                except ValueError:
+                    failed.append({"id": str(doc["_id"]), "field": field})
+                    continue
+            if f"{field}_base64" in doc:
+                unset_fields[f"{field}_base64"] = ""
+        if not blobs and not unset_fields:
+            continue
+        async with media_store.guard(*(content_hash(data) for data in blobs.values())):
+            update = {"$set": {field: await media_store.put(data) for field, data in blobs.items()}} if blobs else {}
+            if unset_fields:
+                update["$unset"] = unset_fields
+            await members_collection.update_one({"_id": doc["_id"]}, update)
+        identity_cache.invalidate(doc["_id"])
+        progress["migrated"] += 1
+    return {"migrated_count": progress["migrated"], "failed": failed}
+
+
 # ---------- Payments & Fees ----------
 
 # ---------- Payments: list, fees summary, log monthly, mark paid ----------
 
+def _payment_row(doc: dict) -> dict:
+    """PaymentResponse-shaped dict (fields in model order) for a payment document."""
+    return {
+        "id": str(doc["_id"]),
+        "member_id": doc["member_id"],
+        "member_name": doc.get("member_name", ""),
+        "amount": doc["amount"],
+        "fee_type": doc["fee_type"],
+        "period": doc.get("period"),
+        "status": doc["status"],
+        "due_date": _to_date(doc.get("due_date")),
+        "paid_at": doc.get("paid_at"),
+        "created_at": doc["created_at"],
+        "invoice_id": doc.get("invoice_id"),
+    }
+
+
 @app.get("/payments", response_model=list[PaymentResponse])
-async def list_payments(member_id: str | None = None, status: str | None = None, limit: int = 1000):
-    """List payments. Filter by member_id and/or status (Paid/Due/Overdue). Capped at 1000 for performance."""
-    from datetime import timezone
+async def list_payments(response: Response, member_id: str | None = None, status: str | None = None, limit: int = 1000, cursor: str | None = None, stream: str | None = None):
+    """
+    List payments, newest first. Filter by member_id and/or status (Paid/Due/Overdue).
+    Up to limit (max 1000) rows per call; the X-Next-Cursor response header continues (?cursor=...).
+    stream=ndjson: every matching payment instead (limit ignored), one JSON object per line.
+    """
     q = {}
     if member_id:
         q["member_id"] = member_id
     if status:
         q["status"] = status
-    limit = min(max(1, limit), 1000)
-    cursor = payments_collection.find(q).sort("created_at", -1).limit(limit)
-    out = []
-    async for doc in cursor:
-        out.append(PaymentResponse(
-            id=str(doc["_id"]),
-            member_id=doc["member_id"],
-            member_name=doc.get("member_name", ""),
-            amount=doc["amount"],
-            fee_type=doc["fee_type"],
-            period=doc.get("period"),
-            status=doc["status"],
-            due_date=_to_date(doc.get("due_date")),
-            paid_at=doc.get("paid_at"),
-            created_at=doc["created_at"],
-        ))
-    return out
+    if _stream_mode(stream):
+        return _ndjson_response(payments_collection, q, [("created_at", -1)], _payment_row, cursor)
+    limit = min(max(1, limit), MAX_PAGE_SIZE)
+    docs = await _paginate(response, payments_collection, q, [("created_at", -1)], limit, cursor)
+    return _rows_response(response, [_payment_row(doc) for doc in docs])
 
 
 @app.get("/payments/fees-summary")
 async def fees_summary():
-    """Paid/Due/Overdue counts and total amounts for Fees Management tab."""
-    from datetime import timezone
-    today = today_ist()
-    today_dt = datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
-    pipeline = [
-        {"$group": {"_id": "$status", "count": {"$sum": 1}, "total_amount": {"$sum": "$amount"}}}
-    ]
-    cursor = payments_collection.aggregate(pipeline)
-    paid = due = overdue = 0
-    paid_amt = due_amt = overdue_amt = 0
-    async for row in cursor:
-        s = row["_id"]
-        c, a = row["count"], row["total_amount"]
-        if s == "Paid":
-            paid, paid_amt = c, a
-        elif s == "Due":
-            due, due_amt = c, a
-        elif s == "Overdue":
-            overdue, overdue_amt = c, a
-    # Mark Due -> Overdue where due_date < today
-    await payments_collection.update_many(
-        {"status": "Due", "due_date": {"$lt": today_dt}},
-        {"$set": {"status": "Overdue"}},
-    )
-    # Re-run summary after update
-    cursor2 = payments_collection.aggregate(pipeline)
-    paid = due = overdue = 0
-    paid_amt = due_amt = overdue_amt = 0
-    async for row in cursor2:
-        s = row["_id"]
-        c, a = row["count"], row["total_amount"]
-        if s == "Paid":
-            paid, paid_amt = c, a
-        elif s == "Due":
-            due, due_amt = c, a
-        elif s == "Overdue":
-            overdue, overdue_amt = c, a
-    return {
-        "paid": {"count": paid, "total_amount": paid_amt},
-        "due": {"count": due, "total_amount": due_amt},
-        "overdue": {"count": overdue, "total_amount": overdue_amt},
-    }
+    """
+    Paid/Due/Overdue counts and total amounts for Fees Management tab: a sum over member_balances
+    (one document per member), not over payments. Read-only: the scheduler moves Due -> Overdue.
+    """
+    keys = ("paid", "due", "overdue")
+    group = {"_id": None}
+    for key in keys:
+        group[f"{key}_count"] = {"$sum": f"${key}_count"}
+        group[f"{key}_amount"] = {"$sum": f"${key}_amount"}
+    rows = await balances_collection.aggregate([{"$group": group}]).to_list(1)
+    totals = rows[0] if rows else {}
+    return {key: {"count": totals.get(f"{key}_count", 0), "total_amount": totals.get(f"{key}_amount", 0)} for key in keys}
 
 
 class PaymentStatusUpdate(BaseModel):
@@ -898,105 +1750,68 @@ class PaymentStatusUpdate(BaseModel):
 
 
 class LogMonthlyPaymentBody(BaseModel):
-    """Log a monthly payment for an existing member (Rs 500 Regular / Rs 2000 PT)."""
+    """Log a monthly payment for an existing member (a MONTHLY_FEE_PLANS amount: Rs 500 Regular / Rs 2000 PT)."""
     member_id: str
     period: str  # YYYY-MM
-    amount: int  # 500 or 2000
+    amount: int  # 500 or 2000 by default
     payment_date: str | None = None  # YYYY-MM-DD, default today IST
 
 
 @app.post("/payments/log-monthly", response_model=PaymentResponse)
 async def log_monthly_payment(body: LogMonthlyPaymentBody):
-    """Create a monthly payment record marked as Paid (for existing member payment logging)."""
+    """Mark the member's monthly fee for the period as Paid (creating the record if none is outstanding)."""
     from bson import ObjectId
     from datetime import timezone
     try:
         oid = ObjectId(body.member_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid member ID")
-    member = await members_collection.find_one({"_id": oid})
+    member = await identity_cache.get(oid)
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
-    if body.amount not in (500, 2000):
-        raise HTTPException(status_code=400, detail="Amount must be 500 (Regular) or 2000 (PT)")
+    if body.amount not in MONTHLY_FEE_PLANS.values():
+        plans = " or ".join(f"{amount} ({plan})" for plan, amount in MONTHLY_FEE_PLANS.items())
+        raise HTTPException(status_code=400, detail=f"Amount must be {plans}")
     pay_date_str = body.payment_date or today_ist().strftime("%Y-%m-%d")
     try:
         pay_date = datetime.strptime(pay_date_str + " 12:00:00", "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
     except Exception:
         raise HTTPException(status_code=400, detail="payment_date must be YYYY-MM-DD")
-    doc = {
-        "member_id": body.member_id,
-        "member_name": member.get("name", ""),
-        "amount": body.amount,
-        "fee_type": "monthly",
-        "period": body.period,
-        "status": "Paid",
-        "due_date": pay_date,
-        "paid_at": pay_date,
-        "created_at": datetime.now(timezone.utc),
-    }
-    result = await payments_collection.insert_one(doc)
-    doc["_id"] = result.inserted_id
-
-    # Create Invoice for this payment
-    inv_items = [{"description": f"Monthly Fee ({body.period})", "amount": body.amount}]
-    inv_doc = {
-        "member_id": body.member_id,
-        "member_name": member.get("name", ""),
-        "items": inv_items,
-        "total": body.amount,
-        "status": "Paid",
-        "issued_at": datetime.now(timezone.utc),
-        "paid_at": pay_date,
-    }
-    await invoices_collection.insert_one(inv_doc)
-
-    return PaymentResponse(
-        id=str(doc["_id"]),
-        member_id=doc["member_id"],
-        member_name=doc["member_name"],
-        amount=doc["amount"],
-        fee_type=doc["fee_type"],
-        period=doc["period"],
-        status=doc["status"],
-        due_date=_to_date(doc.get("due_date")),
-        paid_at=doc.get("paid_at"),
-        created_at=doc["created_at"],
-    )
+    # Settle the Due/Overdue fee for this period if one exists (created at registration or by month rollover),
+    # on its invoice if it was billed (walk-in), else with a Paid receipt invoice (ledger.py)
+    try:
+        doc = await ledger.record_monthly(body.member_id, member.get("name", ""), body.period, body.amount, pay_date)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail=f"Monthly fee for {body.period} is already paid")
+    _invalidate_dashboard()
+    await analytics_series.invalidate("revenue", [ist_day(pay_date)], today_ist())  # payment_date may be in the past
+    return _payment_row(doc)
 
 
 @app.patch("/payments/{payment_id}", response_model=PaymentResponse)
 async def update_payment_status(payment_id: str, body: PaymentStatusUpdate):
     """Admin: edit payment status for corrections (e.g. revert Paid to Due)."""
     from bson import ObjectId
+    from datetime import timezone
     try:
         oid = ObjectId(payment_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid payment ID")
-    doc = await payments_collection.find_one({"_id": oid})
+    doc = await payments_collection.find_one({"_id": oid}, {"paid_at": 1})
     if not doc:
         raise HTTPException(status_code=404, detail="Payment not found")
-    update = {"status": body.status}
-    if body.status != "Paid":
-        update["paid_at"] = None
-    await payments_collection.update_one({"_id": oid}, {"$set": update})
-    updated = await payments_collection.find_one({"_id": oid})
-    return PaymentResponse(
-        id=str(updated["_id"]),
-        member_id=updated["member_id"],
-        member_name=updated.get("member_name", ""),
-        amount=updated["amount"],
-        fee_type=updated["fee_type"],
-        period=updated.get("period"),
-        status=updated["status"],
-        due_date=_to_date(updated.get("due_date")),
-        paid_at=updated.get("paid_at"),
-        created_at=updated["created_at"],
-    )
+    # The line's invoice and the member's balance follow (ledger.py)
+    updated = await ledger.set_line_status(oid, body.status, doc.get("paid_at") or datetime.now(timezone.utc))
+    if not updated:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    _invalidate_dashboard()
+    if doc.get("paid_at"):
+        await analytics_series.invalidate("revenue", [ist_day(doc["paid_at"])], today_ist())
+    return _payment_row(updated)
 
 
 @app.post("/payments/pay", response_model=PaymentResponse)
-async def record_payment(member_id: str, payment_id: str, background_tasks: BackgroundTasks):
+async def record_payment(member_id: str, payment_id: str):
     """Record a payment (simulated). Sends payment-received notification."""
     from bson import ObjectId
     from datetime import timezone
@@ -1009,127 +1824,270 @@ async def record_payment(member_id: str, payment_id: str, background_tasks: Back
         raise HTTPException(status_code=404, detail="Payment not found")
     if doc["status"] == "Paid":
         raise HTTPException(status_code=400, detail="Already paid")
-    now = datetime.now(timezone.utc)
-    await payments_collection.update_one(
-        {"_id": oid},
-        {"$set": {"status": "Paid", "paid_at": now}},
-    )
-    member = await members_collection.find_one({"_id": ObjectId(member_id)})
+    # Pays the invoice too once every fee on it is paid (ledger.py)
+    updated = await ledger.pay_line(oid, datetime.now(timezone.utc), member_id=member_id)
+    if not updated:
+        raise HTTPException(status_code=400, detail="Already paid")
+    _invalidate_dashboard()
+    member = await identity_cache.get(member_id)
     if member:
-        background_tasks.add_task(_notify_payment_received, member.get("name", ""), doc["amount"], member.get("email", ""), member.get("phone", ""))
-    updated = await payments_collection.find_one({"_id": oid})
-    return PaymentResponse(
-        id=str(updated["_id"]),
-        member_id=updated["member_id"],
-        member_name=updated.get("member_name", ""),
-        amount=updated["amount"],
-        fee_type=updated["fee_type"],
-        period=updated.get("period"),
-        status=updated["status"],
-        due_date=_to_date(updated.get("due_date")),
-        paid_at=updated.get("paid_at"),
-        created_at=updated["created_at"],
-    )
+        await _notify("payment_received", member, {"amount": updated["amount"]})
+    return _payment_row(updated)
 
 
 # ---------- Analytics: dashboard counts, fee reminders, admin helpers ----------
 
+# Dashboard results are cached briefly (admins refresh constantly) and cleared on every
+# write to members, payments or attendance; the IST day is part of the key.
+DASHBOARD_CACHE_TTL_SECONDS = 30
+dashboard_cache = TTLCache(ttl=DASHBOARD_CACHE_TTL_SECONDS, maxsize=64)
+
+
+def _invalidate_dashboard():
+    """Call after any write to gym_members, payments or attendance_logs."""
+    dashboard_cache.clear()
+
+
 @app.get("/analytics/dashboard")
 async def analytics_dashboard(date_from: str | None = None, date_to: str | None = None):
     """
     Total Active/Inactive, Total Collections (₹), Pending Dues, Regular vs PT split.
     Optional date_from, date_to (YYYY-MM-DD): add attendance_count_in_range and payments_received_in_range for that period.
+    One $facet aggregation per collection, run concurrently; cached for DASHBOARD_CACHE_TTL_SECONDS.
     """
     from datetime import timezone
-    active = await members_collection.count_documents({"status": "Active"})
-    inactive = await members_collection.count_documents({"status": "Inactive"})
-    regular = await members_collection.count_documents({"membership_type": "Regular"})
-    pt = await members_collection.count_documents({"membership_type": "PT"})
-    pipeline_pending = [{"$match": {"status": {"$in": ["Due", "Overdue"]}}}, {"$group": {"_id": None, "total": {"$sum": "$amount"}}}]
-    cur = payments_collection.aggregate(pipeline_pending)
-    pending_fees = 0
-    async for row in cur:
-        pending_fees = row["total"]
-        break
-    pipeline_paid = [{"$match": {"status": "Paid"}}, {"$group": {"_id": None, "total": {"$sum": "$amount"}}}]
-    cur2 = payments_collection.aggregate(pipeline_paid)
-    total_collections = 0
-    async for row in cur2:
-        total_collections = row["total"]
-        break
-    date_ist_str = today_ist().strftime("%Y-%m-%d")
-    today_attendance_count = await attendance_collection.count_documents({"date_ist": date_ist_str})
-    today_check_outs = await attendance_collection.count_documents({
-        "date_ist": date_ist_str,
-        "check_out_at_ist": {"$exists": True, "$ne": None, "$ne": ""},
-    })
-    today_currently_in = today_attendance_count - today_check_outs
-    out = {
-        "active_members": active,
-        "inactive_members": inactive,
-        "regular_count": regular,
-        "pt_count": pt,
-        "pending_fees_amount": pending_fees,
-        "total_collections": total_collections,
-        "today_attendance_count": today_attendance_count,
-        "today_check_ins": today_attendance_count,
-        "today_check_outs": today_check_outs,
-        "today_currently_in": today_currently_in,
-    }
+    start_utc = end_utc = None
     if date_from and date_to:
         if len(date_from) != 10 or date_from[4] != "-" or date_from[7] != "-" or len(date_to) != 10 or date_to[4] != "-" or date_to[7] != "-":
             raise HTTPException(status_code=400, detail="date_from and date_to must be YYYY-MM-DD")
-        from datetime import datetime as dt_parse
-        start = dt_parse.strptime(date_from + " 00:00:00", "%Y-%m-%d %H:%M:%S").replace(tzinfo=IST)
-        end = dt_parse.strptime(date_to + " 23:59:59", "%Y-%m-%d %H:%M:%S").replace(tzinfo=IST)
+        try:
+            start = datetime.strptime(date_from + " 00:00:00", "%Y-%m-%d %H:%M:%S").replace(tzinfo=IST)
+            end = datetime.strptime(date_to + " 23:59:59", "%Y-%m-%d %H:%M:%S").replace(tzinfo=IST)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="date_from and date_to must be YYYY-MM-DD")
         start_utc = start.astimezone(timezone.utc)
         end_utc = end.astimezone(timezone.utc)
-        attendance_in_range = await attendance_collection.count_documents({
-            "check_in_at_utc": {"$gte": start_utc, "$lte": end_utc},
-        })
-        pipeline_paid_range = [
-            {"$match": {"status": "Paid", "paid_at": {"$gte": start_utc, "$lte": end_utc}}},
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}, "count": {"$sum": 1}}},
-        ]
-        cur3 = payments_collection.aggregate(pipeline_paid_range)
-        payments_in_range_amt = 0
-        payments_in_range_count = 0
-        async for row in cur3:
-            payments_in_range_amt = row.get("total", 0)
-            payments_in_range_count = row.get("count", 0)
-            break
-        out["attendance_count_in_range"] = attendance_in_range
-        out["payments_received_in_range"] = payments_in_range_amt
-        out["payments_count_in_range"] = payments_in_range_count
+    date_ist_str = today_ist().strftime("%Y-%m-%d")
+    cache_key = (date_from, date_to, date_ist_str) if start_utc else (None, None, date_ist_str)
+    cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    members, payments, attendance = await asyncio.gather(
+        _dashboard_member_counts(),
+        _dashboard_payment_totals(start_utc, end_utc),
+        _dashboard_attendance_counts(date_ist_str, date_from if start_utc else None, date_to if start_utc else None),
+    )
+    out = {
+        "active_members": members["active"],
+        "inactive_members": members["inactive"],
+        "regular_count": members["regular"],
+        "pt_count": members["pt"],
+        "pending_fees_amount": payments["pending"],
+        "total_collections": payments["paid"],
+        "today_attendance_count": attendance["today_check_ins"],
+        "today_check_ins": attendance["today_check_ins"],
+        "today_check_outs": attendance["today_check_outs"],
+        "today_currently_in": attendance["today_check_ins"] - attendance["today_check_outs"],
+    }
+    if start_utc:
+        out["attendance_count_in_range"] = attendance["in_range"]
+        out["payments_received_in_range"] = payments["paid_in_range"]
+        out["payments_count_in_range"] = payments["paid_in_range_count"]
         out["date_from"] = date_from
         out["date_to"] = date_to
+    dashboard_cache.set(cache_key, out)
     return out
 
 
-@app.post("/admin/run-fee-reminders")
-async def run_fee_reminders(background_tasks: BackgroundTasks):
-    """Send Month-End Reminders: simulated WhatsApp to all members with unpaid fees."""
-    from utils import send_notification
+async def _dashboard_member_counts() -> dict:
+    """Active/Inactive and Regular/PT counts in one pass over gym_members."""
+    pipeline = [
+        {"$project": {"_id": 0, "status": 1, "membership_type": 1}},
+        {"$facet": {
+            "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            "by_type": [{"$group": {"_id": "$membership_type", "count": {"$sum": 1}}}],
+        }},
+    ]
+    rows = await members_collection.aggregate(pipeline).to_list(1)
+    facets = rows[0] if rows else {"by_status": [], "by_type": []}
+    by_status = {r["_id"]: r["count"] for r in facets["by_status"]}
+    by_type = {r["_id"]: r["count"] for r in facets["by_type"]}
+    return {
+        "active": by_status.get("Active", 0),
+        "inactive": by_status.get("Inactive", 0),
+        "regular": by_type.get("Regular", 0),
+        "pt": by_type.get("PT", 0),
+    }
+
+
+async def _dashboard_payment_totals(start_utc: datetime | None, end_utc: datetime | None) -> dict:
+    """
+    Paid and pending (Due + Overdue) totals summed over member_balances, plus payments received in
+    [start_utc, end_utc] when given (indexed status + paid_at range over payments).
+    """
+    totals_pipeline = [{"$group": {"_id": None, "paid": {"$sum": "$paid_amount"}, "pending": {"$sum": "$pending_amount"}}}]
+    rows = await balances_collection.aggregate(totals_pipeline).to_list(1)
+    totals = rows[0] if rows else {}
+    in_range = {}
+    if start_utc:
+        range_pipeline = [
+            {"$match": {"status": "Paid", "paid_at": {"$gte": start_utc, "$lte": end_utc}}},
+            {"$group": {"_id": None, "total": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+        ]
+        in_range = (await payments_collection.aggregate(range_pipeline).to_list(1) or [{}])[0]
+    return {
+        "paid": totals.get("paid", 0),
+        "pending": totals.get("pending", 0),
+        "paid_in_range": in_range.get("total", 0),
+        "paid_in_range_count": in_range.get("count", 0),
+    }
+
+
+async def _dashboard_attendance_counts(date_ist_str: str, date_from: str | None, date_to: str | None) -> dict:
+    """Today's check-ins/check-outs, plus check-ins for IST dates [date_from, date_to] when given. Reads rollups only."""
+    lo = min(date_ist_str, date_from) if date_from else date_ist_str
+    hi = max(date_ist_str, date_to) if date_to else date_ist_str
+    days = await read_daily_stats(daily_stats_collection, lo, hi)
+    today = days.get(date_ist_str, {})
+    in_range = sum(d.get("check_ins", 0) for k, d in days.items() if date_from and date_from <= k <= date_to)
+    return {
+        "today_check_ins": today.get("check_ins", 0),
+        "today_check_outs": today.get("check_outs", 0),
+        "in_range": in_range,
+    }
+
+
+async def _series_response(kind: str, granularity: str, date_from: str | None, date_to: str | None) -> dict:
+    """Shared by the series endpoints: parse the IST date range (default: the last 30 days / 12 weeks / 12 months)."""
+    from series import GRANULARITIES, bucket_end, bucket_start
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail="granularity must be day, week or month")
+    today = today_ist()
+    try:
+        end = date.fromisoformat(date_to) if date_to else today
+        if date_from:
+            start = date.fromisoformat(date_from)
+        elif granularity == "day":
+            start = end - timedelta(days=29)
+        elif granularity == "week":
+            start = end - timedelta(weeks=11)
+        else:
+            start = date(end.year - (end.month <= 11), (end.month - 12) % 12 + 1, 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date_from and date_to must be YYYY-MM-DD")
+    if start > end:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    try:
+        buckets = await analytics_series.series(kind, granularity, start, end, today)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "granularity": granularity,
+        "timezone": "Asia/Kolkata",
+        "date_from": bucket_start(start, granularity).isoformat(),
+        "date_to": (bucket_end(bucket_start(end, granularity), granularity) - timedelta(days=1)).isoformat(),
+        "buckets": buckets,
+    }
+
+
+@app.get("/analytics/attendance-series")
+async def attendance_series(granularity: str = "day", date_from: str | None = None, date_to: str | None = None):
+    """
+    Check-ins per IST day, week (Mon-Sun) or month over date_from..date_to (widened to whole
+    buckets), each bucket split by batch and by membership type:
+    {"start": "2025-02-10", "end": "2025-02-16", "check_ins": 310, "by_batch": {...}, "by_membership_type": {...}}.
+    Closed buckets are computed once and stored (series.py).
+    """
+    return await _series_response("attendance", granularity, date_from, date_to)
+
+
+@app.get("/analytics/revenue-series")
+async def revenue_series(granularity: str = "day", date_from: str | None = None, date_to: str | None = None):
+    """
+    Money received (Paid fees by paid_at) per IST day, week or month, split by the member's batch
+    and membership type: {"start", "end", "amount", "payments", "by_batch": {...}, "by_membership_type": {...}}
+    (by_* values are amounts). Closed buckets are computed once and stored (series.py).
+    """
+    return await _series_response("revenue", granularity, date_from, date_to)
+
+
+# Fee reminders: members fetched per $in query (and aggregation cursor batch)
+REMINDER_BATCH_SIZE = 1000
+
+
+async def _fee_reminder_batches():
+    """
+    Yield lists of (member, pending_amount) for members with unpaid fees: one scan of member_balances
+    (ledger.py), then one $in member fetch per REMINDER_BATCH_SIZE members (no per-member find_one).
+    """
     from bson import ObjectId
-    cursor = payments_collection.find({"status": {"$in": ["Due", "Overdue"]}})
-    member_pending = {}
-    async for doc in cursor:
-        mid = doc["member_id"]
-        if mid not in member_pending:
-            member_pending[mid] = 0
-        member_pending[mid] += doc["amount"]
-    sent = 0
-    for mid, pending_amount in member_pending.items():
-        member = await members_collection.find_one({"_id": ObjectId(mid)})
-        if member:
-            background_tasks.add_task(
-                send_notification,
-                "fees_due",
-                {"name": member.get("name", ""), "phone": member.get("phone", ""), "email": member.get("email", "")},
-                {"pending_amount": pending_amount},
-            )
-            sent += 1
-    return {"message": f"Month-end reminders queued for {sent} member(s)."}
+    from bson.errors import InvalidId
+
+    projection = member_projection("run_fee_reminders")
+
+    async def fetch(pending: dict) -> list[tuple[dict, int]]:
+        oids = []
+        for mid in pending:
+            try:
+                oids.append(ObjectId(mid))
+            except (InvalidId, TypeError):
+                continue
+        cursor = members_collection.find({"_id": {"$in": oids}}, projection)
+        return [(m, pending[str(m["_id"])]) async for m in cursor]
+
+    pending: dict[str, int] = {}
+    balances = balances_collection.find({"pending_amount": {"$gt": 0}}, {"pending_amount": 1}).batch_size(REMINDER_BATCH_SIZE)
+    async for row in balances:
+        pending[row["_id"]] = row["pending_amount"]
+        if len(pending) >= REMINDER_BATCH_SIZE:
+            yield await fetch(pending)
+            pending = {}
+    if pending:
+        yield await fetch(pending)
+
+
+async def _send_fee_reminders(progress: dict) -> dict:
+    """Hand reminder batches to the notification outbox (one insert_many per batch). Updates progress as it goes."""
+    progress.update({"queued": 0})
+    async for batch in _fee_reminder_batches():
+        progress["queued"] += await notifier.enqueue_many([
+            ("fees_due", {"name": m.get("name", ""), "phone": m.get("phone", ""), "email": m.get("email", "")}, {"pending_amount": amount})
+            for m, amount in batch
+        ])
+    return dict(progress)
+
+
+@app.post("/admin/run-fee-reminders")
+async def run_fee_reminders():
+    """
+    Send Month-End Reminders: simulated WhatsApp to all members with unpaid fees.
+    Runs as a background job and returns its id at once; poll GET /admin/jobs/{job_id} for the queued count
+    and GET /admin/notifications for delivery.
+    """
+    job = background_jobs.start("fee_reminders", _send_fee_reminders)
+    return {"job_id": job["id"], "status": job["status"], "message": "Month-end reminders are being queued."}
+
+
+@app.get("/admin/notifications")
+async def notification_status():
+    """Notification outbox counts by status (pending/sending/sent/failed), queue depth and send counters."""
+    return await notifier.stats()
+
+
+@app.get("/admin/member-cache")
+async def member_cache_status():
+    """Member identity cache: size, hit ratio, evictions, invalidations and change stream state."""
+    return identity_cache.stats()
+
+
+@app.get("/admin/jobs/{job_id}")
+async def get_background_job(job_id: str):
+    """Status of a background job: running / done / failed, progress counters, result or error."""
+    job = background_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 @app.post("/admin/seed-inactive-test")
@@ -1168,8 +2126,19 @@ async def seed_inactive_test():
     ]
     inserted = []
     for doc in dummy_members:
-        result = await members_collection.insert_one(doc)
-        inserted.append({"id": str(result.inserted_id), "name": doc["name"]})
+        # Upsert by phone (unique): re-running the seed resets the same two members
+        created_at = doc.pop("created_at")
+        doc["phone_e164"] = normalize_phone(doc["phone"])
+        doc["search_tokens"] = member_search_tokens(doc["name"], doc["phone_e164"])
+        result = await members_collection.find_one_and_update(
+            {"phone_e164": doc["phone_e164"]},
+            {"$set": doc, "$setOnInsert": {"created_at": created_at}},
+            upsert=True,
+            return_document=True,
+        )
+        inserted.append({"id": str(result["_id"]), "name": doc["name"]})
+        identity_cache.invalidate(result["_id"])
+    _invalidate_dashboard()
     return {"message": "Created 2 test members with last check-in 91 days ago.", "members": inserted}
 
 
@@ -1190,75 +2159,75 @@ class BillingIssueWalkIn(BaseModel):
 async def billing_issue(body: BillingIssueWalkIn):
     """Walk-in flow: create member and issue first bill (Registration + 1st Month)."""
     from datetime import timezone
-    from bson import ObjectId
+    phone = body.phone.strip()
+    phone_e164 = _canonical_phone(phone)
     doc = {
         "name": body.name,
-        "phone": body.phone,
+        "phone": phone,
+        "phone_e164": phone_e164,
+        "search_tokens": member_search_tokens(body.name, phone_e164),
         "email": body.email,
         "membership_type": body.membership_type.value,
         "batch": body.batch.value,
         "status": "Active",
         "created_at": datetime.now(timezone.utc),
     }
-    result = await members_collection.insert_one(doc)
-    mid = str(result.inserted_id)
-    reg_amount = REGISTRATION_FEE
-    monthly_amount = MONTHLY_FEE_PT if body.membership_type == MembershipType.pt else MONTHLY_FEE_REGULAR
-    total = reg_amount + monthly_amount
-    items = [
-        {"description": "Registration", "amount": reg_amount},
-        {"description": "First Month", "amount": monthly_amount},
-    ]
-    inv_doc = {
-        "member_id": mid,
-        "member_name": body.name,
-        "items": items,
-        "total": total,
-        "status": "Unpaid",
-        "issued_at": datetime.now(timezone.utc),
-        "paid_at": None,
+    monthly_amount = monthly_fee(body.membership_type.value)
+    # Member, first invoice, registration + first monthly fee and registration message in one unit (enrollment.py)
+    try:
+        result = await enrollment.enroll(doc, REGISTRATION_FEE, monthly_amount, today_ist(), issue_invoice=True)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="A member with this phone is already registered")
+    identity_cache.invalidate(result["member"]["_id"], phone_e164=phone_e164)
+    _invalidate_dashboard()
+    return _invoice_row(result["invoice"])
+
+
+def _invoice_row(doc: dict) -> dict:
+    """InvoiceResponse-shaped dict (fields in model order) for an invoice document."""
+    return {
+        "id": str(doc["_id"]),
+        "member_id": doc["member_id"],
+        "member_name": doc.get("member_name", ""),
+        "items": doc.get("items", []),
+        "total": doc["total"],
+        "status": doc.get("status", "Unpaid"),
+        "issued_at": doc["issued_at"],
+        "paid_at": doc.get("paid_at"),
     }
-    inv_result = await invoices_collection.insert_one(inv_doc)
-    due_dt = datetime(today_ist().year, today_ist().month, today_ist().day, tzinfo=timezone.utc)
-    period = today_ist().strftime("%Y-%m")
-    await payments_collection.insert_many([
-        {"member_id": mid, "member_name": body.name, "amount": reg_amount, "fee_type": "registration", "period": None, "status": "Due", "due_date": due_dt, "paid_at": None, "created_at": datetime.now(timezone.utc)},
-        {"member_id": mid, "member_name": body.name, "amount": monthly_amount, "fee_type": "monthly", "period": period, "status": "Due", "due_date": due_dt, "paid_at": None, "created_at": datetime.now(timezone.utc)},
-    ])
-    _notify_registration(body.name, body.email, body.phone)
-    return InvoiceResponse(
-        id=str(inv_result.inserted_id),
-        member_id=mid,
-        member_name=body.name,
-        items=items,
-        total=total,
-        status="Unpaid",
-        issued_at=inv_doc["issued_at"],
-        paid_at=None,
-    )
 
 
 @app.get("/billing/history", response_model=list[InvoiceResponse])
 async def billing_history(
+    response: Response,
     member_id: str | None = None,
     search: str | None = None,
     date_from: str | None = None,
     date_to: str | None = None,
+    limit: int = 1000,
+    cursor: str | None = None,
+    stream: str | None = None,
 ):
-    """List invoices. Optional: member_id, search (invoice id or member name), date_from, date_to (YYYY-MM-DD)."""
+    """
+    List invoices, newest first. Optional: member_id, search, date_from, date_to (YYYY-MM-DD).
+    search matches the start of member name words, the last 6-10 characters of the invoice id, or the whole id (search.py).
+    Up to limit (max 1000) rows per call; the X-Next-Cursor response header continues (?cursor=...).
+    stream=ndjson: every matching invoice instead (limit ignored), one JSON object per line.
+    """
+    streaming = _stream_mode(stream)
     q = {}
     if member_id:
         q["member_id"] = member_id
     if search and search.strip():
-        from bson.regex import Regex
         from bson import ObjectId
-        s = search.strip()
-        or_clauses = [{"member_name": Regex(s, "i")}]
+        from search import invoice_search_filter
         try:
-            or_clauses.append({"_id": ObjectId(s)})
+            q["_id"] = ObjectId(search.strip())
         except Exception:
-            pass
-        q["$or"] = or_clauses
+            token_q = invoice_search_filter(search)
+            if token_q is None:
+                return Response(media_type=NDJSON_MEDIA_TYPE) if streaming else []
+            q.update(token_q)
     if date_from and len(date_from) == 10 and date_from[4] == "-" and date_from[7] == "-":
         from datetime import timezone
         start = datetime.strptime(date_from + " 00:00:00", "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
@@ -1276,24 +2245,15 @@ async def billing_history(
             q["issued_at"]["$lte"] = end
         else:
             q["issued_at"] = {"$lte": end}
-    cursor = invoices_collection.find(q).sort("issued_at", -1)
-    out = []
-    async for doc in cursor:
-        out.append(InvoiceResponse(
-            id=str(doc["_id"]),
-            member_id=doc["member_id"],
-            member_name=doc.get("member_name", ""),
-            items=doc.get("items", []),
-            total=doc["total"],
-            status=doc.get("status", "Unpaid"),
-            issued_at=doc["issued_at"],
-            paid_at=doc.get("paid_at"),
-        ))
-    return out
+    if streaming:
+        return _ndjson_response(invoices_collection, q, [("issued_at", -1)], _invoice_row, cursor, projection={"search_tokens": 0})
+    limit = min(max(1, limit), MAX_PAGE_SIZE)
+    docs = await _paginate(response, invoices_collection, q, [("issued_at", -1)], limit, cursor, projection={"search_tokens": 0})
+    return _rows_response(response, [_invoice_row(doc) for doc in docs])
 
 
 @app.post("/billing/pay", response_model=InvoiceResponse)
-async def billing_pay(invoice_id: str, background_tasks: BackgroundTasks):
+async def billing_pay(invoice_id: str):
     """Mark invoice as paid. Simulated UPI/cash. Sends payment notification."""
     from bson import ObjectId
     from datetime import timezone
@@ -1306,93 +2266,109 @@ async def billing_pay(invoice_id: str, background_tasks: BackgroundTasks):
         raise HTTPException(status_code=404, detail="Invoice not found")
     if doc.get("status") == "Paid":
         raise HTTPException(status_code=400, detail="Already paid")
-    now = datetime.now(timezone.utc)
-    await invoices_collection.update_one({"_id": oid}, {"$set": {"status": "Paid", "paid_at": now}})
-    member = await members_collection.find_one({"_id": ObjectId(doc["member_id"])})
+    # The fees billed on the invoice are paid with it (ledger.py)
+    updated = await ledger.pay_invoice(oid, datetime.now(timezone.utc))
+    if not updated:
+        raise HTTPException(status_code=400, detail="Already paid")
+    _invalidate_dashboard()
+    member = await identity_cache.get(doc["member_id"])
     if member:
-        background_tasks.add_task(_notify_payment_received, member.get("name", ""), doc["total"], member.get("email", ""), member.get("phone", ""))
-    updated = await invoices_collection.find_one({"_id": oid})
-    return InvoiceResponse(
-        id=str(updated["_id"]),
-        member_id=updated["member_id"],
-        member_name=updated.get("member_name", ""),
-        items=updated.get("items", []),
-        total=updated["total"],
-        status=updated["status"],
-        issued_at=updated["issued_at"],
-        paid_at=updated.get("paid_at"),
-    )
+        await _notify("payment_received", member, {"amount": doc["total"]})
+    return _invoice_row(updated)
+
+
+# ---------- Export to Excel / CSV (billing, members, payments; streamed, see exports.py) ----------
 
+def _export_query(date_field: str, date_from: str | None, date_to: str | None, status: str | None) -> dict:
+    """Filter for an export: IST calendar days [date_from, date_to] on date_field (either bound optional) and status."""
+    from datetime import timezone
+    q = {}
+    if status:
+        q["status"] = status
+    bounds = {}
+    try:
+        if date_from:
+            bounds["$gte"] = datetime.strptime(date_from, "%Y-%m-%d").replace(tzinfo=IST).astimezone(timezone.utc)
+        if date_to:
+            bounds["$lt"] = (datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)).replace(tzinfo=IST).astimezone(timezone.utc)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date_from and date_to must be YYYY-MM-DD")
+    if bounds:
+        q[date_field] = bounds
+    return q
+
+
+def _export_response(rows, columns: list[str], filename: str, fmt: str) -> StreamingResponse:
+    from exports import EXPORT_MEDIA_TYPES, export_chunks
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be xlsx or csv")
+    return StreamingResponse(
+        export_chunks(rows, columns, fmt),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename={filename}.{fmt}"},
+    )
 
-# ---------- Export to Excel (billing, members, payments) ----------
 
 @app.get("/export/billing")
-async def export_billing_excel():
-    """Export billing/invoices to Excel."""
-    import pandas as pd
-    cursor = invoices_collection.find().sort("issued_at", -1)
-    rows = []
-    async for doc in cursor:
-        rows.append({
-            "id": str(doc["_id"]),
-            "member_id": doc.get("member_id", ""),
-            "member_name": doc.get("member_name", ""),
-            "total": doc.get("total", 0),
-            "status": doc.get("status", ""),
-            "issued_at": str(doc.get("issued_at", "")),
-            "paid_at": str(doc.get("paid_at", "")) if doc.get("paid_at") else "",
-        })
-    df = pd.DataFrame(rows)
-    buf = BytesIO()
-    df.to_excel(buf, index=False, engine="openpyxl")
-    buf.seek(0)
-    return StreamingResponse(buf, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers={"Content-Disposition": "attachment; filename=billing_history.xlsx"}    )
+async def export_billing_excel(format: str = "xlsx", date_from: str | None = None, date_to: str | None = None, status: str | None = None):
+    """Export billing/invoices to Excel (or format=csv). Optional date_from/date_to (IST, on issued_at) and status (Paid/Unpaid)."""
+    from projections import INVOICES_EXPORT
+    columns = ["id", "member_id", "member_name", "total", "status", "issued_at", "paid_at"]
+    cursor = invoices_collection.find(_export_query("issued_at", date_from, date_to, status), INVOICES_EXPORT).sort("issued_at", -1)
+    rows = (
+        [
+            str(doc["_id"]),
+            doc.get("member_id", ""),
+            doc.get("member_name", ""),
+            doc.get("total", 0),
+            doc.get("status", ""),
+            str(doc.get("issued_at", "")),
+            str(doc.get("paid_at", "")) if doc.get("paid_at") else "",
+        ]
+        async for doc in cursor
+    )
+    return _export_response(rows, columns, "billing_history", format)
 
 
 @app.get("/export/members")
-async def export_members_excel():
-    """Export members list to Excel."""
-    import pandas as pd
-    cursor = members_collection.find().sort("created_at", -1)
-    rows = []
-    async for doc in cursor:
-        rows.append({
-            "id": str(doc["_id"]),
-            "name": doc.get("name", ""),
-            "phone": doc.get("phone", ""),
-            "email": doc.get("email", ""),
-            "membership_type": doc.get("membership_type", ""),
-            "batch": doc.get("batch", ""),
-            "status": doc.get("status", ""),
-            "last_attendance_date": str(_to_date(doc.get("last_attendance_date")) or ""),
-        })
-    df = pd.DataFrame(rows)
-    buf = BytesIO()
-    df.to_excel(buf, index=False, engine="openpyxl")
-    buf.seek(0)
-    return StreamingResponse(buf, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers={"Content-Disposition": "attachment; filename=members.xlsx"})
+async def export_members_excel(format: str = "xlsx", date_from: str | None = None, date_to: str | None = None, status: str | None = None):
+    """Export members list to Excel (or format=csv). Optional date_from/date_to (IST, on created_at) and status (Active/Inactive)."""
+    columns = ["id", "name", "phone", "email", "membership_type", "batch", "status", "last_attendance_date"]
+    cursor = members_collection.find(_export_query("created_at", date_from, date_to, status), member_projection("export_members")).sort("created_at", -1)
+    rows = (
+        [
+            str(doc["_id"]),
+            doc.get("name", ""),
+            doc.get("phone", ""),
+            doc.get("email", ""),
+            doc.get("membership_type", ""),
+            doc.get("batch", ""),
+            doc.get("status", ""),
+            str(_to_date(doc.get("last_attendance_date")) or ""),
+        ]
+        async for doc in cursor
+    )
+    return _export_response(rows, columns, "members", format)
 
 
 @app.get("/export/payments")
-async def export_payments_excel():
-    """Export payments list to Excel."""
-    import pandas as pd
-    cursor = payments_collection.find().sort("created_at", -1)
-    rows = []
-    async for doc in cursor:
-        rows.append({
-            "id": str(doc["_id"]),
-            "member_id": doc.get("member_id", ""),
-            "member_name": doc.get("member_name", ""),
-            "amount": doc.get("amount", 0),
-            "fee_type": doc.get("fee_type", ""),
-            "period": doc.get("period", ""),
-            "status": doc.get("status", ""),
-            "due_date": str(_to_date(doc.get("due_date")) or ""),
-            "paid_at": str(doc.get("paid_at")) if doc.get("paid_at") else "",
-        })
-    df = pd.DataFrame(rows)
-    buf = BytesIO()
-    df.to_excel(buf, index=False, engine="openpyxl")
-    buf.seek(0)
-    return StreamingResponse(buf, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers={"Content-Disposition": "attachment; filename=payments.xlsx"})
+async def export_payments_excel(format: str = "xlsx", date_from: str | None = None, date_to: str | None = None, status: str | None = None):
+    """Export payments list to Excel (or format=csv). Optional date_from/date_to (IST, on created_at) and status (Paid/Due/Overdue)."""
+    from projections import PAYMENTS_EXPORT
+    columns = ["id", "member_id", "member_name", "amount", "fee_type", "period", "status", "due_date", "paid_at"]
+    cursor = payments_collection.find(_export_query("created_at", date_from, date_to, status), PAYMENTS_EXPORT).sort("created_at", -1)
+    rows = (
+        [
+            str(doc["_id"]),
+            doc.get("member_id", ""),
+            doc.get("member_name", ""),
+            doc.get("amount", 0),
+            doc.get("fee_type", ""),
+            doc.get("period", ""),
+            doc.get("status", ""),
+            str(_to_date(doc.get("due_date")) or ""),
+            str(doc.get("paid_at")) if doc.get("paid_at") else "",
+        ]
+        async for doc in cursor
+    )
+    return _export_response(rows, columns, "payments", format)
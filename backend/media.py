@@ -0,0 +1,199 @@
+"""
+Member media storage for Jupiter Arena (media).
+
+Member photos and ID documents are stored as content-addressed blobs (SHA-256 of the bytes)
+outside gym_members. The member document keeps only a small descriptor:
+  {"sha256": "...", "size": 12345, "content_type": "image/jpeg"}
+and the API serves the bytes from GET /members/{id}/photo and /members/{id}/id-document.
+
+Backends:
+- GridFS (default, MEDIA_BACKEND=gridfs): bucket "member_media" in the app database.
+- Local filesystem (MEDIA_BACKEND=local, MEDIA_ROOT=dir): used by tests and local dev.
+
+A blob is deleted when no member references it any more. That reference check and the delete
+run under the blob's lock (MediaStore.guard), and so do a put and the member write that makes
+it referenced, so a release cannot delete content another request is attaching. The locks are
+per process; the API runs one worker (Procfile).
+
+Usage: from media import media_store_from_env, decode_base64, content_hash
+  store = media_store_from_env(db)
+  data = decode_base64(photo_base64)
+  async with store.guard(content_hash(data)):
+      meta = await store.put(data)
+      await members.update_one({"_id": oid}, {"$set": {"photo": meta}})
+"""
+
+import abc
+import asyncio
+import base64
+import binascii
+import hashlib
+import os
+import weakref
+from contextlib import AsyncExitStack, asynccontextmanager
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+GRIDFS_BUCKET = "member_media"
+
+
+def decode_base64(data: str) -> bytes:
+    """
+    Decode a base64 upload; accepts plain base64 or a data URI (data:image/png;base64,...), line
+    breaks allowed. Raises ValueError for anything else (characters outside the alphabet, bad padding).
+    """
+    if data.startswith("data:") and "," in data:
+        data = data.split(",", 1)[1]
+    try:
+        return base64.b64decode("".join(data.split()), validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"Invalid base64 data: {e}") from e
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 hex digest: the key a blob is stored (and locked) under."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def sniff_content_type(data: bytes) -> str:
+    """Best-effort content type from magic bytes (the app uploads JPEG/PNG photos and PDF/image IDs)."""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"%PDF"):
+        return "application/pdf"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Parse a single-range HTTP Range header ("bytes=0-99", "bytes=100-", "bytes=-50").
+    Returns inclusive (start, end), or None when there is no usable Range header (serve the whole blob).
+    Raises ValueError when the range cannot be satisfied (respond 416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_s == "":
+            length = int(end_s)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            return max(0, size - length), size - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+class MediaStore(abc.ABC):
+    """Content-addressed blob store. put() is idempotent: the same bytes are stored once."""
+
+    def __init__(self):
+        self._locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+
+    @asynccontextmanager
+    async def guard(self, *sha256s: str):
+        """Hold the locks of the given blobs (taken in hash order, so two guards never deadlock)."""
+        async with AsyncExitStack() as stack:
+            for sha256 in sorted(set(sha256s)):
+                lock = self._locks.get(sha256)
+                if lock is None:
+                    lock = self._locks[sha256] = asyncio.Lock()
+                await stack.enter_async_context(lock)
+            yield
+
+    async def put(self, data: bytes, content_type: str | None = None) -> dict:
+        sha256 = content_hash(data)
+        if not await self.exists(sha256):
+            await self._write(sha256, data)
+        return {"sha256": sha256, "size": len(data), "content_type": content_type or sniff_content_type(data)}
+
+    @abc.abstractmethod
+    async def exists(self, sha256: str) -> bool: ...
+
+    @abc.abstractmethod
+    async def read(self, sha256: str, start: int = 0, end: int | None = None) -> bytes:
+        """Read bytes [start, end] (inclusive); end=None reads to the end of the blob."""
+
+    @abc.abstractmethod
+    async def delete(self, sha256: str) -> None: ...
+
+    @abc.abstractmethod
+    async def _write(self, sha256: str, data: bytes) -> None: ...
+
+
+class GridFSMediaStore(MediaStore):
+    """Blobs in a GridFS bucket; the GridFS filename is the SHA-256."""
+
+    def __init__(self, db, bucket_name: str = GRIDFS_BUCKET):
+        super().__init__()
+        self._bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name)
+        self._files = db[f"{bucket_name}.files"]
+
+    async def exists(self, sha256: str) -> bool:
+        return await self._files.find_one({"filename": sha256}, {"_id": 1}) is not None
+
+    async def read(self, sha256: str, start: int = 0, end: int | None = None) -> bytes:
+        grid_out = await self._bucket.open_download_stream_by_name(sha256)
+        if start:
+            grid_out.seek(start)
+        size = None if end is None else end - start + 1
+        return await grid_out.read(size if size is not None else -1)
+
+    async def delete(self, sha256: str) -> None:
+        async for f in self._files.find({"filename": sha256}, {"_id": 1}):
+            await self._bucket.delete(f["_id"])
+
+    async def _write(self, sha256: str, data: bytes) -> None:
+        await self._bucket.upload_from_stream(sha256, data)
+
+
+class LocalMediaStore(MediaStore):
+    """Blobs as files under root/<first 2 hex chars>/<sha256>. File I/O runs in a worker thread."""
+
+    def __init__(self, root: str | Path):
+        super().__init__()
+        self.root = Path(root)
+
+    def _path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256
+
+    async def exists(self, sha256: str) -> bool:
+        return self._path(sha256).exists()
+
+    async def read(self, sha256: str, start: int = 0, end: int | None = None) -> bytes:
+        def _read():
+            with open(self._path(sha256), "rb") as f:
+                f.seek(start)
+                return f.read(-1 if end is None else end - start + 1)
+        return await asyncio.to_thread(_read)
+
+    async def delete(self, sha256: str) -> None:
+        await asyncio.to_thread(lambda: self._path(sha256).unlink(missing_ok=True))
+
+    async def _write(self, sha256: str, data: bytes) -> None:
+        def _write_file():
+            path = self._path(sha256)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        await asyncio.to_thread(_write_file)
+
+
+def media_store_from_env(db) -> MediaStore:
+    """MEDIA_BACKEND=gridfs (default) or local (MEDIA_ROOT, default ./media)."""
+    backend = os.environ.get("MEDIA_BACKEND", "gridfs").lower()
+    if backend == "local":
+        return LocalMediaStore(os.environ.get("MEDIA_ROOT", "media"))
+    return GridFSMediaStore(db)
@@ -0,0 +1,344 @@
+"""
+Notification dispatcher for Jupiter Arena (notifications).
+
+Request handlers never talk to a provider. They call enqueue(), which writes the message to the
+notification_outbox collection (so it survives a restart) and hands its id to a bounded
+in-memory queue. A pool of worker tasks drains the queue in batches, waits on a per-channel
+token bucket, and sends through the configured provider. Failed sends are retried with
+exponential backoff up to max_attempts, then marked failed. A sweeper re-queues outbox
+messages that are due for a retry, that did not fit in the queue, or that were left in
+"sending" by a worker that died.
+
+Outbox document:
+  {"_id": ObjectId, "type": "fees_due", "channel": "whatsapp", "user": {...}, "extra": {...},
+   "status": "pending" | "sending" | "sent" | "failed", "attempts": 0, "next_attempt_at": <utc>,
+   "claim": "<worker batch token>", "claimed_at": <utc>, "sent_at": <utc>, "last_error": "..."}
+
+Providers: ConsoleProvider (utils.send_notification, the default) and FakeProvider (tests).
+Select with NOTIFICATION_PROVIDER=console|fake.
+
+Usage: from notifications import NotificationDispatcher, provider_from_env
+  notifier = NotificationDispatcher(db["notification_outbox"], provider_from_env())
+  notifier.start()  ...  await notifier.enqueue("registration", {"name": ..., "phone": ...})
+  await notifier.stop()
+"""
+
+import abc
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL = "whatsapp"
+# Sustained messages/second and burst size per channel (provider quotas)
+DEFAULT_RATE_LIMITS = {"whatsapp": (20.0, 50), "email": (10.0, 20)}
+
+
+class TokenBucket:
+    """Token-bucket rate limiter: `rate` tokens per second, at most `capacity` saved up."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, n: int = 1) -> None:
+        """Wait until n tokens are available and take them. n larger than capacity is taken in chunks."""
+        async with self._lock:
+            while n > 0:
+                self._refill()
+                take = min(n, self.capacity)
+                if self.tokens >= take:
+                    self.tokens -= take
+                    n -= take
+                    continue
+                await asyncio.sleep((take - self.tokens) / self.rate)
+
+
+# ---------- Providers ----------
+class NotificationProvider(abc.ABC):
+    """Sends a batch of messages on one channel. Returns one error string (or None on success) per message."""
+
+    @abc.abstractmethod
+    async def send_batch(self, channel: str, messages: list[dict]) -> list[str | None]: ...
+
+
+class ConsoleProvider(NotificationProvider):
+    """Prints via utils.send_notification (simulated WhatsApp/Email), off the event loop."""
+
+    async def send_batch(self, channel: str, messages: list[dict]) -> list[str | None]:
+        from utils import send_notification
+
+        def send_all():
+            errors = []
+            for msg in messages:
+                try:
+                    send_notification(msg["type"], msg["user"], msg.get("extra"))
+                    errors.append(None)
+                except Exception as e:
+                    errors.append(str(e))
+            return errors
+
+        return await asyncio.to_thread(send_all)
+
+
+class FakeProvider(NotificationProvider):
+    """In-memory provider for tests: records sent messages; fail_next makes the next N sends fail."""
+
+    def __init__(self):
+        self.sent: list[dict] = []
+        self.batches: list[int] = []
+        self.fail_next = 0
+
+    async def send_batch(self, channel: str, messages: list[dict]) -> list[str | None]:
+        from utils import format_message
+        self.batches.append(len(messages))
+        errors = []
+        for msg in messages:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                errors.append("fake provider failure")
+                continue
+            self.sent.append({
+                "channel": channel,
+                "type": msg["type"],
+                "user": msg["user"],
+                "extra": msg.get("extra"),
+                "text": format_message(msg["type"], msg["user"], msg.get("extra")),
+            })
+            errors.append(None)
+        return errors
+
+
+PROVIDERS = {"console": ConsoleProvider, "fake": FakeProvider}
+
+
+def provider_from_env() -> NotificationProvider:
+    name = os.environ.get("NOTIFICATION_PROVIDER", "console").lower()
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown NOTIFICATION_PROVIDER {name!r} (expected one of {sorted(PROVIDERS)})")
+    return PROVIDERS[name]()
+
+
+# ---------- Dispatcher ----------
+class NotificationDispatcher:
+    def __init__(
+        self,
+        outbox_collection,
+        provider: NotificationProvider,
+        workers: int = 4,
+        queue_size: int = 1000,
+        batch_size: int = 50,
+        rate_limits: dict[str, tuple[float, int]] | None = None,
+        max_attempts: int = 5,
+        backoff_seconds: float = 2.0,
+        poll_seconds: float = 5.0,
+        stale_seconds: float = 300.0,
+    ):
+        self.outbox = outbox_collection
+        self.provider = provider
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+        self.buckets = {ch: TokenBucket(rate, burst) for ch, (rate, burst) in (rate_limits or DEFAULT_RATE_LIMITS).items()}
+        self.counters = {"enqueued": 0, "sent": 0, "retried": 0, "failed": 0}
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._queued: set = set()  # outbox ids currently in the in-memory queue
+        self._tasks: list[asyncio.Task] = []
+
+    # ----- producers (request handlers, jobs) -----
+    @staticmethod
+    def _outbox_doc(notification_type: str, user: dict, extra: dict | None, channel: str) -> dict:
+        return {
+            "type": notification_type,
+            "channel": channel,
+            "user": user,
+            "extra": extra or {},
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": datetime.now(timezone.utc),
+            "created_at": datetime.now(timezone.utc),
+        }
+
+    def _offer(self, outbox_id) -> None:
+        """Put an id on the queue if there is room; otherwise the sweeper picks it up from the outbox."""
+        if outbox_id in self._queued:
+            return
+        try:
+            self._queue.put_nowait(outbox_id)
+            self._queued.add(outbox_id)
+        except asyncio.QueueFull:
+            pass
+
+    async def enqueue(self, notification_type: str, user: dict, extra: dict | None = None, channel: str = DEFAULT_CHANNEL):
+        """Persist one message to the outbox and queue it. Never waits on the provider. Returns the outbox id."""
+        result = await self.outbox.insert_one(self._outbox_doc(notification_type, user, extra, channel))
+        self.counters["enqueued"] += 1
+        self._offer(result.inserted_id)
+        return result.inserted_id
+
+    def message(self, notification_type: str, user: dict, extra: dict | None = None, channel: str = DEFAULT_CHANNEL) -> dict:
+        """
+        Outbox document (with its _id) for a caller that writes it itself, e.g. inside its own
+        transaction. offer() the _id once the write has committed.
+        """
+        return {"_id": ObjectId(), **self._outbox_doc(notification_type, user, extra, channel)}
+
+    def offer(self, outbox_id) -> None:
+        """Queue a message the caller has already written to the outbox (see message())."""
+        self.counters["enqueued"] += 1
+        self._offer(outbox_id)
+
+    async def enqueue_many(self, messages: list[tuple[str, dict, dict | None]], channel: str = DEFAULT_CHANNEL) -> int:
+        """Persist (type, user, extra) messages with one insert_many and queue them. Returns the count."""
+        if not messages:
+            return 0
+        result = await self.outbox.insert_many([self._outbox_doc(t, u, e, channel) for t, u, e in messages], ordered=False)
+        self.counters["enqueued"] += len(result.inserted_ids)
+        for outbox_id in result.inserted_ids:
+            self._offer(outbox_id)
+        return len(result.inserted_ids)
+
+    # ----- lifecycle -----
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker(i), name=f"notify-worker-{i}") for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper(), name="notify-sweeper"))
+
+    async def stop(self) -> None:
+        """Stop workers. Anything not yet sent stays in the outbox and is picked up on the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def drain(self) -> None:
+        """Wait until every queued message has been attempted (tests, shutdown scripts)."""
+        await self._queue.join()
+
+    # ----- workers -----
+    async def _worker(self, index: int) -> None:
+        while True:
+            ids = [await self._queue.get()]
+            while len(ids) < self.batch_size and not self._queue.empty():
+                ids.append(self._queue.get_nowait())
+            try:
+                await self._process(ids)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Notification worker %d failed on a batch of %d", index, len(ids))
+            finally:
+                for outbox_id in ids:
+                    self._queued.discard(outbox_id)
+                    self._queue.task_done()
+
+    async def _claim(self, ids: list) -> list[dict]:
+        """Mark pending messages as sending under a fresh token (so two workers never send the same one) and load them."""
+        token = uuid.uuid4().hex
+        now = datetime.now(timezone.utc)
+        await self.outbox.update_many(
+            {"_id": {"$in": ids}, "status": "pending"},
+            {"$set": {"status": "sending", "claim": token, "claimed_at": now}},
+        )
+        return [doc async for doc in self.outbox.find({"claim": token})]
+
+    async def _process(self, ids: list) -> None:
+        docs = await self._claim(ids)
+        by_channel: dict[str, list[dict]] = {}
+        for doc in docs:
+            by_channel.setdefault(doc.get("channel", DEFAULT_CHANNEL), []).append(doc)
+        for channel, batch in by_channel.items():
+            bucket = self.buckets.get(channel)
+            if bucket is not None:
+                await bucket.acquire(len(batch))
+            try:
+                errors = await self.provider.send_batch(channel, batch)
+            except Exception as e:
+                logger.exception("Provider failed for a %s batch of %d", channel, len(batch))
+                errors = [str(e)] * len(batch)
+            await self._record(batch, errors)
+
+    async def _record(self, batch: list[dict], errors: list[str | None]) -> None:
+        now = datetime.now(timezone.utc)
+        ops = []
+        for doc, error in zip(batch, errors):
+            if error is None:
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"status": "sent", "sent_at": now}, "$inc": {"attempts": 1}}))
+                self.counters["sent"] += 1
+                continue
+            attempts = doc.get("attempts", 0) + 1
+            if attempts >= self.max_attempts:
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"status": "failed", "last_error": error, "attempts": attempts}}))
+                self.counters["failed"] += 1
+                logger.warning("Notification %s failed after %d attempts: %s", doc["_id"], attempts, error)
+            else:
+                delay = self.backoff_seconds * (2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {
+                    "status": "pending", "last_error": error, "attempts": attempts,
+                    "next_attempt_at": now + timedelta(seconds=delay),
+                }}))
+                self.counters["retried"] += 1
+        if ops:
+            await self.outbox.bulk_write(ops, ordered=False)
+
+    # ----- sweeper -----
+    async def sweep(self) -> int:
+        """Re-queue due pending messages and release stale claims. Returns how many ids were offered."""
+        now = datetime.now(timezone.utc)
+        await self.outbox.update_many(
+            {"status": "sending", "claimed_at": {"$lt": now - timedelta(seconds=self.stale_seconds)}},
+            {"$set": {"status": "pending"}},
+        )
+        room = self._queue.maxsize - self._queue.qsize()
+        if room <= 0:
+            return 0
+        offered = 0
+        cursor = self.outbox.find({"status": "pending", "next_attempt_at": {"$lte": now}}, {"_id": 1}).sort("next_attempt_at", 1).limit(room)
+        async for doc in cursor:
+            if doc["_id"] not in self._queued:
+                self._offer(doc["_id"])
+                offered += 1
+        return offered
+
+    async def _sweeper(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Notification sweep failed")
+            await asyncio.sleep(self.poll_seconds)
+
+    async def stats(self) -> dict:
+        """Outbox counts by status plus this process's queue depth and counters (for GET /admin/notifications)."""
+        by_status = {row["_id"]: row["count"] async for row in self.outbox.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])}
+        return {
+            "provider": type(self.provider).__name__,
+            "workers": self.workers,
+            "running": bool(self._tasks),
+            "queue_depth": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "outbox": by_status,
+            "counters": dict(self.counters),
+        }
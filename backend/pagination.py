@@ -0,0 +1,134 @@
+"""
+Keyset (cursor) pagination for Jupiter Arena list endpoints (pagination).
+
+skip/limit makes MongoDB walk and discard every skipped document, so deep pages get slower.
+Keyset pagination instead remembers the sort key of the last row served and asks for rows
+strictly after it: each page is one index range scan, at any depth, and rows inserted meanwhile
+do not shift pages. _id is always the final sort key, so the order is total even when sort
+values tie (two payments created in the same millisecond).
+
+The cursor is opaque to clients: url-safe base64 of the last row's sort values (BSON extended
+JSON, so datetimes and ObjectIds round-trip). List endpoints keep returning a plain JSON list
+and put the cursor for the next page in the X-Next-Cursor response header (absent on the last
+page); pass it back as ?cursor=... with the same filters and sort.
+
+scan() is the streaming counterpart: every row after the cursor (or from the start) in the
+same order, as a Motor cursor read STREAM_BATCH_SIZE documents per round trip, for endpoints
+that stream their whole result (?stream=ndjson) instead of paging it.
+
+Usage: from pagination import paginate, scan
+  docs, next_cursor = await paginate(payments_collection, q, [("created_at", -1)], limit, cursor)
+  async for doc in scan(payments_collection, q, [("created_at", -1)]): ...
+"""
+
+import base64
+
+from bson import json_util
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Documents per getMore when streaming: large enough to keep round trips rare, small enough
+# that the first rows go out quickly and only one batch is held in memory at a time.
+STREAM_BATCH_SIZE = 1000
+
+
+def encode_cursor(values: list) -> str:
+    raw = json_util.dumps(values, json_options=json_util.CANONICAL_JSON_OPTIONS).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Sort values from a cursor. Raises ValueError if it is malformed or was made for a different sort."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json_util.loads(raw)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def full_sort(sort: list[tuple[str, int]]) -> list[tuple[str, int]]:
+    """The sort with _id appended as tiebreaker (same direction as the last key)."""
+    if sort and sort[-1][0] == "_id":
+        return list(sort)
+    return list(sort) + [("_id", sort[-1][1] if sort else 1)]
+
+
+def after_filter(sort: list[tuple[str, int]], values: list) -> dict:
+    """
+    Filter for rows strictly after `values` in `sort` order:
+    (k1 > v1) or (k1 == v1 and k2 > v2) or ... with > / < following each key's direction.
+    """
+    branches = []
+    for i, (field, direction) in enumerate(sort):
+        branch = {f: v for (f, _), v in zip(sort[:i], values[:i])}
+        branch[field] = {"$gt" if direction == 1 else "$lt": values[i]}
+        branches.append(branch)
+    if len(branches) == 1:
+        return branches[0]
+    # The redundant bound on the first key lets the planner answer with one index range scan
+    first, direction = sort[0]
+    return {first: {"$gte" if direction == 1 else "$lte": values[0]}, "$or": branches}
+
+
+def _sort_value(doc: dict, field: str):
+    value = doc
+    for part in field.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def _after_cursor(query: dict, sort: list[tuple[str, int]], cursor: str | None) -> dict:
+    """query restricted to rows after cursor (sort must already be full_sort())."""
+    if not cursor:
+        return query
+    values = decode_cursor(cursor, len(sort))
+    return {"$and": [query, after_filter(sort, values)]} if query else after_filter(sort, values)
+
+
+async def paginate(collection, query: dict, sort: list[tuple[str, int]], limit: int, cursor: str | None = None, projection: dict | None = None, skip: int = 0, stages: list[dict] | None = None):
+    """
+    One page of `collection.find(query)` in `sort` order (plus _id). Returns (docs, next_cursor);
+    next_cursor is None on the last page. Raises ValueError for a bad cursor.
+    The sort fields must be in the projection (when one is given). skip is for callers that
+    still send offsets; it is ignored once a cursor is given.
+    stages: aggregation stages applied to the page after it is read (e.g. $project to format
+    fields server-side); the page is then read with aggregate() and the stages must keep the sort fields.
+    """
+    sort = full_sort(sort)
+    q = _after_cursor(query, sort, cursor)
+    skip = skip if skip and not cursor else 0
+    if stages is not None:
+        pipeline = [{"$match": q}, {"$sort": dict(sort)}]
+        if skip:
+            pipeline.append({"$skip": skip})
+        pipeline.append({"$limit": limit + 1})
+        if projection is not None:
+            pipeline.append({"$project": projection})
+        docs = [doc async for doc in collection.aggregate(pipeline + stages)]
+    else:
+        find = collection.find(q, projection).sort(sort)
+        if skip:
+            find = find.skip(skip)
+        docs = [doc async for doc in find.limit(limit + 1)]
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor([_sort_value(docs[-1], field) for field, _ in sort])
+
+
+def scan(collection, query: dict, sort: list[tuple[str, int]], cursor: str | None = None, projection: dict | None = None, stages: list[dict] | None = None, batch_size: int = STREAM_BATCH_SIZE):
+    """
+    Every document of `collection.find(query)` in `sort` order (plus _id), after cursor if one is
+    given, as a Motor cursor to iterate with `async for`. Same arguments as paginate() without the
+    page size; the cursor is decoded here, so a bad one raises ValueError before anything is read.
+    """
+    sort = full_sort(sort)
+    q = _after_cursor(query, sort, cursor)
+    if stages is not None:
+        pipeline = [{"$match": q}, {"$sort": dict(sort)}]
+        if projection is not None:
+            pipeline.append({"$project": projection})
+        return collection.aggregate(pipeline + stages, batchSize=batch_size)
+    return collection.find(q, projection).sort(sort).batch_size(batch_size)
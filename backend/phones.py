@@ -0,0 +1,89 @@
+"""
+Phone number normalization for Jupiter Arena (phones).
+
+Members type their number however they like ("98765 43210", "+91-98765-43210", "09876543210"),
+so gym_members keeps two fields:
+  phone:      as entered (display, exports, notifications)
+  phone_e164: canonical E.164 form ("+919876543210"), unique-indexed; member login looks it up
+
+backfill_phone_e164() fills phone_e164 for members written before the field existed.
+
+Rules: a leading "+" or "00" means the country code is included; otherwise a 10-digit number is
+Indian (DEFAULT_COUNTRY_CODE), optionally written with a trunk "0" or a "91" prefix. Spaces,
+dashes, dots and brackets are ignored. Anything else is not a phone number (None).
+
+Usage: from phones import normalize_phone
+  normalize_phone("098765 43210")  # "+919876543210"
+  await backfill_phone_e164(members_collection)
+"""
+
+import re
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+DEFAULT_COUNTRY_CODE = "91"
+NATIONAL_DIGITS = 10
+
+_SEPARATORS = re.compile(r"[\s\-.()/]")
+
+
+def normalize_phone(raw: str | None) -> str | None:
+    """E.164 form of raw ("+<country><number>"), or None if raw is not a phone number."""
+    if not raw:
+        return None
+    s = _SEPARATORS.sub("", raw.strip())
+    international = s.startswith("+") or s.startswith("00")
+    digits = s[1:] if s.startswith("+") else s[2:] if s.startswith("00") else s
+    if not digits.isdigit():
+        return None
+    if international:
+        # E.164: at most 15 digits including the country code, which never starts with 0
+        if not 8 <= len(digits) <= 15 or digits[0] == "0":
+            return None
+        return "+" + digits
+    if len(digits) == NATIONAL_DIGITS + 1 and digits[0] == "0":
+        digits = digits[1:]
+    elif len(digits) == NATIONAL_DIGITS + len(DEFAULT_COUNTRY_CODE) and digits.startswith(DEFAULT_COUNTRY_CODE):
+        digits = digits[len(DEFAULT_COUNTRY_CODE):]
+    if len(digits) != NATIONAL_DIGITS or digits[0] == "0":
+        return None
+    return "+" + DEFAULT_COUNTRY_CODE + digits
+
+
+async def backfill_phone_e164(members_collection, progress: dict | None = None, batch_size: int = 500) -> dict:
+    """
+    Set phone_e164 on members that lack it. Idempotent: only members without the field are read.
+    Numbers that cannot be normalized, and numbers whose canonical form another member already
+    holds, are left without phone_e164 and reported for manual correction.
+    """
+    progress = progress if progress is not None else {}
+    progress.update({"scanned": 0, "updated": 0})
+    invalid, conflicts = [], []
+
+    async def flush(ops: list, ids: list) -> None:
+        try:
+            result = await members_collection.bulk_write(ops, ordered=False)
+            progress["updated"] += result.modified_count
+        except BulkWriteError as e:
+            progress["updated"] += e.details.get("nModified", 0)
+            for err in e.details.get("writeErrors", []):
+                if err.get("code") != 11000:
+                    raise
+                conflicts.append(ids[err["index"]])
+
+    ops, ids = [], []
+    async for doc in members_collection.find({"phone_e164": {"$exists": False}}, {"phone": 1}):
+        progress["scanned"] += 1
+        canonical = normalize_phone(doc.get("phone"))
+        if canonical is None:
+            invalid.append({"id": str(doc["_id"]), "phone": doc.get("phone")})
+            continue
+        ops.append(UpdateOne({"_id": doc["_id"], "phone_e164": {"$exists": False}}, {"$set": {"phone_e164": canonical}}))
+        ids.append({"id": str(doc["_id"]), "phone": doc.get("phone"), "phone_e164": canonical})
+        if len(ops) >= batch_size:
+            await flush(ops, ids)
+            ops, ids = [], []
+    if ops:
+        await flush(ops, ids)
+    return {"scanned": progress["scanned"], "updated": progress["updated"], "invalid": invalid, "conflicts": conflicts}
@@ -0,0 +1,93 @@
+"""
+Named field projections for gym_members reads (projections).
+
+Member documents can be large (PT workout_schedule / diet_chart, legacy inline photo and ID
+document base64). Each endpoint declares which profile it reads members with, and the
+projection is applied in the MongoDB query so unused fields never cross the wire.
+
+Profiles:
+- id:       existence checks only
+- identity: name / contact / status, for check-in, payments and notifications
+- brief:    everything MemberResponse shows in list views (no PT plans, no media)
+- export:   columns of the members Excel export
+- full:     everything except legacy inline base64 blobs (see media.py) and search tokens; read
+            through member_stages(), which adds has_legacy_photo / has_legacy_id_document so a
+            member not yet moved to the media store still links its photo and ID document
+- media:    the whole document, legacy inline blobs included (GET /members/{id}?include_media=true)
+
+Usage: from projections import member_projection, member_stages
+  member = await members_collection.find_one({"_id": oid}, member_projection("check_in"))
+  cursor = members_collection.aggregate([{"$match": {"_id": oid}}, *member_stages("get_member_by_id")])
+"""
+
+MEMBER_PROFILES: dict[str, dict | None] = {
+    "id": {"_id": 1},
+    "identity": {"name": 1, "phone": 1, "phone_e164": 1, "email": 1, "status": 1, "membership_type": 1},
+    "brief": {
+        "name": 1, "phone": 1, "email": 1, "membership_type": 1, "batch": 1, "status": 1,
+        "created_at": 1, "last_attendance_date": 1,
+    },
+    "export": {
+        "name": 1, "phone": 1, "email": 1, "membership_type": 1, "batch": 1, "status": 1,
+        "last_attendance_date": 1,
+    },
+    "full": {"photo_base64": 0, "id_document_base64": 0, "search_tokens": 0},
+    "media": None,
+}
+
+# Profile each endpoint reads gym_members with. Keep in sync when adding a member read.
+ENDPOINT_PROFILES: dict[str, str] = {
+    "check_in": "identity",
+    "attendance_bulk": "identity",
+    "check_out": "id",
+    "member_attendance_stats": "id",
+    "log_monthly_payment": "identity",
+    "record_payment": "identity",
+    "billing_pay": "identity",
+    "run_fee_reminders": "identity",
+    "list_members": "full",
+    "list_members_brief": "brief",
+    "search_members": "brief",
+    "get_member_by_id": "full",
+    "get_member_by_id_media": "media",
+    "get_member_by_phone": "full",
+    "update_member": "full",
+    "update_member_photo": "full",
+    "update_member_id_document": "full",
+    "export_members": "export",
+}
+
+# Computed server-side for the full profile: whether a legacy inline blob is present, without reading it out
+LEGACY_MEDIA_FLAGS = {
+    "has_legacy_photo": {"$gt": [{"$ifNull": ["$photo_base64", ""]}, ""]},
+    "has_legacy_id_document": {"$gt": [{"$ifNull": ["$id_document_base64", ""]}, ""]},
+}
+
+
+def member_projection(endpoint: str) -> dict | None:
+    """Projection for an endpoint name (see ENDPOINT_PROFILES) or a profile name. None means the whole document."""
+    profile = ENDPOINT_PROFILES.get(endpoint, endpoint)
+    fields = MEMBER_PROFILES[profile]
+    return dict(fields) if fields is not None else None
+
+
+def member_stages(endpoint: str) -> list[dict]:
+    """
+    Aggregation stages applying an endpoint's profile: its projection, preceded for the full
+    profile by the LEGACY_MEDIA_FLAGS (a find projection cannot both exclude fields and compute them).
+    """
+    profile = ENDPOINT_PROFILES.get(endpoint, endpoint)
+    fields = MEMBER_PROFILES[profile]
+    stages = [{"$addFields": LEGACY_MEDIA_FLAGS}] if profile == "full" else []
+    return stages + ([{"$project": dict(fields)}] if fields is not None else [])
+
+
+# Today's attendance row as used for MemberResponse.today_status
+ATTENDANCE_TODAY_STATUS = {"member_id": 1, "check_in_at_utc": 1, "check_out_at_utc": 1}
+
+# Columns of the payments and billing exports (exports.py)
+PAYMENTS_EXPORT = {
+    "member_id": 1, "member_name": 1, "amount": 1, "fee_type": 1, "period": 1, "status": 1,
+    "due_date": 1, "paid_at": 1,
+}
+INVOICES_EXPORT = {"member_id": 1, "member_name": 1, "total": 1, "status": 1, "issued_at": 1, "paid_at": 1}
@@ -0,0 +1,212 @@
+"""
+Attendance rollups for Jupiter Arena (rollups).
+
+daily_attendance_stats holds one small document per IST date, kept current with atomic $inc
+from check-in, check-out and delete, so dashboard and summary cards read a handful of
+documents instead of counting attendance_logs:
+  {"_id": "2025-02-14", "check_ins": 42, "check_outs": 30,
+   "by_batch": {"Morning": {"check_ins": 20, "check_outs": 18}, ...}}
+
+The per-batch check_ins counter doubles as the capacity counter: reserve_check_in() increments
+it only while the batch is below capacity, in one conditional update.
+
+member_attendance_stats holds the same kind of running totals per member, for the member
+profile (total visits, visits per IST month, average workout duration):
+  {"_id": "<member_id>", "total_visits": 120, "by_month": {"2025-02": 9, ...},
+   "duration_sec_sum": 432000, "duration_count": 110}
+Durations come from duration_sec, stored on the attendance row at check-out.
+
+rebuild_daily_stats() / rebuild_member_stats() recompute the rollups from attendance_logs
+(repair / first deploy).
+
+Usage: from rollups import record_check_in, read_daily_stats
+  await record_check_in(daily_stats_collection, "2025-02-14", "Morning")
+  await record_member_visit(member_stats_collection, member_id, "2025-02-14")
+"""
+
+from datetime import datetime, timezone
+
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+
+async def record_check_in(stats_collection, date_ist: str, batch: str, delta: int = 1) -> None:
+    await stats_collection.update_one(
+        {"_id": date_ist},
+        {"$inc": {"check_ins": delta, f"by_batch.{batch}.check_ins": delta}},
+        upsert=True,
+    )
+
+
+async def reserve_check_in(stats_collection, date_ist: str, batch: str, capacity: int | None = None) -> bool:
+    """
+    Count a check-in only if the batch has fewer than `capacity` check-ins that day (no limit when None).
+    The check and the $inc are one atomic update, so concurrent check-ins can never overbook a batch.
+    Returns False when the batch is full. Undo with record_check_in(..., delta=-1) if the check-in is abandoned.
+    """
+    if capacity is None:
+        await record_check_in(stats_collection, date_ist, batch)
+        return True
+    field = f"by_batch.{batch}.check_ins"
+    update = {"$inc": {"check_ins": 1, field: 1}}
+    query = {"_id": date_ist, field: {"$not": {"$gte": capacity}}}
+    try:
+        # Upsert creates the day's document on the first check-in. If the document exists but the
+        # batch is full, the filter misses and the upsert collides on _id: the batch is full.
+        await stats_collection.update_one(query, update, upsert=True)
+        return True
+    except DuplicateKeyError:
+        # Also raised when two first-of-the-day upserts race; retry once against the existing document
+        result = await stats_collection.update_one(query, update)
+        return result.modified_count == 1
+
+
+async def record_check_out(stats_collection, date_ist: str, batch: str, delta: int = 1) -> None:
+    await stats_collection.update_one(
+        {"_id": date_ist},
+        {"$inc": {"check_outs": delta, f"by_batch.{batch}.check_outs": delta}},
+        upsert=True,
+    )
+
+
+async def record_delete(stats_collection, attendance_doc: dict) -> None:
+    """Undo a deleted attendance row's contribution (check-in, and check-out if it had one)."""
+    inc = {"check_ins": -1, f"by_batch.{attendance_doc['batch']}.check_ins": -1}
+    if attendance_doc.get("check_out_at_utc"):
+        inc["check_outs"] = -1
+        inc[f"by_batch.{attendance_doc['batch']}.check_outs"] = -1
+    await stats_collection.update_one({"_id": attendance_doc["date_ist"]}, {"$inc": inc})
+
+
+async def read_daily_stats(stats_collection, date_from: str, date_to: str) -> dict[str, dict]:
+    """Rollups for IST dates in [date_from, date_to] (YYYY-MM-DD), keyed by date. Missing dates had no check-ins."""
+    cursor = stats_collection.find({"_id": {"$gte": date_from, "$lte": date_to}})
+    return {doc["_id"]: doc async for doc in cursor}
+
+
+async def rebuild_daily_stats(attendance_collection, stats_collection, date_from: str | None = None, date_to: str | None = None) -> dict:
+    """
+    Recompute rollups from attendance_logs for [date_from, date_to] (whole history when omitted).
+    Rollups in the range with no matching attendance are removed. Returns {"days": n, "check_ins": n}.
+    Check-ins recorded while a rebuild runs can be miscounted; run it when the gym is quiet.
+    """
+    date_filter = {}
+    if date_from:
+        date_filter["$gte"] = date_from
+    if date_to:
+        date_filter["$lte"] = date_to
+    match = {"date_ist": date_filter} if date_filter else {}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"date_ist": "$date_ist", "batch": "$batch"},
+            "check_ins": {"$sum": 1},
+            "check_outs": {"$sum": {"$cond": [{"$ifNull": ["$check_out_at_utc", False]}, 1, 0]}},
+        }},
+    ]
+    days: dict[str, dict] = {}
+    async for row in attendance_collection.aggregate(pipeline):
+        d, batch = row["_id"]["date_ist"], row["_id"]["batch"]
+        day = days.setdefault(d, {"_id": d, "check_ins": 0, "check_outs": 0, "by_batch": {}})
+        day["check_ins"] += row["check_ins"]
+        day["check_outs"] += row["check_outs"]
+        day["by_batch"][batch] = {"check_ins": row["check_ins"], "check_outs": row["check_outs"]}
+    await stats_collection.delete_many({"_id": date_filter} if date_filter else {})
+    if days:
+        await stats_collection.bulk_write([ReplaceOne({"_id": d}, doc, upsert=True) for d, doc in days.items()], ordered=False)
+    return {"days": len(days), "check_ins": sum(d["check_ins"] for d in days.values())}
+
+
+# ---------- Per-member attendance stats ----------
+
+def duration_sec(check_in_at_utc: datetime, check_out_at_utc: datetime) -> int:
+    """Whole seconds between check-in and check-out (naive datetimes, as read from MongoDB, are UTC)."""
+    if check_in_at_utc.tzinfo is None:
+        check_in_at_utc = check_in_at_utc.replace(tzinfo=timezone.utc)
+    if check_out_at_utc.tzinfo is None:
+        check_out_at_utc = check_out_at_utc.replace(tzinfo=timezone.utc)
+    return max(0, int((check_out_at_utc - check_in_at_utc).total_seconds()))
+
+
+def _member_inc(date_ist: str | None, visits: int, duration: int, durations: int) -> dict:
+    inc = {}
+    if visits:
+        inc["total_visits"] = visits
+        inc[f"by_month.{date_ist[:7]}"] = visits
+    if durations:
+        inc["duration_sec_sum"] = duration
+        inc["duration_count"] = durations
+    return {"$inc": inc}
+
+
+def member_stats_update(member_id: str, date_ist: str | None = None, visits: int = 0, duration: int = 0, durations: int = 0) -> UpdateOne:
+    """UpdateOne for bulk_write: add visits in date_ist's month and `durations` check-outs totalling `duration` seconds."""
+    return UpdateOne({"_id": member_id}, _member_inc(date_ist, visits, duration, durations), upsert=True)
+
+
+async def record_member_visit(stats_collection, member_id: str, date_ist: str, delta: int = 1) -> None:
+    await stats_collection.update_one({"_id": member_id}, _member_inc(date_ist, delta, 0, 0), upsert=True)
+
+
+async def record_member_duration(stats_collection, member_id: str, seconds: int, delta: int = 1) -> None:
+    await stats_collection.update_one({"_id": member_id}, _member_inc(None, 0, seconds * delta, delta), upsert=True)
+
+
+async def record_member_delete(stats_collection, attendance_doc: dict) -> None:
+    """Undo a deleted attendance row's visit (and duration, if it was checked out)."""
+    seconds = attendance_doc.get("duration_sec")
+    update = _member_inc(attendance_doc["date_ist"], -1, -(seconds or 0), -1 if seconds is not None else 0)
+    await stats_collection.update_one({"_id": attendance_doc["member_id"]}, update)
+
+
+async def read_member_stats(stats_collection, member_id: str) -> dict:
+    """Stats document for a member (zeros if the member never checked in)."""
+    doc = await stats_collection.find_one({"_id": member_id})
+    return doc or {"_id": member_id, "total_visits": 0, "by_month": {}, "duration_sec_sum": 0, "duration_count": 0}
+
+
+async def backfill_duration_sec(attendance_collection, member_id: str | None = None, batch_size: int = 1000) -> int:
+    """Store duration_sec on checked-out rows written before it existed. Returns the number of rows updated."""
+    query = {"check_out_at_utc": {"$ne": None}, "duration_sec": {"$exists": False}}
+    if member_id:
+        query["member_id"] = member_id
+    updated, ops = 0, []
+    async for doc in attendance_collection.find(query, {"check_in_at_utc": 1, "check_out_at_utc": 1}):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"duration_sec": duration_sec(doc["check_in_at_utc"], doc["check_out_at_utc"])}}))
+        if len(ops) >= batch_size:
+            updated += (await attendance_collection.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        updated += (await attendance_collection.bulk_write(ops, ordered=False)).modified_count
+    return updated
+
+
+async def rebuild_member_stats(attendance_collection, stats_collection, member_id: str | None = None) -> dict:
+    """
+    Recompute member_attendance_stats from attendance_logs (one member, or everyone when omitted),
+    backfilling duration_sec first. Same caveat as rebuild_daily_stats: run it when the gym is quiet.
+    Returns {"members": n, "visits": n, "durations_backfilled": n}.
+    """
+    backfilled = await backfill_duration_sec(attendance_collection, member_id)
+    match = {"member_id": member_id} if member_id else {}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"member_id": "$member_id", "month": {"$substr": ["$date_ist", 0, 7]}},
+            "visits": {"$sum": 1},
+            "duration_sec_sum": {"$sum": {"$ifNull": ["$duration_sec", 0]}},
+            "duration_count": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$duration_sec", None]}, None]}, 0, 1]}},
+        }},
+    ]
+    members: dict[str, dict] = {}
+    async for row in attendance_collection.aggregate(pipeline):
+        mid, month = row["_id"]["member_id"], row["_id"]["month"]
+        doc = members.setdefault(mid, {"_id": mid, "total_visits": 0, "by_month": {}, "duration_sec_sum": 0, "duration_count": 0})
+        doc["total_visits"] += row["visits"]
+        doc["by_month"][month] = row["visits"]
+        doc["duration_sec_sum"] += row["duration_sec_sum"]
+        doc["duration_count"] += row["duration_count"]
+    await stats_collection.delete_many({"_id": member_id} if member_id else {})
+    if members:
+        await stats_collection.bulk_write([ReplaceOne({"_id": mid}, doc, upsert=True) for mid, doc in members.items()], ordered=False)
+    return {"members": len(members), "visits": sum(d["total_visits"] for d in members.values()), "durations_backfilled": backfilled}
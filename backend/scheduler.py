@@ -0,0 +1,188 @@
+"""
+In-process background scheduler for Jupiter Arena (scheduler).
+
+Periodic maintenance (Due -> Overdue, 90-day inactive sweep, month rollover) runs here instead
+of inside request handlers. The scheduler is started from the app lifespan hook. When several
+workers run, a lease document in MongoDB makes sure only one of them (the leader) runs jobs:
+  scheduler_leases {"_id": "scheduler", "owner": "host:pid:xxxx", "expires_at": <utc>}
+While the leader runs jobs, a heartbeat task renews the lease every third of its length, and
+the lease is confirmed again before each job, so a long job (ledger reconcile, month rollover)
+cannot outlive the lease and let a second worker start the same jobs. A leader that finds its
+lease gone stops after the current job.
+Each job's last run is persisted ({"_id": "job:<name>", ...}) so a restart does not re-run a job
+early, and the leader keeps a short in-memory history for GET /admin/scheduler.
+
+Usage: from scheduler import Scheduler
+  scheduler = Scheduler(db["scheduler_leases"])
+  scheduler.add_job("mark_overdue", mark_overdue, interval_seconds=600)
+  scheduler.start()  ...  await scheduler.stop()
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+LEASE_ID = "scheduler"
+HISTORY_SIZE = 20
+
+
+class Job:
+    def __init__(self, name: str, func, interval_seconds: float):
+        self.name = name
+        self.func = func  # async callable returning a JSON-able result (e.g. {"updated_count": 3})
+        self.interval_seconds = interval_seconds
+        self.history: deque = deque(maxlen=HISTORY_SIZE)
+
+
+class Scheduler:
+    def __init__(self, leases_collection, tick_seconds: float = 60, lease_seconds: float | None = None, owner: str | None = None):
+        self.leases = leases_collection
+        self.tick_seconds = tick_seconds
+        self.lease_seconds = lease_seconds or tick_seconds * 3
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs: dict[str, Job] = {}
+        self.is_leader = False
+        self._task: asyncio.Task | None = None
+
+    def add_job(self, name: str, func, interval_seconds: float) -> None:
+        self.jobs[name] = Job(name, func, interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="scheduler")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            await self.leases.delete_one({"_id": LEASE_ID, "owner": self.owner})
+            self.is_leader = False
+
+    async def acquire_lease(self) -> bool:
+        """Take or renew the leader lease. Returns True if this process is the leader."""
+        now = datetime.now(timezone.utc)
+        try:
+            await self.leases.find_one_and_update(
+                {"_id": LEASE_ID, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            self.is_leader = True
+        except DuplicateKeyError:
+            # Another worker holds an unexpired lease (our filter missed, so the upsert collided on _id)
+            self.is_leader = False
+        return self.is_leader
+
+    async def renew_lease(self) -> bool:
+        """Extend the lease only if this process still holds it. Returns False (and stops leading) if it was lost."""
+        now = datetime.now(timezone.utc)
+        result = await self.leases.update_one(
+            {"_id": LEASE_ID, "owner": self.owner},
+            {"$set": {"expires_at": now + timedelta(seconds=self.lease_seconds)}},
+        )
+        self.is_leader = result.matched_count == 1
+        return self.is_leader
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await self.renew_lease():
+                    logger.warning("Scheduler lease lost to another worker while running jobs")
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduler lease renewal failed")
+
+    async def run_due_jobs(self) -> list[str]:
+        """Run the jobs that are due, one at a time, holding the lease throughout. Returns the names run."""
+        ran = []
+        heartbeat = asyncio.create_task(self._heartbeat(), name="scheduler-heartbeat")
+        try:
+            for job in await self._due_jobs():
+                if not await self.renew_lease():
+                    logger.warning("Scheduler lease lost; leaving %s to the new leader", job.name)
+                    break
+                await self.run_job(job.name)
+                ran.append(job.name)
+        finally:
+            heartbeat.cancel()
+        return ran
+
+    async def run_job(self, name: str) -> dict:
+        """Run one job now, recording duration and result. Does not check the lease."""
+        job = self.jobs[name]
+        started_at = datetime.now(timezone.utc)
+        t0 = time.perf_counter()
+        run = {"started_at": started_at, "owner": self.owner}
+        try:
+            run["result"] = await job.func()
+            run["ok"] = True
+        except Exception as e:
+            logger.exception("Scheduled job %s failed", name)
+            run["ok"] = False
+            run["error"] = str(e)
+        run["duration_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        job.history.appendleft(run)
+        await self.leases.update_one({"_id": f"job:{name}"}, {"$set": {"last_run": run}}, upsert=True)
+        return run
+
+    async def _due_jobs(self) -> list[Job]:
+        now = datetime.now(timezone.utc)
+        last_runs = {doc["_id"]: doc.get("last_run", {}) async for doc in self.leases.find({"_id": {"$in": [f"job:{n}" for n in self.jobs]}})}
+        due = []
+        for job in self.jobs.values():
+            started_at = last_runs.get(f"job:{job.name}", {}).get("started_at")
+            if started_at is not None and started_at.tzinfo is None:
+                started_at = started_at.replace(tzinfo=timezone.utc)
+            if started_at is None or (now - started_at).total_seconds() >= job.interval_seconds:
+                due.append(job)
+        return due
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                if await self.acquire_lease():
+                    await self.run_due_jobs()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduler tick failed")
+            await asyncio.sleep(self.tick_seconds)
+
+    async def status(self) -> dict:
+        """Leader, jobs, last persisted run per job and this process's recent runs (for GET /admin/scheduler)."""
+        lease = await self.leases.find_one({"_id": LEASE_ID}) or {}
+        last_runs = {doc["_id"]: doc.get("last_run") async for doc in self.leases.find({"_id": {"$in": [f"job:{n}" for n in self.jobs]}})}
+        return {
+            "owner": self.owner,
+            "is_leader": self.is_leader,
+            "leader": lease.get("owner"),
+            "lease_expires_at": lease.get("expires_at"),
+            "jobs": [
+                {
+                    "name": job.name,
+                    "interval_seconds": job.interval_seconds,
+                    "last_run": last_runs.get(f"job:{job.name}"),
+                    "recent_runs": list(job.history),
+                }
+                for job in self.jobs.values()
+            ],
+        }
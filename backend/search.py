@@ -0,0 +1,163 @@
+"""
+Typeahead search over members and invoices for Jupiter Arena (search).
+
+A case-insensitive regex on member_name cannot use an index, so every keystroke scanned every
+invoice. Instead each member and invoice stores a precomputed array of lowercase tokens, with a
+multikey index on it:
+  members:  prefixes of every name word ("ravi kumar" -> r, ra, rav, ravi, k, ku, ...), every
+            whole name word marked with EXACT ("=ravi", "=kumar") and suffixes of the 10-digit
+            phone ("3210", "43210", ... "9876543210")
+  invoices: prefixes of every member_name word and the last 6..10 hex chars of the invoice id
+            (the whole id is matched on _id by the caller)
+A query is split into terms and matched with {"search_tokens": {"$all": [...]}}: one index
+lookup on the first term, at most SEARCH_CANDIDATES documents read, ranked in Python.
+A short prefix ("ra") can match thousands of members, so member search widens in passes
+until limit is filled: every term a whole word, then all but the last term a whole word,
+then prefixes only. An exact "Ravi" is therefore never cut before ranking.
+
+Prefixes are indexed up to MAX_PREFIX characters; longer terms are looked up by their first
+MAX_PREFIX characters and checked in full while ranking. A query that is only digits (spaces,
+"+" and dashes allowed) is one phone term: its last 10 digits.
+
+Usage: from search import member_search_tokens, search_members
+  doc["search_tokens"] = member_search_tokens(doc["name"], doc["phone_e164"])
+  members = await search_members(members_collection, "ravi 32", limit=20)
+"""
+
+import re
+
+from pymongo import UpdateOne
+
+MAX_PREFIX = 10
+PHONE_DIGITS = 10
+MIN_PHONE_SUFFIX = 4
+MIN_ID_SUFFIX = 6
+SEARCH_CANDIDATES = 200
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 50
+EXACT = "="
+
+_WORD = re.compile(r"\w+")
+_PHONE_QUERY = re.compile(r"^\+?[\d\s\-]+$")
+
+
+def _words(text: str | None) -> list[str]:
+    return _WORD.findall((text or "").lower())
+
+
+def _prefixes(text: str | None) -> set[str]:
+    return {word[:n] for word in _words(text) for n in range(1, min(len(word), MAX_PREFIX) + 1)}
+
+
+def _suffixes(value: str, shortest: int, longest: int) -> set[str]:
+    return {value[-n:] for n in range(shortest, min(len(value), longest) + 1)}
+
+
+def member_search_tokens(name: str | None, phone_e164: str | None) -> list[str]:
+    tokens = _prefixes(name) | {EXACT + word for word in _words(name)}
+    if phone_e164:
+        tokens |= _suffixes(phone_e164[-PHONE_DIGITS:], MIN_PHONE_SUFFIX, PHONE_DIGITS)
+    return sorted(tokens)
+
+
+def invoice_search_tokens(invoice_id, member_name: str | None) -> list[str]:
+    return sorted(_prefixes(member_name) | _suffixes(str(invoice_id), MIN_ID_SUFFIX, MAX_PREFIX))
+
+
+def query_terms(q: str | None) -> list[str]:
+    """Search terms of a query (lowercase, deduplicated, in order). Empty for a blank query."""
+    q = (q or "").strip()
+    if _PHONE_QUERY.match(q):
+        digits = re.sub(r"\D", "", q)
+        if len(digits) >= MIN_PHONE_SUFFIX:
+            return [digits[-PHONE_DIGITS:]]
+    return list(dict.fromkeys(_words(q)))
+
+
+def token_filter(terms: list[str], exact: int = 0) -> dict:
+    """
+    Query on search_tokens matching documents that contain every term. The first `exact`
+    terms must be whole name words; the rest match as prefixes (or phone / id suffixes).
+    """
+    tokens = [EXACT + term for term in terms[:exact]] + [term[:MAX_PREFIX] for term in terms[exact:]]
+    tokens = list(dict.fromkeys(tokens))
+    return {"search_tokens": tokens[0]} if len(tokens) == 1 else {"search_tokens": {"$all": tokens}}
+
+
+def _rank(terms: list[str], text: str | None, extra: str = "") -> tuple | None:
+    """
+    Sort key for a candidate (lower is better), or None if a term does not really match
+    (terms longer than MAX_PREFIX, or prefixes that only matched the phone / id).
+    Exact word > word prefix > phone / id suffix; earlier words and shorter names first.
+    """
+    words = _words(text)
+    score = 0
+    first_hit = len(words)
+    for term in terms:
+        positions = [i for i, word in enumerate(words) if word.startswith(term)]
+        if positions:
+            score += 0 if term in words else 1
+            first_hit = min(first_hit, positions[0])
+        elif extra.endswith(term):
+            score += 2
+        else:
+            return None
+    return (score, first_hit, len(text or ""), (text or "").lower())
+
+
+async def search_members(members_collection, q: str, limit: int = SEARCH_LIMIT, projection: dict | None = None) -> list[dict]:
+    """Best `limit` members for q by name words and phone suffix; Active members rank first on ties."""
+    terms = query_terms(q)
+    if not terms:
+        return []
+    if projection is not None:
+        projection = {**projection, "name": 1, "phone_e164": 1, "status": 1}
+    ranked = []
+    seen = []
+    # Whole words first, then the last term as a prefix, then every term as a prefix
+    for exact in dict.fromkeys((len(terms), len(terms) - 1, 0)):
+        query = token_filter(terms, exact)
+        if seen:
+            query["_id"] = {"$nin": seen}
+        async for doc in members_collection.find(query, projection).limit(SEARCH_CANDIDATES):
+            seen.append(doc["_id"])
+            key = _rank(terms, doc.get("name"), (doc.get("phone_e164") or "")[-PHONE_DIGITS:])
+            if key is not None:
+                ranked.append((key + (doc.get("status") != "Active",), doc))
+        if len(ranked) >= limit:
+            break
+    ranked.sort(key=lambda pair: pair[0])
+    return [doc for _, doc in ranked[:limit]]
+
+
+def invoice_search_filter(q: str) -> dict | None:
+    """search_tokens filter for a billing_history search, or None for a blank query."""
+    terms = query_terms(q)
+    return token_filter(terms) if terms else None
+
+
+async def backfill_search_tokens(members_collection, invoices_collection, progress: dict | None = None, batch_size: int = 500) -> dict:
+    """
+    Set search_tokens on members and invoices that lack it, and on members whose tokens predate
+    the EXACT word tokens. Idempotent; run after deploying search.
+    """
+    progress = progress if progress is not None else {}
+    progress.update({"members": 0, "invoices": 0})
+
+    async def fill(collection, key: str, query: dict, fields: dict, tokens_for) -> None:
+        ops = []
+        async for doc in collection.find(query, fields):
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"search_tokens": tokens_for(doc)}}))
+            if len(ops) >= batch_size:
+                await collection.bulk_write(ops, ordered=False)
+                progress[key] += len(ops)
+                ops = []
+        if ops:
+            await collection.bulk_write(ops, ordered=False)
+            progress[key] += len(ops)
+
+    await fill(members_collection, "members", {"search_tokens": {"$not": re.compile("^" + re.escape(EXACT))}},
+               {"name": 1, "phone_e164": 1}, lambda d: member_search_tokens(d.get("name"), d.get("phone_e164")))
+    await fill(invoices_collection, "invoices", {"search_tokens": {"$exists": False}}, {"member_name": 1},
+               lambda d: invoice_search_tokens(d["_id"], d.get("member_name")))
+    return {"members": progress["members"], "invoices": progress["invoices"]}
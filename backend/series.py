@@ -0,0 +1,190 @@
+"""
+Time-series analytics for Jupiter Arena (series).
+
+Chart data for the dashboard: check-ins (attendance_logs) and money received (Paid payments)
+per IST day, week (Monday to Sunday) or month, each bucket broken down by batch and by
+membership type. One aggregation computes a whole range: $match on the indexed date field and
+one $group on bucket start x member (x batch for check-ins). The bucket start is formatted in
+Asia/Kolkata with $dateToString (a week starts $isoDayOfWeek - 1 days earlier; IST has no DST).
+The members' batch / membership type are then read with one $in query per MEMBER_BATCH_SIZE
+members, as the fee reminders do, instead of a $lookup. Revenue buckets use the member's
+batch; check-ins the batch they were filed under.
+
+A bucket whose last day is before today (IST) is closed: it is materialized in analytics_series
+the first time it is asked for and read from there afterwards, so only the open bucket (this
+day / week / month) is aggregated again:
+  {"_id": "attendance:week:2025-02-10", "kind": "attendance", "granularity": "week",
+   "start": "2025-02-10", "end": "2025-02-17" (exclusive), "bucket": {...}, "computed_at": <utc>}
+Writes that land in a closed bucket (a replayed or deleted check-in, a payment logged with a
+past date or corrected) call invalidate(), which drops the buckets covering that day; they
+are recomputed on the next read. Membership type and batch are the member's when the bucket
+was computed. Runs on MongoDB 4.0+, like the rest of the app (no $dateTrunc, no $lookup).
+
+Usage: from series import AnalyticsSeries
+  series = AnalyticsSeries(attendance_collection, payments_collection, members_collection, series_collection)
+  buckets = await series.series("attendance", "week", date(2025, 1, 1), date(2025, 3, 31), today_ist())
+  await series.invalidate("revenue", ["2025-02-14"], today_ist())
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+SERIES_TIMEZONE = "Asia/Kolkata"
+GRANULARITIES = ("day", "week", "month")
+MAX_BUCKETS = 400
+MEMBER_BATCH_SIZE = 1000
+
+_IST = ZoneInfo(SERIES_TIMEZONE)
+
+
+def bucket_start(day: date, granularity: str) -> date:
+    """First IST day of the bucket containing day."""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def bucket_end(start: date, granularity: str) -> date:
+    """First IST day after the bucket starting at start."""
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if granularity == "month":
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start + timedelta(days=1)
+
+
+def bucket_starts(date_from: date, date_to: date, granularity: str) -> list[date]:
+    """Starts of the whole buckets covering IST days date_from..date_to."""
+    starts, start = [], bucket_start(date_from, granularity)
+    while start <= date_to:
+        starts.append(start)
+        start = bucket_end(start, granularity)
+    return starts
+
+
+def ist_day(dt: datetime) -> str:
+    """IST date ("YYYY-MM-DD") of a datetime (naive datetimes, as read from MongoDB, are UTC)."""
+    return dt.replace(tzinfo=dt.tzinfo or timezone.utc).astimezone(_IST).date().isoformat()
+
+
+def _utc(day: date) -> datetime:
+    """IST midnight of day, in UTC."""
+    return datetime(day.year, day.month, day.day, tzinfo=_IST).astimezone(timezone.utc)
+
+
+def _bucket_start_expr(time_field: str, granularity: str) -> dict:
+    """Aggregation expression: IST date ("YYYY-MM-DD") starting the bucket of the datetime in time_field."""
+    date = time_field
+    if granularity == "week":
+        weekday = {"$isoDayOfWeek": {"date": time_field, "timezone": SERIES_TIMEZONE}}
+        date = {"$subtract": [time_field, {"$multiply": [{"$subtract": [weekday, 1]}, 24 * 3600 * 1000]}]}
+    fmt = "%Y-%m-01" if granularity == "month" else "%Y-%m-%d"
+    return {"$dateToString": {"format": fmt, "date": date, "timezone": SERIES_TIMEZONE}}
+
+
+class AnalyticsSeries:
+    def __init__(self, attendance_collection, payments_collection, members_collection, series_collection):
+        self.attendance = attendance_collection
+        self.payments = payments_collection
+        self.members = members_collection
+        self.store = series_collection
+
+    def _pipeline(self, kind: str, granularity: str, start: date, end: date) -> tuple:
+        """(collection, pipeline) grouping kind's rows in IST days [start, end) by bucket and member (and batch for check-ins)."""
+        if kind == "attendance":
+            collection, time_field = self.attendance, "$check_in_at_utc"
+            match = {"date_ist": {"$gte": start.isoformat(), "$lt": end.isoformat()}}
+            group_id = {"start": _bucket_start_expr(time_field, granularity), "member_id": "$member_id", "batch": "$batch"}
+            value = 1
+        else:
+            collection, time_field = self.payments, "$paid_at"
+            match = {"status": "Paid", "paid_at": {"$gte": _utc(start), "$lt": _utc(end)}}
+            group_id = {"start": _bucket_start_expr(time_field, granularity), "member_id": "$member_id"}
+            value = "$amount"
+        pipeline = [{"$match": match}, {"$group": {"_id": group_id, "value": {"$sum": value}, "count": {"$sum": 1}}}]
+        return collection, pipeline
+
+    async def _member_fields(self, member_ids: set[str]) -> dict[str, dict]:
+        """batch / membership_type of each member, one $in query per MEMBER_BATCH_SIZE members."""
+        oids = []
+        for mid in member_ids:
+            try:
+                oids.append(ObjectId(mid))
+            except Exception:
+                continue
+        out = {}
+        for i in range(0, len(oids), MEMBER_BATCH_SIZE):
+            query = {"_id": {"$in": oids[i:i + MEMBER_BATCH_SIZE]}}
+            async for doc in self.members.find(query, {"batch": 1, "membership_type": 1}):
+                out[str(doc["_id"])] = doc
+        return out
+
+    @staticmethod
+    def _empty(kind: str, start: date, granularity: str) -> dict:
+        last_day = (bucket_end(start, granularity) - timedelta(days=1)).isoformat()
+        if kind == "attendance":
+            return {"start": start.isoformat(), "end": last_day, "check_ins": 0, "by_batch": {}, "by_membership_type": {}}
+        return {"start": start.isoformat(), "end": last_day, "amount": 0, "payments": 0, "by_batch": {}, "by_membership_type": {}}
+
+    async def _compute(self, kind: str, granularity: str, starts: list[date]) -> dict[str, dict]:
+        """Buckets for starts (ascending), from one aggregation over their span."""
+        buckets = {s.isoformat(): self._empty(kind, s, granularity) for s in starts}
+        collection, pipeline = self._pipeline(kind, granularity, starts[0], bucket_end(starts[-1], granularity))
+        total = "check_ins" if kind == "attendance" else "amount"
+        rows = [row async for row in collection.aggregate(pipeline) if row["_id"]["start"] in buckets]
+        members = await self._member_fields({row["_id"].get("member_id") for row in rows if row["_id"].get("member_id")})
+        for row in rows:
+            bucket = buckets[row["_id"]["start"]]
+            member = members.get(row["_id"].get("member_id"), {})
+            bucket[total] += row["value"]
+            if kind == "revenue":
+                bucket["payments"] += row["count"]
+            keys = {
+                "by_batch": (row["_id"].get("batch") if kind == "attendance" else member.get("batch")) or "Unknown",
+                "by_membership_type": member.get("membership_type") or "Unknown",
+            }
+            for field, key in keys.items():
+                bucket[field][key] = bucket[field].get(key, 0) + row["value"]
+        return buckets
+
+    async def series(self, kind: str, granularity: str, date_from: date, date_to: date, today: date) -> list[dict]:
+        """
+        kind ("attendance" | "revenue") per bucket of granularity over the whole buckets covering
+        IST days date_from..date_to, oldest first. Closed buckets come from (and go to) analytics_series.
+        Raises ValueError for an unknown kind / granularity or more than MAX_BUCKETS buckets.
+        """
+        if kind not in ("attendance", "revenue") or granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown series {kind}/{granularity}")
+        starts = bucket_starts(date_from, date_to, granularity)
+        if len(starts) > MAX_BUCKETS:
+            raise ValueError(f"At most {MAX_BUCKETS} buckets per request; use a coarser granularity")
+        if not starts:
+            return []
+        ids = [f"{kind}:{granularity}:{s.isoformat()}" for s in starts]
+        stored = {doc["start"]: doc["bucket"] async for doc in self.store.find({"_id": {"$in": ids}}, {"start": 1, "bucket": 1})}
+        missing = [s for s in starts if s.isoformat() not in stored]
+        computed = await self._compute(kind, granularity, missing) if missing else {}
+        closed = [s for s in missing if bucket_end(s, granularity) <= today]
+        if closed:
+            now = datetime.now(timezone.utc)
+            await self.store.bulk_write([
+                ReplaceOne({"_id": f"{kind}:{granularity}:{s.isoformat()}"}, {
+                    "kind": kind, "granularity": granularity, "start": s.isoformat(),
+                    "end": bucket_end(s, granularity).isoformat(), "bucket": computed[s.isoformat()], "computed_at": now,
+                }, upsert=True)
+                for s in closed
+            ], ordered=False)
+        return [stored.get(s.isoformat()) or computed[s.isoformat()] for s in starts]
+
+    async def invalidate(self, kind: str, days, today: date) -> int:
+        """Drop kind's materialized buckets covering any of days (IST "YYYY-MM-DD"); open buckets are never stored."""
+        past = sorted({d for d in days if d and d < today.isoformat()})
+        if not past:
+            return 0
+        result = await self.store.delete_many({"kind": kind, "$or": [{"start": {"$lte": d}, "end": {"$gt": d}} for d in past]})
+        return result.deleted_count
@@ -0,0 +1,48 @@
+"""
+TTLCache unit tests (no database).
+"""
+import sys
+from pathlib import Path
+
+_backend = Path(__file__).resolve().parent.parent
+if str(_backend) not in sys.path:
+    sys.path.insert(0, str(_backend))
+
+import cache
+from cache import TTLCache
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    c = TTLCache(ttl=30)
+    c.set("k", 1)
+    assert c.get("k") == 1
+    now[0] += 31
+    assert c.get("k") is None
+    assert len(c) == 0
+
+
+def test_lru_eviction_and_clear():
+    c = TTLCache(ttl=60, maxsize=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1  # a is now most recently used
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1 and c.get("c") == 3
+    c.invalidate("a")
+    assert c.get("a") is None
+    c.clear()
+    assert len(c) == 0
+
+
+def test_stats_count_hits_misses_and_evictions():
+    c = TTLCache(ttl=60, maxsize=1)
+    assert c.get("a") is None
+    c.set("a", 1)
+    assert c.get("a") == 1
+    c.set("b", 2)
+    stats = c.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["size"]) == (1, 1, 1, 1)
+    assert stats["hit_ratio"] == 0.5
@@ -0,0 +1,178 @@
+"""
+Monthly dues generator against throwaway collections in the test database: plan amounts,
+idempotent reruns, resuming from a checkpoint and the member balances it moves.
+"""
+import sys
+from pathlib import Path
+
+_backend = Path(__file__).resolve().parent.parent
+if str(_backend) not in sys.path:
+    sys.path.insert(0, str(_backend))
+
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from dues import generate_monthly_dues, period_due_date
+from ledger import Ledger
+
+PERIOD = "2025-03"
+PLANS = {"Regular": 500, "PT": 2000}
+
+
+@pytest.fixture
+async def dues_db():
+    from indexes import INDEXES
+    from main import db, transactions
+    names = ["gym_members_dues_test", "payments_dues_test", "invoices_dues_test", "member_balances_dues_test", "dues_runs_test"]
+    for name in names:
+        await db[name].drop()
+    members, payments, invoices, balances, runs = (db[name] for name in names)
+    await payments.create_indexes([m for m in INDEXES["payments"] if m.document["name"] == "member_monthly_period_unique"])
+    yield {
+        "members": members, "payments": payments, "runs": runs, "balances": balances, "invoices": invoices,
+        "ledger": Ledger(transactions, payments, invoices, balances),
+    }
+    for name in names:
+        await db[name].drop()
+
+
+async def _generate(dues_db, **kwargs) -> dict:
+    return await generate_monthly_dues(dues_db["members"], dues_db["payments"], dues_db["runs"], dues_db["ledger"], PERIOD, PLANS, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_generates_one_due_per_active_member_at_plan_amount(dues_db):
+    members = dues_db["members"]
+    await members.insert_many(
+        [{"name": f"Regular {i}", "membership_type": "Regular", "status": "Active"} for i in range(5)]
+        + [{"name": "Trainee", "membership_type": "PT", "status": "Active"}, {"name": "Gone", "membership_type": "PT", "status": "Inactive"}]
+    )
+    already = await members.find_one({"name": "Regular 0"})
+    await dues_db["payments"].insert_one({"member_id": str(already["_id"]), "fee_type": "monthly", "period": PERIOD, "amount": 500, "status": "Paid"})
+
+    result = await _generate(dues_db, batch_size=2)
+    assert (result["members_scanned"], result["created_count"], result["existing_count"], result["skipped_count"]) == (6, 5, 1, 0)
+    assert result["duration_ms"] >= 0 and result["dues_per_sec"] > 0
+    trainee = await members.find_one({"name": "Trainee"})
+    line = await dues_db["payments"].find_one({"member_id": str(trainee["_id"]), "period": PERIOD})
+    assert (line["amount"], line["status"], line["fee_type"]) == (2000, "Due", "monthly")
+    assert line["due_date"].replace(tzinfo=None) == period_due_date(PERIOD).replace(tzinfo=None)
+    balance = await dues_db["ledger"].balance(str(trainee["_id"]))
+    assert (balance["due_amount"], balance["pending_count"]) == (2000, 1) and balance["oldest_due_date"] is not None
+
+    again = await _generate(dues_db)
+    assert (again["created_count"], again["existing_count"]) == (0, 6)
+    assert await dues_db["payments"].count_documents({"period": PERIOD}) == 6
+    assert (await dues_db["runs"].find_one({"_id": PERIOD}))["status"] == "done"
+
+
+@pytest.mark.asyncio
+async def test_resumes_after_checkpoint_and_upserts_never_duplicate(dues_db):
+    members = dues_db["members"]
+    await members.insert_many([{"name": f"Member {i}", "membership_type": "Regular", "status": "Active"} for i in range(6)])
+    ordered = [m["_id"] async for m in members.find({}, {"_id": 1}).sort("_id", 1)]
+    # A run that stopped after the first three members
+    await dues_db["runs"].insert_one({"_id": PERIOD, "status": "running", "last_member_id": ordered[2]})
+
+    result = await _generate(dues_db)
+    assert result["resumed_after"] == str(ordered[2])
+    assert (result["members_scanned"], result["created_count"]) == (3, 3)
+
+    # Straight to the ledger: an existing key is left alone
+    line = {"member_id": str(ordered[5]), "member_name": "Member 5", "amount": 999, "fee_type": "monthly", "period": PERIOD,
+            "status": "Due", "due_date": period_due_date(PERIOD), "paid_at": None, "created_at": period_due_date(PERIOD)}
+    assert await dues_db["ledger"].upsert_lines([line]) == 0
+    assert (await dues_db["payments"].find_one({"member_id": str(ordered[5])}))["amount"] == 500
+
+    finished = await _generate(dues_db)
+    assert finished["resumed_after"] is None and finished["created_count"] == 3
+    assert await dues_db["payments"].count_documents({"period": PERIOD}) == 6
+
+
+@pytest.mark.asyncio
+async def test_duplicate_monthly_fees_merged_before_unique_index(dues_db):
+    from indexes import INDEXES
+    payments, invoices, ledger = dues_db["payments"], dues_db["invoices"], dues_db["ledger"]
+    await payments.drop_indexes()
+    due_date, paid_at = period_due_date(PERIOD), datetime(2025, 3, 5)
+
+    def line(member_id, status, created_at, **extra):
+        return {"_id": ObjectId(), "member_id": member_id, "amount": 500, "fee_type": "monthly", "period": PERIOD,
+                "status": status, "due_date": due_date, "paid_at": paid_at if status == "Paid" else None, "created_at": created_at, **extra}
+
+    # m1: registration's Due fee (on the registration invoice) and the Paid one log-monthly added
+    registration_invoice = ObjectId()
+    due = line("m1", "Due", datetime(2025, 3, 1), invoice_id=str(registration_invoice))
+    paid = line("m1", "Paid", datetime(2025, 3, 5))
+    registration = line("m1", "Paid", datetime(2025, 3, 1), fee_type="registration", amount=1000, period=None)
+    await invoices.insert_one({"_id": registration_invoice, "member_id": "m1", "status": "Unpaid", "items": [
+        {"description": "Registration", "amount": 1000, "payment_id": str(registration["_id"])},
+        {"description": "First Month", "amount": 500, "payment_id": str(due["_id"])},
+    ]})
+    # m2: paid twice; m3: two unpaid copies
+    twice = [line("m2", "Paid", datetime(2025, 3, 2)), line("m2", "Paid", datetime(2025, 3, 3))]
+    unpaid = [line("m3", "Due", datetime(2025, 3, 2)), line("m3", "Overdue", datetime(2025, 3, 1))]
+    await payments.insert_many([due, paid, registration, *twice, *unpaid])
+
+    result = await ledger.merge_duplicate_monthly_fees()
+    assert result == {"periods": 3, "deleted": 2, "paid_duplicates": 1, "paid_days": ["2025-03-05"]}
+    assert [p["_id"] async for p in payments.find({"member_id": "m1", "fee_type": "monthly"})] == [paid["_id"]]
+    invoice = await invoices.find_one({"_id": registration_invoice})
+    assert invoice["items"][1]["payment_id"] == str(paid["_id"]) and invoice["status"] == "Paid"
+    assert (await payments.find_one({"_id": twice[1]["_id"]}))["fee_type"] == "monthly_duplicate"
+    assert [p["_id"] async for p in payments.find({"member_id": "m3"})] == [unpaid[1]["_id"]]
+    balance = await ledger.balance("m1")
+    assert (balance["pending_amount"], balance["paid_amount"]) == (0, 1500)
+    assert (await ledger.balance("m2"))["paid_amount"] == 1000
+
+    await payments.create_indexes([m for m in INDEXES["payments"] if m.document["name"] == "member_monthly_period_unique"])
+    assert await ledger.merge_duplicate_monthly_fees() == {"periods": 0, "deleted": 0, "paid_duplicates": 0, "paid_days": []}
+
+
+class _RacingPayments:
+    """payments collection whose bulk_write lets payments land just before and just after it."""
+
+    def __init__(self, collection, before, after):
+        self.collection, self.before, self.after = collection, before, after
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    async def bulk_write(self, ops, **kwargs):
+        await self.before()
+        result = await self.collection.bulk_write(ops, **kwargs)
+        await self.after()
+        return result
+
+
+@pytest.mark.asyncio
+async def test_overdue_sweep_moves_balances_once_when_payments_race_it(dues_db):
+    from main import transactions
+    payments, ledger = dues_db["payments"], dues_db["ledger"]
+    due_date = datetime(2025, 3, 1)
+    lines = [
+        {"_id": ObjectId(), "member_id": mid, "member_name": mid, "amount": amount, "fee_type": "monthly", "period": period,
+         "status": "Due", "due_date": due_date, "paid_at": None, "created_at": due_date}
+        for mid, amount, period in (("m1", 500, "2025-02"), ("m1", 500, "2025-03"), ("m2", 2000, "2025-03"))
+    ]
+    await ledger.upsert_lines(lines)
+    paid_at = datetime(2025, 3, 10)
+
+    async def pay_first():  # lands after the sweep read its lines, before it updates them
+        await ledger.pay_line(lines[0]["_id"], paid_at)
+
+    async def settle_second():  # lands after the update, at a different amount
+        await ledger.record_monthly("m1", "m1", "2025-03", 800, paid_at)
+
+    sweep = Ledger(transactions, _RacingPayments(payments, pay_first, settle_second), dues_db["invoices"], dues_db["balances"])
+    assert await sweep.mark_overdue(datetime(2025, 3, 5)) == 2
+    assert (await payments.find_one({"_id": lines[2]["_id"]}))["status"] == "Overdue"
+
+    expected = await ledger._balances_by_member({})
+    for mid in ("m1", "m2"):
+        stored = await ledger.balance(mid)
+        assert {field: stored[field] for field in expected[mid]} == expected[mid], mid
+    assert (await ledger.balance("m1"))["paid_amount"] == 1300
+    assert (await ledger.balance("m2"))["overdue_amount"] == 2000
@@ -11,6 +11,8 @@ _backend = Path(__file__).resolve().parent.parent
 if str(_backend) not in sys.path:
     sys.path.insert(0, str(_backend))
 
+import uuid
+
 import pytest
 from httpx import ASGITransport, AsyncClient
 
@@ -20,11 +22,18 @@ from main import app
 pytestmark = pytest.mark.asyncio
 
 
+def _unique_phone() -> str:
+    """Phone is unique per member; tests share a persistent DB, so each run needs fresh numbers."""
+    return "9" + str(uuid.uuid4().int)[:9]
+
+
 @pytest.fixture(scope="session")
 async def client():
     transport = ASGITransport(app=app)
-    async with AsyncClient(transport=transport, base_url="http://test") as ac:
-        yield ac
+    # ASGITransport does not send lifespan events; run startup (index bootstrap etc.) explicitly
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            yield ac
 
 
 async def test_root(client: AsyncClient):
@@ -46,7 +55,7 @@ async def test_version(client: AsyncClient):
 async def test_member_crud_and_by_phone(client: AsyncClient):
     payload = {
         "name": "E2E Test User",
-        "phone": "9876543210",
+        "phone": _unique_phone(),
         "email": "e2e@example.com",
         "membership_type": "Regular",
         "batch": "Morning",
@@ -66,9 +75,12 @@ async def test_member_crud_and_by_phone(client: AsyncClient):
     assert r2.status_code == 200
     assert r2.json()["id"] == member_id
 
-    r3 = await client.get("/members/by-phone/9876543210")
+    r3 = await client.get(f"/members/by-phone/{payload['phone']}")
     assert r3.status_code == 200
-    assert r3.json()["phone"] == "9876543210"
+    assert r3.json()["phone"] == payload["phone"]
+
+    r_dup = await client.post("/members", json={**payload, "email": "e2e-dup@example.com"})
+    assert r_dup.status_code == 409
 
     r4 = await client.get("/members")
     assert r4.status_code == 200
@@ -80,7 +92,7 @@ async def test_member_crud_and_by_phone(client: AsyncClient):
 async def test_attendance_check_in_check_out(client: AsyncClient):
     payload = {
         "name": "Attendance Test",
-        "phone": "9876543211",
+        "phone": _unique_phone(),
         "email": "att@example.com",
         "membership_type": "Regular",
         "batch": "Evening",
@@ -115,7 +127,7 @@ async def test_attendance_check_in_check_out(client: AsyncClient):
 async def test_payments_and_log_monthly(client: AsyncClient):
     payload = {
         "name": "Payment Test",
-        "phone": "9876543212",
+        "phone": _unique_phone(),
         "email": "pay@example.com",
         "membership_type": "Regular",
         "batch": "Morning",
@@ -149,7 +161,7 @@ async def test_payments_and_log_monthly(client: AsyncClient):
 async def test_billing_issue_and_history_and_pay(client: AsyncClient):
     payload = {
         "name": "Billing Walk-in",
-        "phone": "9876543213",
+        "phone": _unique_phone(),
         "email": "bill@example.com",
         "membership_type": "Regular",
         "batch": "Ladies",
@@ -187,6 +199,28 @@ async def test_analytics_dashboard(client: AsyncClient):
     assert "today_attendance_count" in data
 
 
+async def test_analytics_dashboard_cache_cleared_on_write(client: AsyncClient):
+    before = (await client.get("/analytics/dashboard")).json()
+    payload = {
+        "name": "Dashboard Cache Test",
+        "phone": _unique_phone(),
+        "email": "dash@example.com",
+        "membership_type": "PT",
+        "batch": "Morning",
+    }
+    r = await client.post("/members", json=payload)
+    assert r.status_code == 200, r.text
+    after = (await client.get("/analytics/dashboard")).json()
+    assert after["active_members"] == before["active_members"] + 1
+    assert after["pt_count"] == before["pt_count"] + 1
+    assert after["pending_fees_amount"] == before["pending_fees_amount"] + 1000 + 2000
+
+    r_range = await client.get("/analytics/dashboard", params={"date_from": "2025-01-01", "date_to": "2025-01-31"})
+    assert r_range.status_code == 200
+    assert "attendance_count_in_range" in r_range.json()
+    assert "payments_received_in_range" in r_range.json()
+
+
 async def test_export_endpoints(client: AsyncClient):
     r_billing = await client.get("/export/billing")
     assert r_billing.status_code == 200
@@ -199,6 +233,45 @@ async def test_export_endpoints(client: AsyncClient):
     assert r_payments.status_code == 200
 
 
+async def test_export_streams_filtered_xlsx_and_csv(client: AsyncClient):
+    import csv
+    import io
+
+    from openpyxl import load_workbook
+
+    from main import today_ist
+
+    phone = _unique_phone()
+    r = await client.post("/members", json={
+        "name": "Export Test", "phone": phone, "email": "export@example.com",
+        "membership_type": "PT", "batch": "Evening",
+    })
+    assert r.status_code == 200, r.text
+    member_id = r.json()["id"]
+    today = today_ist().strftime("%Y-%m-%d")
+
+    r_xlsx = await client.get("/export/payments", params={"date_from": today, "date_to": today, "status": "Due"})
+    assert r_xlsx.status_code == 200
+    assert r_xlsx.headers["content-disposition"].endswith("payments.xlsx")
+    sheet = load_workbook(io.BytesIO(r_xlsx.content), read_only=True).active
+    rows = list(sheet.iter_rows(values_only=True))
+    assert rows[0] == ("id", "member_id", "member_name", "amount", "fee_type", "period", "status", "due_date", "paid_at")
+    mine = [row for row in rows[1:] if row[1] == member_id]
+    assert sorted(row[3] for row in mine) == [1000, 2000]
+    assert all(row[6] == "Due" for row in rows[1:])
+
+    r_csv = await client.get("/export/members", params={"format": "csv", "status": "Active"})
+    assert r_csv.status_code == 200
+    assert r_csv.headers["content-type"].startswith("text/csv")
+    members = list(csv.reader(io.StringIO(r_csv.content.decode("utf-8-sig"))))
+    assert members[0][:3] == ["id", "name", "phone"]
+    assert [m for m in members[1:] if m[0] == member_id][0][2] == phone
+
+    assert (await client.get("/export/billing", params={"date_from": "2025-13-01"})).status_code == 400
+    assert (await client.get("/export/billing", params={"format": "pdf"})).status_code == 400
+    await client.delete(f"/members/{member_id}")
+
+
 async def test_get_member_404(client: AsyncClient):
     r = await client.get("/members/000000000000000000000000")
     assert r.status_code == 404
@@ -207,3 +280,922 @@ async def test_get_member_404(client: AsyncClient):
 async def test_get_member_invalid_id(client: AsyncClient):
     r = await client.get("/members/not-an-object-id")
     assert r.status_code == 400
+
+
+async def test_member_photo_stored_outside_member_document(client: AsyncClient):
+    import base64
+
+    from main import members_collection
+    from bson import ObjectId
+
+    photo = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+    photo_b64 = base64.b64encode(photo).decode()
+    payload = {
+        "name": "Photo Test",
+        "phone": _unique_phone(),
+        "email": "photo@example.com",
+        "membership_type": "Regular",
+        "batch": "Morning",
+        "photo_base64": photo_b64,
+    }
+    r = await client.post("/members", json=payload)
+    assert r.status_code == 200, r.text
+    member_id = r.json()["id"]
+    assert r.json()["photo_url"] == f"/members/{member_id}/photo"
+
+    stored = await members_collection.find_one({"_id": ObjectId(member_id)})
+    assert "photo_base64" not in stored
+    assert stored["photo"]["size"] == len(photo)
+    assert stored["photo"]["content_type"] == "image/png"
+
+    r_photo = await client.get(f"/members/{member_id}/photo")
+    assert r_photo.status_code == 200
+    assert r_photo.content == photo
+    etag = r_photo.headers["etag"]
+
+    r_cached = await client.get(f"/members/{member_id}/photo", headers={"If-None-Match": etag})
+    assert r_cached.status_code == 304
+
+    r_range = await client.get(f"/members/{member_id}/photo", headers={"Range": "bytes=8-15"})
+    assert r_range.status_code == 206
+    assert r_range.content == photo[8:16]
+    assert r_range.headers["content-range"] == f"bytes 8-15/{len(photo)}"
+
+    r_full = await client.get(f"/members/{member_id}")
+    assert r_full.json()["photo_base64"] == photo_b64
+
+    r_clear = await client.patch(f"/members/{member_id}/photo", json={"photo_base64": None})
+    assert r_clear.status_code == 200
+    assert r_clear.json()["photo_url"] is None
+    assert (await client.get(f"/members/{member_id}/photo")).status_code == 404
+
+
+async def test_rejected_media_uploads_leave_no_blob(client: AsyncClient):
+    import base64
+    import hashlib
+
+    from main import media_store
+
+    photo = b"\x89PNG\r\n\x1a\n" + uuid.uuid4().bytes * 8
+    photo_b64 = base64.b64encode(photo).decode()
+    sha256 = hashlib.sha256(photo).hexdigest()
+    r = await client.patch("/members/000000000000000000000000/photo", json={"photo_base64": photo_b64})
+    assert r.status_code == 404
+    assert not await media_store.exists(sha256)
+
+    phone = _unique_phone()
+    payload = {"name": "Media Dup", "phone": phone, "email": "dup@example.com", "membership_type": "Regular", "batch": "Morning"}
+    assert (await client.post("/members", json=payload)).status_code == 200
+    r_dup = await client.post("/members", json={**payload, "photo_base64": photo_b64})
+    assert r_dup.status_code == 409
+    assert not await media_store.exists(sha256)
+
+    member_id = (await client.get(f"/members/by-phone/{phone}")).json()["id"]
+    r_bad = await client.patch(f"/members/{member_id}/photo", json={"photo_base64": "not base64!"})
+    assert r_bad.status_code == 422
+
+
+async def test_attendance_rollups_follow_check_in_out_and_delete(client: AsyncClient):
+    payload = {
+        "name": "Rollup Test",
+        "phone": _unique_phone(),
+        "email": "rollup@example.com",
+        "membership_type": "Regular",
+        "batch": "Morning",
+    }
+    member_id = (await client.post("/members", json=payload)).json()["id"]
+    before = (await client.get("/attendance/summary")).json()
+
+    r_in = await client.post(f"/attendance/check-in/{member_id}")
+    assert r_in.status_code == 200, r_in.text
+    after_in = (await client.get("/attendance/summary")).json()
+    assert after_in["today_check_ins"] == before["today_check_ins"] + 1
+    assert after_in["currently_in_gym"] == before["currently_in_gym"] + 1
+    assert after_in["this_week"] == before["this_week"] + 1
+
+    await client.post(f"/attendance/check-out/{member_id}")
+    after_out = (await client.get("/attendance/summary")).json()
+    assert after_out["currently_in_gym"] == before["currently_in_gym"]
+
+    r_del = await client.delete(f"/attendance/{r_in.json()['id']}")
+    assert r_del.status_code == 200
+    after_del = (await client.get("/attendance/summary")).json()
+    assert after_del["today_check_ins"] == before["today_check_ins"]
+
+    r_rebuild = await client.post("/admin/rebuild-attendance-stats")
+    assert r_rebuild.status_code == 200, r_rebuild.text
+    rebuilt = (await client.get("/attendance/summary")).json()
+    assert rebuilt["today_check_ins"] == len((await client.get("/attendance/today")).json())
+
+
+async def test_scheduler_moves_due_to_overdue_and_fees_summary_is_read_only(client: AsyncClient):
+    from datetime import datetime, timedelta, timezone
+
+    from bson import ObjectId
+
+    from main import balances_collection, ledger, payments_collection, scheduler
+
+    yesterday = datetime.now(timezone.utc) - timedelta(days=2)
+    member_id = str(ObjectId())
+    line = {
+        "_id": ObjectId(), "member_id": member_id, "member_name": "Overdue Test", "amount": 500,
+        "fee_type": "monthly", "period": yesterday.strftime("%Y-%m"), "status": "Due",
+        "due_date": yesterday, "paid_at": None, "created_at": yesterday,
+    }
+    await ledger.upsert_lines([line])
+    r_sum = await client.get("/payments/fees-summary")
+    assert r_sum.status_code == 200
+    assert (await payments_collection.find_one({"_id": line["_id"]}))["status"] == "Due"
+
+    run = await scheduler.run_job("mark_overdue")
+    assert run["ok"] and run["result"]["updated_count"] >= 1
+    assert (await payments_collection.find_one({"_id": line["_id"]}))["status"] == "Overdue"
+    balance = await ledger.balance(member_id)
+    assert (balance["due_amount"], balance["overdue_amount"], balance["overdue_count"], balance["pending_amount"]) == (0, 500, 1, 500)
+    before, after = r_sum.json(), (await client.get("/payments/fees-summary")).json()
+    moved = after["overdue"]["total_amount"] - before["overdue"]["total_amount"]
+    assert moved >= 500 and before["due"]["total_amount"] - after["due"]["total_amount"] == moved
+
+    r_status = await client.get("/admin/scheduler")
+    assert r_status.status_code == 200
+    jobs = {j["name"]: j for j in r_status.json()["jobs"]}
+    assert set(jobs) == {"mark_inactive", "mark_overdue", "month_rollover", "reconcile_ledger"}
+    assert jobs["mark_overdue"]["last_run"]["duration_ms"] >= 0
+    await payments_collection.delete_one({"_id": line["_id"]})
+    await balances_collection.delete_one({"_id": member_id})
+
+
+async def test_scheduler_lease_has_single_leader():
+    from main import db
+    from scheduler import Scheduler
+
+    leases = db["scheduler_leases_test"]
+    await leases.delete_many({})
+    first = Scheduler(leases, owner="worker-1")
+    second = Scheduler(leases, owner="worker-2")
+    assert await first.acquire_lease()
+    assert not await second.acquire_lease()
+    assert await first.acquire_lease()  # renewal
+    await first.stop()
+    assert await second.acquire_lease()
+    await leases.drop()
+
+
+async def test_scheduler_keeps_lease_through_long_job_and_stops_when_lost():
+    import asyncio
+
+    from main import db
+    from scheduler import LEASE_ID, Scheduler
+
+    leases = db["scheduler_leases_test"]
+    await leases.delete_many({})
+    leader = Scheduler(leases, lease_seconds=0.3, owner="worker-1")
+    other = Scheduler(leases, lease_seconds=0.3, owner="worker-2")
+
+    async def long_job():
+        await asyncio.sleep(1.0)  # over three lease lengths
+        return {"ok": True}
+
+    async def stolen():
+        await leases.update_one({"_id": LEASE_ID}, {"$set": {"owner": "worker-2"}})
+        return {}
+
+    leader.add_job("long", long_job, interval_seconds=3600)
+    assert await leader.acquire_lease()
+    run = asyncio.create_task(leader.run_due_jobs())
+    await asyncio.sleep(0.7)
+    assert not await other.acquire_lease()  # renewed by the heartbeat while the job runs
+    assert await run == ["long"]
+
+    await leases.delete_many({"_id": {"$regex": "^job:"}})
+    leader.jobs.clear()
+    leader.add_job("a_steal", stolen, interval_seconds=3600)
+    leader.add_job("b_after", long_job, interval_seconds=3600)
+    assert await leader.acquire_lease()
+    assert await leader.run_due_jobs() == ["a_steal"]
+    assert not leader.is_leader
+    await leases.drop()
+
+
+async def test_fee_reminders_run_as_background_job(client: AsyncClient):
+    from main import background_jobs, notifier
+
+    phone = _unique_phone()
+    r = await client.post("/members", json={
+        "name": "Reminder Test", "phone": phone, "email": "reminder@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })
+    assert r.status_code == 200, r.text
+    member_id = r.json()["id"]
+
+    r_run = await client.post("/admin/run-fee-reminders")
+    assert r_run.status_code == 200
+    body = r_run.json()
+    assert body["job_id"] and "message" in body
+    await background_jobs.wait(body["job_id"])
+
+    r_job = await client.get(f"/admin/jobs/{body['job_id']}")
+    assert r_job.status_code == 200
+    job = r_job.json()
+    assert job["status"] == "done", job
+    assert job["progress"]["queued"] >= 1
+    await notifier.drain()
+    sent = [m for m in notifier.provider.sent if m["user"]["phone"] == phone]
+    assert [m["type"] for m in sent] == ["registration", "fees_due"]
+    assert sent[1]["extra"]["pending_amount"] == 1500
+    r_stats = await client.get("/admin/notifications")
+    assert r_stats.status_code == 200 and r_stats.json()["outbox"].get("sent", 0) >= 2
+    assert (await client.get("/admin/jobs/does-not-exist")).status_code == 404
+    await client.delete(f"/members/{member_id}")
+
+
+async def test_cursor_pagination_pages_without_overlap(client: AsyncClient):
+    r = await client.post("/members", json={
+        "name": "Paging Test", "phone": _unique_phone(), "email": "paging@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })
+    assert r.status_code == 200, r.text
+    member_id = r.json()["id"]
+
+    first = await client.get("/payments", params={"member_id": member_id, "limit": 1})
+    assert first.status_code == 200 and len(first.json()) == 1
+    cursor = first.headers.get("x-next-cursor")
+    assert cursor
+    second = await client.get("/payments", params={"member_id": member_id, "limit": 1, "cursor": cursor})
+    assert second.status_code == 200 and len(second.json()) == 1
+    assert "x-next-cursor" not in second.headers
+    assert {first.json()[0]["id"], second.json()[0]["id"]} == {p["id"] for p in (await client.get("/payments", params={"member_id": member_id})).json()}
+
+    other = await client.post("/members", json={
+        "name": "Paging Test 2", "phone": _unique_phone(), "email": "paging2@example.com",
+        "membership_type": "PT", "batch": "Evening",
+    })
+    assert other.status_code == 200, other.text
+    r_page = await client.get("/members", params={"brief": "true", "limit": 1})
+    seen = [m["id"] for m in r_page.json()]
+    r_page = await client.get("/members", params={"brief": "true", "limit": 1, "cursor": r_page.headers["x-next-cursor"]})
+    seen += [m["id"] for m in r_page.json()]
+    assert seen == [other.json()["id"], member_id]  # newest first
+    r_skip = await client.get("/members", params={"brief": "true", "limit": 1, "skip": 1})
+    assert [m["id"] for m in r_skip.json()] == [member_id]
+
+    assert (await client.get("/billing/history", params={"cursor": "garbage"})).status_code == 400
+    await client.delete(f"/members/{member_id}")
+    await client.delete(f"/members/{other.json()['id']}")
+
+
+async def test_list_members_today_status_for_page(client: AsyncClient):
+    checked_in = (await client.post("/members", json={
+        "name": "Today Status In", "phone": _unique_phone(), "email": "in@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })).json()["id"]
+    absent = (await client.post("/members", json={
+        "name": "Today Status Absent", "phone": _unique_phone(), "email": "absent@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })).json()["id"]
+    assert (await client.post(f"/attendance/check-in/{checked_in}")).status_code == 200
+
+    page = {m["id"]: m for m in (await client.get("/members", params={"brief": "true", "limit": 2})).json()}
+    assert set(page) == {checked_in, absent}
+    assert page[checked_in]["today_status"]["check_in_time"]
+    assert page[absent]["today_status"] is None
+    assert (await client.get(f"/members/{checked_in}")).json()["today_status"]["check_in_time"]
+
+    for mid in (checked_in, absent):
+        await client.delete(f"/members/{mid}")
+
+
+async def test_concurrent_check_ins_respect_capacity_and_duplicates(client: AsyncClient, monkeypatch):
+    """Load test: a burst of concurrent check-ins at a nearly full batch admits exactly the free places."""
+    import asyncio
+
+    import main
+
+    batch = main.batch_from_ist(main.now_ist())
+    date_ist_str = main.today_ist().strftime("%Y-%m-%d")
+    stats = await main.daily_stats_collection.find_one({"_id": date_ist_str}) or {}
+    taken = stats.get("by_batch", {}).get(batch, {}).get("check_ins", 0)
+    free = 5
+    monkeypatch.setattr(main, "BATCH_CAPACITY", {batch: taken + free})
+
+    member_ids = []
+    for i in range(20):
+        r = await client.post("/members", json={
+            "name": f"Load Test {i}", "phone": _unique_phone(), "email": f"load{i}@example.com",
+            "membership_type": "Regular", "batch": batch,
+        })
+        assert r.status_code == 200, r.text
+        member_ids.append(r.json()["id"])
+
+    # Every member taps twice at the same moment
+    results = await asyncio.gather(*(client.post(f"/attendance/check-in/{mid}") for mid in member_ids + member_ids))
+    ok = [r for r in results if r.status_code == 200]
+    rejected = [r.json()["detail"] for r in results if r.status_code == 400]
+    assert len(ok) == free
+    assert len({r.json()["member_id"] for r in ok}) == free
+    assert len(rejected) == 40 - free
+    assert all(d.startswith("Batch full") or d.startswith("Already checked in") for d in rejected)
+
+    stats = await main.daily_stats_collection.find_one({"_id": date_ist_str})
+    assert stats["by_batch"][batch]["check_ins"] == taken + free
+    assert await main.attendance_collection.count_documents({"member_id": {"$in": member_ids}}) == free
+
+    for r in ok:
+        await client.delete(f"/attendance/{r.json()['id']}")
+    for mid in member_ids:
+        await client.delete(f"/members/{mid}")
+
+
+async def test_attendance_bulk_replay_is_idempotent_and_uses_event_time(client: AsyncClient):
+    import uuid
+    from datetime import datetime, timedelta
+
+    import main
+
+    r = await client.post("/members", json={
+        "name": "Bulk Kiosk", "phone": _unique_phone(), "email": "bulk@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })
+    assert r.status_code == 200, r.text
+    mid = r.json()["id"]
+    yesterday = main.today_ist() - timedelta(days=1)
+    morning = datetime(yesterday.year, yesterday.month, yesterday.day, 7, 0, tzinfo=main.IST)
+    stats_before = await main.daily_stats_collection.find_one({"_id": yesterday.isoformat()}) or {"check_ins": 0, "check_outs": 0}
+
+    def key():
+        return uuid.uuid4().hex
+
+    events = [
+        # out of order on purpose: the check-out is applied after the check-in by event time
+        {"idempotency_key": key(), "member_id": mid, "type": "check_out", "at": (morning + timedelta(hours=2)).isoformat()},
+        {"idempotency_key": key(), "member_id": mid, "type": "check_in", "at": morning.isoformat()},
+        {"idempotency_key": key(), "member_id": mid, "type": "check_in", "at": (morning + timedelta(hours=1)).isoformat()},
+        {"idempotency_key": key(), "member_id": "000000000000000000000000", "type": "check_in", "at": morning.isoformat()},
+        {"idempotency_key": key(), "member_id": mid, "type": "check_out", "at": (morning - timedelta(days=3)).isoformat()},
+        {"idempotency_key": key(), "member_id": mid, "type": "check_in", "at": (main.now_ist() + timedelta(hours=1)).isoformat()},
+    ]
+    r_bulk = await client.post("/attendance/bulk", json={"events": events})
+    assert r_bulk.status_code == 200, r_bulk.text
+    statuses = [res["status"] for res in r_bulk.json()["results"]]
+    assert statuses == ["ok", "ok", "already_checked_in", "invalid_member", "no_check_in", "invalid_time"]
+    first = r_bulk.json()["results"][1]
+    assert first["date_ist"] == yesterday.isoformat() and first["batch"] == "Morning"
+    assert r_bulk.json()["results"][0]["attendance_id"] == first["attendance_id"]
+
+    rows = (await client.get("/attendance/by-date", params={"date": yesterday.isoformat()})).json()
+    mine = [row for row in rows if row["member_id"] == mid]
+    assert len(mine) == 1 and mine[0]["check_out_at"]
+    stats_after = await main.daily_stats_collection.find_one({"_id": yesterday.isoformat()})
+    assert stats_after["check_ins"] == stats_before["check_ins"] + 1
+    assert stats_after["check_outs"] == stats_before["check_outs"] + 1
+
+    r_replay = await client.post("/attendance/bulk", json={"events": events})
+    replay = r_replay.json()["results"]
+    assert [res["status"] for res in replay[:2]] == ["duplicate", "duplicate"]
+    assert replay[1]["attendance_id"] == first["attendance_id"]
+    assert (await main.daily_stats_collection.find_one({"_id": yesterday.isoformat()}))["check_ins"] == stats_after["check_ins"]
+
+    await client.delete(f"/attendance/{first['attendance_id']}")
+    await client.delete(f"/members/{mid}")
+
+
+async def test_attendance_bulk_concurrent_replays_apply_once(client: AsyncClient):
+    import asyncio
+    import uuid
+    from datetime import datetime, timedelta
+
+    import main
+
+    r = await client.post("/members", json={
+        "name": "Bulk Race", "phone": _unique_phone(), "email": "race@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })
+    mid = r.json()["id"]
+    day = main.today_ist() - timedelta(days=2)
+    morning = datetime(day.year, day.month, day.day, 7, 0, tzinfo=main.IST)
+    stats_before = await main.daily_stats_collection.find_one({"_id": day.isoformat()}) or {"check_ins": 0, "check_outs": 0}
+
+    check_in = [{"idempotency_key": uuid.uuid4().hex, "member_id": mid, "type": "check_in", "at": morning.isoformat()}]
+    replays = await asyncio.gather(*(client.post("/attendance/bulk", json={"events": check_in}) for _ in range(3)))
+    statuses = sorted(r.json()["results"][0]["status"] for r in replays)
+    assert statuses == ["duplicate", "duplicate", "ok"]
+
+    # Two taps (different keys) closing the same row: only one counts
+    outs = [
+        [{"idempotency_key": uuid.uuid4().hex, "member_id": mid, "type": "check_out", "at": (morning + timedelta(hours=h)).isoformat()}]
+        for h in (1, 2)
+    ]
+    closed = await asyncio.gather(*(client.post("/attendance/bulk", json={"events": events}) for events in outs))
+    assert sorted(r.json()["results"][0]["status"] for r in closed) == ["already_checked_out", "ok"]
+    stats = await main.daily_stats_collection.find_one({"_id": day.isoformat()})
+    assert (stats["check_ins"], stats["check_outs"]) == (stats_before["check_ins"] + 1, stats_before["check_outs"] + 1)
+    member_stats = await main.member_stats_collection.find_one({"_id": mid})
+    assert (member_stats["total_visits"], member_stats["duration_count"]) == (1, 1)
+
+    # A key claimed by a replay still in flight: reported as a duplicate, nothing written
+    in_flight = {"idempotency_key": uuid.uuid4().hex, "member_id": mid, "type": "check_in", "at": (morning + timedelta(days=1)).isoformat()}
+    await main.attendance_event_keys_collection.insert_one({"_id": in_flight["idempotency_key"], "result": None, "created_at": datetime.now()})
+    assert (await client.post("/attendance/bulk", json={"events": [in_flight]})).json()["results"][0]["status"] == "duplicate"
+    assert await main.attendance_collection.count_documents({"member_id": mid}) == 1
+
+    # A tap that was rejected is not remembered as applied
+    rejected = (await client.post("/attendance/bulk", json={"events": outs[0]})).json()["results"][0]["status"]
+    assert rejected in ("already_checked_out", "duplicate")
+    attendance_id = next(r.json()["results"][0]["attendance_id"] for r in replays if r.json()["results"][0]["status"] == "ok")
+    await client.delete(f"/attendance/{attendance_id}")
+    await client.delete(f"/members/{mid}")
+
+
+@pytest.mark.asyncio
+async def test_member_identity_cache_hits_and_invalidates_on_update(client: AsyncClient):
+    import main
+
+    r = await client.post("/members", json={
+        "name": "Cache Me", "phone": _unique_phone(), "email": "cache@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })
+    assert r.status_code == 200, r.text
+    mid = r.json()["id"]
+
+    r_in = await client.post(f"/attendance/check-in/{mid}")
+    assert r_in.status_code == 200, r_in.text
+    before = (await client.get("/admin/member-cache")).json()["by_id"]
+    assert (await client.post(f"/attendance/check-out/{mid}")).status_code == 200
+    after = (await client.get("/admin/member-cache")).json()["by_id"]
+    assert after["hits"] == before["hits"] + 1
+    assert main.identity_cache.by_id.get(mid)["name"] == "Cache Me"
+
+    r_upd = await client.patch(f"/members/{mid}", json={"name": "Cache Renamed"})
+    assert r_upd.status_code == 200, r_upd.text
+    assert main.identity_cache.by_id.get(mid) is None
+    assert (await main.identity_cache.get(mid))["name"] == "Cache Renamed"
+
+    assert (await client.patch(f"/members/{mid}/photo", json={"photo_base64": "aGVsbG8="})).status_code == 200
+    assert main.identity_cache.by_id.get(mid) is None
+    await main.identity_cache.get(mid)
+    assert (await client.patch(f"/members/{mid}/id-document", json={"id_document_base64": None})).status_code == 200
+    assert main.identity_cache.by_id.get(mid) is None
+
+    await client.delete(f"/attendance/{r_in.json()['id']}")
+    await client.delete(f"/members/{mid}")
+
+
+@pytest.mark.asyncio
+async def test_member_login_by_phone_uses_identity_cache(client: AsyncClient):
+    import main
+
+    digits = _unique_phone()
+    r = await client.post("/members", json={
+        "name": "Phone Cache", "phone": digits, "email": "phonecache@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })
+    mid = r.json()["id"]
+    phone_e164 = "+91" + digits
+
+    before = main.identity_cache.by_phone.stats()
+    assert (await client.get(f"/members/by-phone/{digits}")).json()["id"] == mid
+    assert main.identity_cache.by_phone.stats()["misses"] == before["misses"] + 1
+    assert main.identity_cache.by_phone.get(phone_e164) == mid
+    hits = main.identity_cache.by_phone.stats()["hits"]
+    assert (await client.get(f"/members/by-phone/{digits}")).json()["id"] == mid
+    assert main.identity_cache.by_phone.stats()["hits"] == hits + 1
+
+    # Moving the member to another number drops the old phone key
+    new_digits = _unique_phone()
+    assert (await client.patch(f"/members/{mid}", json={"phone": new_digits})).status_code == 200
+    assert main.identity_cache.by_phone.get(phone_e164) is None
+    assert (await client.get(f"/members/by-phone/{digits}")).status_code == 404
+    assert (await client.get(f"/members/by-phone/{new_digits}")).json()["id"] == mid
+
+    # A stale phone key is dropped when a member registers with that phone
+    main.identity_cache.by_phone.set(phone_e164, mid)
+    r_new = await client.post("/members", json={
+        "name": "Phone Reused", "phone": digits, "email": "reused@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })
+    assert r_new.status_code == 200, r_new.text
+    assert main.identity_cache.by_phone.get(phone_e164) is None
+    assert (await client.get(f"/members/by-phone/{digits}")).json()["id"] == r_new.json()["id"]
+
+    for member_id in (mid, r_new.json()["id"]):
+        await client.delete(f"/members/{member_id}")
+
+
+@pytest.mark.asyncio
+async def test_member_login_matches_any_phone_format(client: AsyncClient):
+    digits = _unique_phone()
+    spaced = f"{digits[:5]} {digits[5:]}"
+    r = await client.post("/members", json={
+        "name": "Phone Format", "phone": spaced, "email": "format@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })
+    assert r.status_code == 200, r.text
+    mid = r.json()["id"]
+    assert r.json()["phone"] == spaced
+
+    for variant in (digits, f"+91-{digits}", f"0{digits}"):
+        r_login = await client.get(f"/members/by-phone/{variant}")
+        assert r_login.status_code == 200, variant
+        assert r_login.json()["id"] == mid
+
+    r_dup = await client.post("/billing/issue", json={
+        "name": "Same Number", "phone": f"+91 {digits}", "email": "dup@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })
+    assert r_dup.status_code == 409
+    assert (await client.patch(f"/members/{mid}", json={"phone": "12345"})).status_code == 400
+    assert (await client.get("/members/by-phone/12345")).status_code == 400
+
+    await client.delete(f"/members/{mid}")
+
+
+@pytest.mark.asyncio
+async def test_member_and_invoice_search(client: AsyncClient):
+    import random
+    import string
+
+    surname = "".join(random.choices(string.ascii_lowercase, k=12)).capitalize()
+    phone = _unique_phone()
+    r = await client.post("/billing/issue", json={
+        "name": f"Search {surname}", "phone": phone, "email": "search@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })
+    assert r.status_code == 200, r.text
+    invoice = r.json()
+    mid = invoice["member_id"]
+
+    r_s = await client.get("/members/search", params={"q": surname[:6].lower()})
+    assert r_s.status_code == 200, r_s.text
+    assert [m["id"] for m in r_s.json()] == [mid]
+    assert [m["id"] for m in (await client.get("/members/search", params={"q": f"sea {surname}"})).json()] == [mid]
+    assert mid in [m["id"] for m in (await client.get("/members/search", params={"q": phone[-5:]})).json()]
+
+    r_h = await client.get("/billing/history", params={"search": surname[:4]})
+    assert [i["id"] for i in r_h.json()] == [invoice["id"]]
+    r_h = await client.get("/billing/history", params={"search": invoice["id"][-8:]})
+    assert invoice["id"] in [i["id"] for i in r_h.json()]
+
+    renamed = "".join(random.choices(string.ascii_lowercase, k=12))
+    assert (await client.patch(f"/members/{mid}", json={"name": f"Search {renamed}"})).status_code == 200
+    assert (await client.get("/members/search", params={"q": surname})).json() == []
+    assert [m["id"] for m in (await client.get("/members/search", params={"q": renamed})).json()] == [mid]
+
+    await client.delete(f"/members/{mid}")
+
+
+@pytest.mark.asyncio
+async def test_member_attendance_stats_follow_check_in_out_and_delete(client: AsyncClient):
+    import uuid
+    from datetime import datetime, timedelta
+
+    import main
+
+    r = await client.post("/members", json={
+        "name": "Stats Member", "phone": _unique_phone(), "email": "stats@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })
+    assert r.status_code == 200, r.text
+    mid = r.json()["id"]
+    empty = (await client.get(f"/members/{mid}/attendance-stats")).json()
+    assert empty == {"total_visits": 0, "visits_this_month": 0, "avg_duration_minutes": None}
+
+    yesterday = main.today_ist() - timedelta(days=1)
+    morning = datetime(yesterday.year, yesterday.month, yesterday.day, 7, 0, tzinfo=main.IST)
+    r_bulk = await client.post("/attendance/bulk", json={"events": [
+        {"idempotency_key": uuid.uuid4().hex, "member_id": mid, "type": "check_in", "at": morning.isoformat()},
+        {"idempotency_key": uuid.uuid4().hex, "member_id": mid, "type": "check_out", "at": (morning + timedelta(minutes=90)).isoformat()},
+    ]})
+    assert r_bulk.json()["counts"] == {"ok": 2}
+    r_in = await client.post(f"/attendance/check-in/{mid}")
+    assert r_in.status_code == 200, r_in.text
+    assert (await client.post(f"/attendance/check-out/{mid}")).status_code == 200
+    same_month = yesterday.month == main.today_ist().month
+
+    stats = (await client.get(f"/members/{mid}/attendance-stats")).json()
+    assert stats["total_visits"] == 2
+    assert stats["visits_this_month"] == (2 if same_month else 1)
+    assert stats["avg_duration_minutes"] == 45.0  # (90 min + today's ~0 min) / 2
+
+    rebuilt = await client.post("/admin/rebuild-member-attendance-stats", params={"member_id": mid})
+    assert rebuilt.json()["members"] == 1
+    assert (await client.get(f"/members/{mid}/attendance-stats")).json() == stats
+
+    await client.delete(f"/attendance/{r_bulk.json()['results'][0]['attendance_id']}")
+    after_delete = (await client.get(f"/members/{mid}/attendance-stats")).json()
+    assert after_delete["total_visits"] == 1
+    assert after_delete["visits_this_month"] == 1
+    assert after_delete["avg_duration_minutes"] is not None and after_delete["avg_duration_minutes"] < 1
+
+    await client.delete(f"/attendance/{r_in.json()['id']}")
+    await client.delete(f"/members/{mid}")
+
+
+@pytest.mark.asyncio
+async def test_attendance_times_stored_utc_and_shown_in_ist(client: AsyncClient):
+    import re
+    from datetime import datetime, timezone
+
+    import main
+
+    r = await client.post("/members", json={
+        "name": "Time Format", "phone": _unique_phone(), "email": "time@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })
+    mid = r.json()["id"]
+    r_in = await client.post(f"/attendance/check-in/{mid}")
+    assert r_in.status_code == 200, r_in.text
+    record = r_in.json()
+    assert re.fullmatch(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}\+05:30", record["check_in_at"])
+    stored = await main.attendance_collection.find_one({"member_id": mid})
+    assert "check_in_at_ist" not in stored and isinstance(stored["check_in_at_utc"], datetime)
+
+    # Python (single record) and MongoDB ($dateToString, list endpoints) format identically
+    today = record["date_ist"]
+    listed = [row for row in (await client.get("/attendance/by-date", params={"date": today})).json() if row["member_id"] == mid]
+    assert listed == [record]
+    r_out = await client.post(f"/attendance/check-out/{mid}")
+    ranged = (await client.get("/attendance/by-date-range", params={"date_from": today, "date_to": today, "limit": 1000})).json()
+    assert [row for row in ranged if row["member_id"] == mid] == [r_out.json()]
+    assert list(r_out.json()) == ["id", "member_id", "member_name", "member_phone", "check_in_at", "date_ist", "batch", "check_out_at"]
+    paged, cursor = [], None
+    while True:
+        params = {"date_from": today, "date_to": today, "limit": 1, **({"cursor": cursor} if cursor else {})}
+        page = await client.get("/attendance/by-date-range", params=params)
+        paged += page.json()
+        cursor = page.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    assert paged == ranged
+
+    # Legacy row: IST strings, no check_out_at_utc
+    legacy_id = (await main.attendance_collection.insert_one({
+        "member_id": mid, "member_name": "Time Format", "member_phone": None, "date_ist": "2024-01-05", "batch": "Morning",
+        "check_in_at_utc": datetime(2024, 1, 5, 1, 30, tzinfo=timezone.utc),
+        "check_in_at_ist": "2024-01-05T07:00:00.250000+05:30", "check_out_at_ist": "2024-01-05T08:15:00+05:30",
+    })).inserted_id
+    result = await main._migrate_attendance_times({})
+    assert result["failed"] == [] and result["migrated"] >= 1
+    migrated = await main.attendance_collection.find_one({"_id": legacy_id})
+    assert "check_in_at_ist" not in migrated and "check_out_at_ist" not in migrated
+    assert migrated["check_out_at_utc"].replace(tzinfo=timezone.utc) == datetime(2024, 1, 5, 2, 45, tzinfo=timezone.utc)
+    row = [r for r in (await client.get("/attendance/by-date", params={"date": "2024-01-05"})).json() if r["id"] == str(legacy_id)][0]
+    assert row["check_out_at"] == "2024-01-05T08:15:00.000+05:30"
+
+    await main.attendance_collection.delete_one({"_id": legacy_id})
+    await client.delete(f"/attendance/{record['id']}")
+    await client.delete(f"/members/{mid}")
+
+
+async def test_ndjson_stream_matches_pages(client: AsyncClient):
+    import json
+
+    r = await client.post("/billing/issue", json={
+        "name": "Stream Test", "phone": _unique_phone(), "email": "stream@example.com",
+        "membership_type": "Regular", "batch": "Morning",
+    })
+    assert r.status_code == 200, r.text
+    mid = r.json()["member_id"]
+    r_in = await client.post(f"/attendance/check-in/{mid}")
+    assert r_in.status_code == 200, r_in.text
+    today = r_in.json()["date_ist"]
+
+    for path, params in (
+        ("/payments", {"member_id": mid}),
+        ("/billing/history", {"member_id": mid}),
+        ("/attendance/by-date-range", {"date_from": today, "date_to": today}),
+    ):
+        listed = await client.get(path, params={**params, "limit": 1000})
+        streamed = await client.get(path, params={**params, "stream": "ndjson", "limit": 1})
+        assert streamed.status_code == 200, streamed.text
+        assert streamed.headers["content-type"] == "application/x-ndjson"
+        assert "x-next-cursor" not in streamed.headers
+        lines = streamed.content.split(b"\n")
+        assert lines[-1] == b""  # every row ends with a newline
+        assert [json.loads(line) for line in lines[:-1]] == listed.json() and listed.json()
+
+    first = await client.get("/payments", params={"member_id": mid, "limit": 1})
+    rest = await client.get("/payments", params={"member_id": mid, "stream": "ndjson", "cursor": first.headers["x-next-cursor"]})
+    assert [json.loads(line) for line in rest.text.splitlines()] == (await client.get("/payments", params={"member_id": mid})).json()[1:]
+    assert (await client.get("/billing/history", params={"search": "!!", "stream": "ndjson"})).content == b""
+    assert (await client.get("/payments", params={"stream": "csv"})).status_code == 400
+    assert (await client.get("/payments", params={"stream": "ndjson", "cursor": "garbage"})).status_code == 400
+
+    await client.delete(f"/attendance/{r_in.json()['id']}")
+    await client.delete(f"/members/{mid}")
+
+
+async def test_concurrent_walk_ins_leave_no_partial_enrollments(client: AsyncClient, monkeypatch):
+    """Registration rush: concurrent walk-ins, repeated phones and failing fee writes never leave half an enrollment."""
+    import asyncio
+
+    from pymongo.errors import AutoReconnect
+
+    import main
+
+    payments = main.enrollment.payments
+    insert_many = payments.insert_many
+    calls = 0
+
+    async def flaky_insert_many(docs, *args, **kwargs):
+        nonlocal calls
+        calls += 1
+        if calls % 4 == 0:
+            raise AutoReconnect("connection dropped mid-enrollment")
+        return await insert_many(docs, *args, **kwargs)
+
+    monkeypatch.setattr(payments, "insert_many", flaky_insert_many)
+    phones = [_unique_phone() for _ in range(12)]
+    attempts = [(phone, i) for i, phone in enumerate(phones)] + [(phone, i + 100) for i, phone in enumerate(phones[:6])]
+
+    async def walk_in(phone: str, i: int):
+        return await client.post("/billing/issue", json={
+            "name": f"Rush Walk In {i}", "phone": phone, "email": f"rush{i}@example.com",
+            "membership_type": "PT" if i % 2 else "Regular", "batch": "Evening",
+        })
+
+    results = await asyncio.gather(*(walk_in(phone, i) for phone, i in attempts), return_exceptions=True)
+    monkeypatch.undo()
+    ok = [r for r in results if not isinstance(r, BaseException) and r.status_code == 200]
+    assert ok and any(isinstance(r, AutoReconnect) for r in results)
+    assert all(isinstance(r, AutoReconnect) or r.status_code in (200, 409) for r in results)
+
+    members = [doc async for doc in main.members_collection.find({"phone": {"$in": phones}})]
+    assert len({m["phone"] for m in members}) == len(members)  # at most one member per phone
+    assert {m.json()["member_id"] for m in ok} == {str(m["_id"]) for m in members}
+    for m in members:
+        mid = str(m["_id"])
+        fees = [p async for p in main.payments_collection.find({"member_id": mid})]
+        assert sorted(p["fee_type"] for p in fees) == ["monthly", "registration"]
+        invoices = [i async for i in main.invoices_collection.find({"member_id": mid})]
+        assert len(invoices) == 1 and invoices[0]["total"] == sum(p["amount"] for p in fees)
+        assert await main.notifier.outbox.count_documents({"type": "registration", "user.phone": m["phone"]}) == 1
+    # Nothing written for the failed attempts
+    names = [f"Rush Walk In {i}" for _, i in attempts]
+    member_ids = [str(m["_id"]) for m in members]
+    assert await main.payments_collection.count_documents({"member_name": {"$in": names}, "member_id": {"$nin": member_ids}}) == 0
+    assert await main.invoices_collection.count_documents({"member_name": {"$in": names}, "member_id": {"$nin": member_ids}}) == 0
+    assert await main.notifier.outbox.count_documents({"user.phone": {"$in": phones}}) == len(members)
+    assert await main.balances_collection.count_documents({"_id": {"$in": member_ids}}) == len(members)
+
+    for mid in member_ids:
+        await main.payments_collection.delete_many({"member_id": mid})
+        await main.invoices_collection.delete_many({"member_id": mid})
+        await main.balances_collection.delete_one({"_id": mid})
+        await client.delete(f"/members/{mid}")
+
+
+async def test_ledger_cascades_payments_invoices_and_balances(client: AsyncClient):
+    """Invoice and fee-line status move together, the member balance follows, reconcile repairs drift."""
+    from bson import ObjectId
+
+    import main
+
+    async def walk_in(name: str) -> dict:
+        r = await client.post("/billing/issue", json={
+            "name": name, "phone": _unique_phone(), "email": "ledger@example.com",
+            "membership_type": "Regular", "batch": "Morning",
+        })
+        assert r.status_code == 200, r.text
+        return r.json()
+
+    async def lines(mid: str) -> dict:
+        return {p["fee_type"]: p for p in (await client.get("/payments", params={"member_id": mid})).json()}
+
+    async def pending(mid: str) -> tuple:
+        r = await client.get(f"/members/{mid}/balance")
+        assert r.status_code == 200, r.text
+        return r.json()["pending_amount"], r.json()["pending_count"]
+
+    # Paying the invoice pays its lines
+    inv = await walk_in("Ledger Invoice")
+    mid = inv["member_id"]
+    fees = await lines(mid)
+    assert {item["payment_id"] for item in inv["items"]} == {p["id"] for p in fees.values()}
+    assert all(p["invoice_id"] == inv["id"] for p in fees.values())
+    assert await pending(mid) == (1500, 2)
+    balance = (await client.get(f"/members/{mid}/balance")).json()
+    assert (balance["due_amount"], balance["paid_amount"]) == (1500, 0) and balance["oldest_due_date"] is not None
+    assert (await client.post("/billing/pay", params={"invoice_id": inv["id"]})).json()["status"] == "Paid"
+    assert {p["status"] for p in (await lines(mid)).values()} == {"Paid"}
+    assert await pending(mid) == (0, 0)
+    balance = (await client.get(f"/members/{mid}/balance")).json()
+    assert (balance["paid_amount"], balance["paid_count"], balance["oldest_due_date"]) == (1500, 2, None)
+    assert (await client.get("/members/000000000000000000000000/balance")).status_code == 404
+    assert (await client.post("/billing/pay", params={"invoice_id": inv["id"]})).status_code == 400
+
+    # Paying the lines pays the invoice; reverting one makes it Unpaid again
+    inv2 = await walk_in("Ledger Lines")
+    mid2 = inv2["member_id"]
+    fees = await lines(mid2)
+    r = await client.post("/payments/pay", params={"member_id": mid2, "payment_id": fees["registration"]["id"]})
+    assert r.status_code == 200, r.text
+    assert await pending(mid2) == (500, 1)
+    r_log = await client.post("/payments/log-monthly", json={"member_id": mid2, "period": fees["monthly"]["period"], "amount": 500})
+    assert r_log.status_code == 200 and r_log.json()["id"] == fees["monthly"]["id"]
+    history = (await client.get("/billing/history", params={"member_id": mid2})).json()
+    assert [(i["id"], i["status"]) for i in history] == [(inv2["id"], "Paid")]  # no second invoice for a billed fee
+    assert await pending(mid2) == (0, 0)
+    r = await client.patch(f"/payments/{fees['monthly']['id']}", json={"status": "Due"})
+    assert r.status_code == 200 and r.json()["paid_at"] is None
+    assert (await client.get("/billing/history", params={"member_id": mid2})).json()[0]["status"] == "Unpaid"
+    assert await pending(mid2) == (500, 1)
+
+    # Drift: a tampered balance and an invoice from before the ledger
+    await main.balances_collection.update_one({"_id": mid2}, {"$set": {"pending_amount": 9999}})
+    await main.payments_collection.update_many({"member_id": mid}, {"$unset": {"invoice_id": ""}})
+    legacy_items = [{"description": item["description"], "amount": item["amount"]} for item in inv["items"]]
+    await main.invoices_collection.update_one({"_id": ObjectId(inv["id"])}, {"$set": {"items": legacy_items}})
+    r_job = await client.post("/admin/reconcile-ledger")
+    assert r_job.status_code == 200
+    job = await main.background_jobs.wait(r_job.json()["job_id"])
+    assert job["status"] == "done", job
+    assert job["result"]["invoices_linked"] >= 1 and job["result"]["balances_fixed"] >= 1
+    assert (await main.ledger.reconcile())["balances_fixed"] == 0  # idempotent: nothing left to fix
+    assert await pending(mid2) == (500, 1)
+    relinked = await main.invoices_collection.find_one({"_id": ObjectId(inv["id"])})
+    assert {item["payment_id"] for item in relinked["items"]} == {p["id"] for p in (await lines(mid)).values()}
+
+    # A line the repair pays lands in a closed revenue bucket: the stored bucket is dropped
+    from datetime import datetime, timedelta, timezone
+    past = main.today_ist() - timedelta(days=3)
+    paid_at = datetime(past.year, past.month, past.day, 6, tzinfo=timezone.utc)
+    await main.invoices_collection.update_one({"_id": ObjectId(inv["id"])}, {"$set": {"paid_at": paid_at}})
+    await main.payments_collection.update_one({"_id": ObjectId(relinked["items"][0]["payment_id"])}, {"$set": {"status": "Due", "paid_at": None}})
+    bucket_id = f"revenue:day:{past.isoformat()}"
+    await main.series_collection.replace_one({"_id": bucket_id}, {
+        "kind": "revenue", "granularity": "day", "start": past.isoformat(), "end": (past + timedelta(days=1)).isoformat(), "bucket": {},
+    }, upsert=True)
+    repaired = await main._reconcile_ledger()
+    assert repaired["lines_fixed"] == 1 and repaired["paid_days"] == [past.isoformat()]
+    assert await main.series_collection.find_one({"_id": bucket_id}) is None
+
+    for m in (mid, mid2):
+        await main.payments_collection.delete_many({"member_id": m})
+        await main.invoices_collection.delete_many({"member_id": m})
+        await main.balances_collection.delete_one({"_id": m})
+        await client.delete(f"/members/{m}")
+
+
+async def test_attendance_and_revenue_series_bucket_and_materialize_closed_periods(client: AsyncClient):
+    from datetime import datetime, timezone
+
+    from bson import ObjectId
+
+    import main
+
+    r = await client.post("/members", json={
+        "name": "Series PT", "phone": _unique_phone(), "email": "series@example.com", "membership_type": "PT", "batch": "Evening",
+    })
+    assert r.status_code == 200, r.text
+    mid = r.json()["id"]
+    # Far in the past, so no other test writes into these buckets; Mon 2001-01-01 .. Wed 2001-01-10
+    days = ["2001-01-01", "2001-01-03", "2001-01-08", "2001-01-10"]
+    rows = [
+        {"member_id": mid, "member_name": "Series PT", "date_ist": d, "batch": "Morning" if i % 2 else "Evening",
+         "check_in_at_utc": datetime.fromisoformat(d + "T01:30:00+00:00")}  # 07:00 IST
+        for i, d in enumerate(days)
+    ]
+    await main.attendance_collection.insert_many(rows)
+    paid = datetime(2001, 1, 31, 20, 0, tzinfo=timezone.utc)  # 01:30 IST on 1 February
+    await main.payments_collection.insert_one({
+        "member_id": mid, "member_name": "Series PT", "amount": 2000, "fee_type": "monthly", "period": "2001-02",
+        "status": "Paid", "due_date": paid, "paid_at": paid, "created_at": paid,
+    })
+
+    r_week = await client.get("/analytics/attendance-series", params={"granularity": "week", "date_from": "2001-01-03", "date_to": "2001-01-10"})
+    assert r_week.status_code == 200, r_week.text
+    body = r_week.json()
+    assert (body["date_from"], body["date_to"]) == ("2001-01-01", "2001-01-14")
+    assert [(b["start"], b["end"], b["check_ins"]) for b in body["buckets"]] == [("2001-01-01", "2001-01-07", 2), ("2001-01-08", "2001-01-14", 2)]
+    assert body["buckets"][0]["by_batch"] == {"Evening": 1, "Morning": 1}
+    assert body["buckets"][0]["by_membership_type"] == {"PT": 2}
+    r_day = await client.get("/analytics/attendance-series", params={"date_from": "2001-01-01", "date_to": "2001-01-03"})
+    assert [b["check_ins"] for b in r_day.json()["buckets"]] == [1, 0, 1]
+
+    # Closed buckets are stored: a write that bypasses invalidation is not seen, a delete is
+    assert await main.series_collection.count_documents({"kind": "attendance", "start": {"$gte": "2001-01-01", "$lt": "2001-02-01"}}) == 5
+    extra = await main.attendance_collection.insert_one(
+        {**rows[0], "_id": ObjectId(), "date_ist": "2001-01-02", "check_in_at_utc": datetime(2001, 1, 2, 1, 30, tzinfo=timezone.utc)},
+    )
+    r_again = await client.get("/analytics/attendance-series", params={"granularity": "week", "date_from": "2001-01-01", "date_to": "2001-01-14"})
+    assert r_again.json() == body
+    assert (await client.delete(f"/attendance/{extra.inserted_id}")).status_code == 200
+    first = await client.get("/analytics/attendance-series", params={"granularity": "week", "date_from": "2001-01-01", "date_to": "2001-01-07"})
+    assert first.json()["buckets"][0]["check_ins"] == 2
+
+    r_rev = await client.get("/analytics/revenue-series", params={"granularity": "month", "date_from": "2001-01-15", "date_to": "2001-02-15"})
+    assert r_rev.status_code == 200, r_rev.text
+    months = r_rev.json()["buckets"]
+    assert [(b["start"], b["amount"], b["payments"]) for b in months] == [("2001-01-01", 0, 0), ("2001-02-01", 2000, 1)]
+    assert months[1]["by_batch"] == {"Evening": 2000} and months[1]["by_membership_type"] == {"PT": 2000}
+
+    assert (await client.get("/analytics/revenue-series", params={"granularity": "hour"})).status_code == 400
+    assert (await client.get("/analytics/attendance-series", params={"date_from": "2001-01-01", "date_to": "2003-01-01"})).status_code == 400
+    assert len((await client.get("/analytics/revenue-series", params={"granularity": "month"})).json()["buckets"]) == 12
+
+    await main.attendance_collection.delete_many({"member_id": mid})
+    await main.payments_collection.delete_many({"member_id": mid})
+    await main.invoices_collection.delete_many({"member_id": mid})
+    await main.balances_collection.delete_one({"_id": mid})
+    await main.series_collection.delete_many({"start": {"$lt": "2002-01-01"}})
+    await client.delete(f"/members/{mid}")
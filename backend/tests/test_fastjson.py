@@ -0,0 +1,111 @@
+"""
+Fast JSON path tests: rows built straight from MongoDB documents and written by FastJSONResponse
+are byte-for-byte what FastAPI writes for the same rows validated against the response models.
+"""
+import sys
+from pathlib import Path
+
+_backend = Path(__file__).resolve().parent.parent
+if str(_backend) not in sys.path:
+    sys.path.insert(0, str(_backend))
+
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+import fastjson
+from fastjson import FastJSONResponse
+from main import InvoiceResponse, MemberResponse, PaymentResponse, _invoice_row, _member_row, _payment_row
+
+NAIVE = datetime(2025, 2, 14, 1, 30, 5, 123000)  # as read from MongoDB (UTC, millisecond precision)
+WHOLE_SECOND = datetime(2025, 3, 1, 0, 0, 0)
+AWARE = datetime(2025, 2, 14, 1, 30, 5, 123000, tzinfo=timezone.utc)
+
+
+def _member_docs() -> list[dict]:
+    return [
+        {
+            "_id": ObjectId(), "name": "Ravi Kumar", "phone": "98765 43210", "email": "ravi@example.com",
+            "membership_type": "Regular", "batch": "Morning", "status": "Active", "created_at": NAIVE,
+            "last_attendance_date": WHOLE_SECOND, "photo": {"id": "x"}, "id_document_type": "Aadhar",
+        },
+        {
+            "_id": ObjectId(), "name": "Zoë \"Quotes\" \\ Ñandú   \x1f", "phone": "+91-99999-00000",
+            "email": "z@example.com", "membership_type": "Personal Training", "batch": "Ladies",
+            "created_at": AWARE, "workout_schedule": "Mon: legs\nTue: back", "diet_chart": "",
+        },
+    ]
+
+
+def _attendance_map(docs: list[dict]) -> dict:
+    mid = str(docs[0]["_id"])
+    return {mid: {"member_id": mid, "check_in_at_utc": NAIVE, "check_out_at_utc": None}}
+
+
+def _payment_docs() -> list[dict]:
+    return [
+        {"_id": ObjectId(), "member_id": str(ObjectId()), "member_name": "Ravi", "amount": 500, "fee_type": "monthly",
+         "period": "2025-02", "status": "Due", "due_date": WHOLE_SECOND, "created_at": NAIVE},
+        {"_id": ObjectId(), "member_id": str(ObjectId()), "amount": 1000, "fee_type": "registration",
+         "status": "Paid", "paid_at": AWARE, "created_at": WHOLE_SECOND},
+    ]
+
+
+def _invoice_docs() -> list[dict]:
+    return [
+        {"_id": ObjectId(), "member_id": str(ObjectId()), "member_name": "Ravi Kumar",
+         "items": [{"description": "Registration", "amount": 1000}, {"description": "First Month – ₹500", "amount": 500}],
+         "total": 1500, "status": "Paid", "issued_at": AWARE, "paid_at": NAIVE},
+        {"_id": ObjectId(), "member_id": str(ObjectId()), "total": 500, "issued_at": WHOLE_SECOND},
+    ]
+
+
+def _cases() -> list:
+    members = _member_docs()
+    attendance_map = _attendance_map(members)
+    return [
+        (MemberResponse, [_member_row(d, attendance_map=attendance_map) for d in members]),
+        (MemberResponse, [_member_row(d, include_photos=False) for d in members]),
+        (PaymentResponse, [_payment_row(d) for d in _payment_docs()]),
+        (InvoiceResponse, [_invoice_row(d) for d in _invoice_docs()]),
+    ]
+
+
+def _fastapi_body(model, rows: list[dict]) -> bytes:
+    """What a response_model=list[model] endpoint writes: validate, dump in JSON mode, JSONResponse."""
+    adapter = TypeAdapter(list[model])
+    return JSONResponse(adapter.dump_python(adapter.validate_python(rows), mode="json")).body
+
+
+@pytest.mark.parametrize("use_orjson", [True, False], ids=["orjson", "stdlib"])
+def test_fast_rows_are_byte_compatible_with_response_models(monkeypatch, use_orjson):
+    if use_orjson and fastjson.orjson is None:
+        pytest.skip("orjson is not installed")
+    if not use_orjson:
+        monkeypatch.setattr(fastjson, "orjson", None)
+    for model, rows in _cases():
+        assert list(rows[0]) == list(model.model_fields), model.__name__
+        assert FastJSONResponse(rows).body == _fastapi_body(model, rows), model.__name__
+
+
+def test_fast_response_headers():
+    response = FastJSONResponse([], headers={"X-Next-Cursor": "abc"})
+    assert response.body == b"[]"
+    assert response.headers["content-type"] == "application/json"
+    assert response.headers["x-next-cursor"] == "abc"
+
+
+@pytest.mark.asyncio
+async def test_ndjson_chunks_write_one_row_per_line():
+    expected = [_payment_row(d) for d in _payment_docs()] * 3
+
+    async def rows():
+        for row in expected:
+            yield row
+
+    chunks = [chunk async for chunk in fastjson.ndjson_chunks(rows(), chunk_rows=4)]
+    assert len(chunks) == 2 and all(chunk.endswith(b"\n") for chunk in chunks)
+    assert b"".join(chunks).splitlines() == [fastjson.dumps(row) for row in expected]
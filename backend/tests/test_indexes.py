@@ -0,0 +1,99 @@
+"""
+Index tests: every hot endpoint query must be answered by an index scan (explain() against the test DB).
+"""
+import sys
+from pathlib import Path
+
+_backend = Path(__file__).resolve().parent.parent
+if str(_backend) not in sys.path:
+    sys.path.insert(0, str(_backend))
+
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from indexes import INDEXES, ensure_indexes
+from main import attendance_collection, db, invoices_collection, members_collection, payments_collection
+from pagination import after_filter
+
+pytestmark = pytest.mark.asyncio
+
+
+def _stages(plan) -> set:
+    """All stage names in an explain plan tree (classic and SBE explain shapes)."""
+    found = set()
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            found.add(plan["stage"])
+        for v in plan.values():
+            found |= _stages(v)
+    elif isinstance(plan, list):
+        for v in plan:
+            found |= _stages(v)
+    return found
+
+
+async def test_ensure_indexes_is_idempotent():
+    await ensure_indexes(db)
+    report = await ensure_indexes(db)
+    for coll_name, models in INDEXES.items():
+        assert report[coll_name]["created"] == []
+        assert report[coll_name]["failed"] == []
+        assert len(report[coll_name]["existing"]) == len(models)
+
+
+async def test_retired_index_dropped_only_once_replacement_exists():
+    from pymongo import ASCENDING, IndexModel
+
+    coll = db["indexes_retire_test"]
+    await coll.drop()
+    await coll.create_index([("member_id", ASCENDING)], name="old_member")
+    await coll.insert_many([{"member_id": "m1", "period": "2025-01"}, {"member_id": "m1", "period": "2025-01"}])
+    registry = {coll.name: [IndexModel([("member_id", ASCENDING), ("period", ASCENDING)], name="member_period_unique", unique=True)]}
+    retired = {coll.name: {"old_member": "member_period_unique"}}
+
+    blocked = (await ensure_indexes(db, registry, retired))[coll.name]
+    assert blocked["failed"] == ["member_period_unique"] and blocked["dropped"] == []
+    assert "old_member" in await coll.index_information()
+
+    await coll.delete_one({"member_id": "m1"})
+    report = (await ensure_indexes(db, registry, retired))[coll.name]
+    assert (report["created"], report["dropped"], report["extra"]) == (["member_period_unique"], ["old_member"], [])
+    assert "old_member" not in await coll.index_information()
+    assert (await ensure_indexes(db, registry, retired))[coll.name]["dropped"] == []
+    await coll.drop()
+
+
+async def test_endpoint_queries_use_ixscan():
+    await ensure_indexes(db)
+    mid = "000000000000000000000000"
+    queries = {
+        "check_in/check_out/get_member_by_id": attendance_collection.find({"member_id": mid, "date_ist": "2025-01-01"}).limit(1),
+        "get_member_by_phone": members_collection.find({"phone_e164": "+919876543210"}).limit(1),
+        "list_members": members_collection.find().sort([("created_at", -1), ("_id", -1)]).limit(101),
+        "list_members(today attendance)": attendance_collection.find({"member_id": {"$in": [mid, "1" * 24]}, "date_ist": "2025-01-01"}),
+        "attendance_by_date": attendance_collection.find({"date_ist": "2025-01-01"}).sort([("batch", 1), ("check_in_at_utc", 1)]),
+        "attendance_by_date_range": attendance_collection.find(
+            {"date_ist": {"$gte": "2025-01-01", "$lte": "2025-01-31"}}
+        ).sort([("date_ist", 1), ("batch", 1), ("check_in_at_utc", 1), ("_id", 1)]).limit(1001),
+        "list_payments": payments_collection.find().sort([("created_at", -1), ("_id", -1)]).limit(1001),
+        "list_payments(member_id)": payments_collection.find({"member_id": mid}).sort([("created_at", -1), ("_id", -1)]).limit(1001),
+        "list_payments(status)": payments_collection.find({"status": "Due"}).sort([("created_at", -1), ("_id", -1)]).limit(1001),
+        "list_payments(cursor)": payments_collection.find(
+            after_filter([("created_at", -1), ("_id", -1)], [datetime(2025, 1, 1), ObjectId(mid)])
+        ).sort([("created_at", -1), ("_id", -1)]).limit(1001),
+        "billing_history": invoices_collection.find().sort([("issued_at", -1), ("_id", -1)]).limit(1001),
+        "billing_history(member_id)": invoices_collection.find({"member_id": mid}).sort([("issued_at", -1), ("_id", -1)]).limit(1001),
+        "billing_history(search)": invoices_collection.find({"search_tokens": "ravi"}).sort([("issued_at", -1), ("_id", -1)]).limit(1001),
+        "search_members": members_collection.find({"search_tokens": {"$all": ["ravi", "ku"]}}).limit(200),
+    }
+    # Paged list queries must get their order from the index (no blocking in-memory SORT)
+    unsorted_ok = {"check_in/check_out/get_member_by_id", "get_member_by_phone", "list_members(today attendance)", "search_members"}
+    for label, cursor in queries.items():
+        plan = await cursor.explain()
+        stages = _stages(plan["queryPlanner"]["winningPlan"])
+        assert "IXSCAN" in stages, f"{label}: {stages}"
+        assert "COLLSCAN" not in stages, f"{label}: {stages}"
+        if label not in unsorted_ok:
+            assert "SORT" not in stages, f"{label}: {stages}"
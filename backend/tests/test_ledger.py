@@ -0,0 +1,49 @@
+"""
+Member balance bookkeeping (no database): the $inc a fee line's status change makes to its
+member's balance, and the opening balance of a new member.
+"""
+import sys
+from pathlib import Path
+
+_backend = Path(__file__).resolve().parent.parent
+if str(_backend) not in sys.path:
+    sys.path.insert(0, str(_backend))
+
+from datetime import datetime
+
+import pytest
+
+from ledger import BALANCE_FIELDS, balance_delta, opening_balance
+
+FIRST = datetime(2025, 2, 1)
+FIFTH = datetime(2025, 2, 5)
+
+
+def _line(status: str, amount: int = 500, due_date: datetime = FIRST) -> dict:
+    return {"member_id": "m1", "status": status, "amount": amount, "due_date": due_date}
+
+
+@pytest.mark.parametrize("before, after, expected", [
+    (None, _line("Due"), {"due_amount": 500, "due_count": 1, "pending_amount": 500, "pending_count": 1}),
+    (_line("Due"), _line("Overdue"), {"due_amount": -500, "due_count": -1, "overdue_amount": 500, "overdue_count": 1}),
+    (_line("Overdue"), _line("Paid"), {"overdue_amount": -500, "overdue_count": -1, "pending_amount": -500, "pending_count": -1, "paid_amount": 500, "paid_count": 1}),
+    (_line("Paid"), _line("Due"), {"paid_amount": -500, "paid_count": -1, "due_amount": 500, "due_count": 1, "pending_amount": 500, "pending_count": 1}),
+    (_line("Due"), _line("Paid", amount=2000), {"due_amount": -500, "due_count": -1, "pending_amount": -500, "pending_count": -1, "paid_amount": 2000, "paid_count": 1}),
+    (_line("Due"), _line("Due"), {}),
+    (_line("Paid"), None, {"paid_amount": -500, "paid_count": -1}),
+])
+def test_balance_delta(before, after, expected):
+    assert balance_delta(before, after) == expected
+
+
+def test_opening_balance_sums_lines_and_keeps_oldest_unpaid_due_date():
+    doc = opening_balance("m1", [_line("Due", 1000, FIFTH), _line("Overdue", 500, FIRST), _line("Paid", 2000, datetime(2025, 1, 1))])
+    assert set(BALANCE_FIELDS) <= set(doc)
+    assert (doc["due_amount"], doc["overdue_amount"], doc["pending_amount"], doc["pending_count"]) == (1000, 500, 1500, 2)
+    assert (doc["paid_amount"], doc["paid_count"]) == (2000, 1)
+    assert doc["oldest_due_date"] == FIRST
+
+
+def test_opening_balance_without_unpaid_fees_has_no_oldest_due_date():
+    doc = opening_balance("m1", [_line("Paid")])
+    assert doc["pending_amount"] == 0 and "oldest_due_date" not in doc
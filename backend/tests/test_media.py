@@ -0,0 +1,59 @@
+"""
+Media store unit tests (no database): range parsing and the local filesystem backend.
+"""
+import sys
+from pathlib import Path
+
+_backend = Path(__file__).resolve().parent.parent
+if str(_backend) not in sys.path:
+    sys.path.insert(0, str(_backend))
+
+import pytest
+
+from media import LocalMediaStore, MediaStore, decode_base64, parse_range
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    assert parse_range("bytes=0-1,5-6", 100) is None  # multi-range: serve whole blob
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+
+
+def test_decode_base64_accepts_data_uri():
+    assert decode_base64("data:image/png;base64,aGVsbG8=") == b"hello"
+    assert decode_base64("aGVsbG8=") == b"hello"
+    assert decode_base64("aGVs\nbG8=") == b"hello"
+
+
+@pytest.mark.parametrize("data", ["aGVsbG8", "aGVs*bG8=", "data:image/png;base64,not base64!"])
+def test_decode_base64_rejects_corrupt_input(data):
+    with pytest.raises(ValueError):
+        decode_base64(data)
+
+
+def test_media_store_backends_must_implement_storage():
+    class Partial(MediaStore):
+        async def exists(self, sha256):
+            return False
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+@pytest.mark.asyncio
+async def test_local_store_is_content_addressed(tmp_path):
+    store = LocalMediaStore(tmp_path)
+    data = b"%PDF-1.4 test document"
+    meta = await store.put(data)
+    assert meta["size"] == len(data)
+    assert meta["content_type"] == "application/pdf"
+    assert await store.put(data) == meta
+    assert await store.read(meta["sha256"]) == data
+    assert await store.read(meta["sha256"], 5, 7) == b"1.4"
+    await store.delete(meta["sha256"])
+    assert not await store.exists(meta["sha256"])
@@ -0,0 +1,100 @@
+"""
+Notification dispatcher tests: token bucket (no database), outbox delivery, batching and retry
+against the test database with the FakeProvider.
+"""
+import sys
+from pathlib import Path
+
+_backend = Path(__file__).resolve().parent.parent
+if str(_backend) not in sys.path:
+    sys.path.insert(0, str(_backend))
+
+import asyncio
+import time
+
+import pytest
+
+from notifications import FakeProvider, NotificationDispatcher, NotificationProvider, TokenBucket
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+async def outbox():
+    from main import db
+    coll = db["notification_outbox_test"]
+    await coll.delete_many({})
+    yield coll
+    await coll.drop()
+
+
+async def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=100.0, capacity=5)
+    t0 = time.monotonic()
+    await bucket.acquire(5)  # burst is free
+    assert time.monotonic() - t0 < 0.02
+    await bucket.acquire(5)  # next five need 50 ms of refill
+    assert time.monotonic() - t0 >= 0.04
+
+
+async def test_provider_without_send_batch_fails_at_construction():
+    class Incomplete(NotificationProvider):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+async def test_dispatcher_batches_and_persists(outbox):
+    provider = FakeProvider()
+    notifier = NotificationDispatcher(outbox, provider, workers=1, batch_size=10, poll_seconds=60)
+    count = await notifier.enqueue_many([("fees_due", {"name": f"M{i}", "phone": f"90000000{i:02d}"}, {"pending_amount": 500}) for i in range(25)])
+    assert count == 25
+    assert await outbox.count_documents({"status": "pending"}) == 25
+    notifier.start()
+    await notifier.drain()
+    await notifier.stop()
+    assert len(provider.sent) == 25
+    assert max(provider.batches) == 10
+    assert await outbox.count_documents({"status": "sent"}) == 25
+    assert "₹500" in provider.sent[0]["text"]
+
+
+async def test_dispatcher_retries_with_backoff_then_fails(outbox):
+    provider = FakeProvider()
+    provider.fail_next = 1
+    notifier = NotificationDispatcher(outbox, provider, workers=1, max_attempts=2, backoff_seconds=0.01, poll_seconds=0.01)
+    notifier.start()
+    first = await notifier.enqueue("registration", {"name": "Retry", "phone": "9000000100"})
+    for _ in range(100):
+        if (await outbox.find_one({"_id": first}))["status"] == "sent":
+            break
+        await asyncio.sleep(0.02)
+    doc = await outbox.find_one({"_id": first})
+    assert doc["status"] == "sent" and doc["attempts"] == 2
+    assert doc["last_error"] == "fake provider failure"
+
+    provider.fail_next = 2
+    second = await notifier.enqueue("registration", {"name": "Gives up", "phone": "9000000101"})
+    for _ in range(100):
+        if (await outbox.find_one({"_id": second}))["status"] == "failed":
+            break
+        await asyncio.sleep(0.02)
+    await notifier.stop()
+    assert (await outbox.find_one({"_id": second}))["status"] == "failed"
+    assert notifier.counters == {"enqueued": 2, "sent": 1, "retried": 2, "failed": 1}
+
+
+async def test_outbox_survives_restart(outbox):
+    """Messages enqueued while no worker runs are sent by the next dispatcher (sweeper reads the outbox)."""
+    before = NotificationDispatcher(outbox, FakeProvider(), queue_size=1)
+    await before.enqueue_many([("registration", {"name": "A", "phone": "9000000200"}, None), ("registration", {"name": "B", "phone": "9000000201"}, None)])
+    provider = FakeProvider()
+    after = NotificationDispatcher(outbox, provider, poll_seconds=0.01)
+    after.start()
+    for _ in range(100):
+        if len(provider.sent) == 2:
+            break
+        await asyncio.sleep(0.02)
+    await after.stop()
+    assert sorted(m["user"]["name"] for m in provider.sent) == ["A", "B"]
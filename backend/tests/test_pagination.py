@@ -0,0 +1,43 @@
+"""
+Keyset pagination tests: cursor encoding and the "after" filter (no database).
+"""
+import sys
+from pathlib import Path
+
+_backend = Path(__file__).resolve().parent.parent
+if str(_backend) not in sys.path:
+    sys.path.insert(0, str(_backend))
+
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from pagination import after_filter, decode_cursor, encode_cursor, full_sort
+
+
+def test_cursor_round_trips_datetimes_and_object_ids():
+    values = [datetime(2025, 2, 14, 6, 30, 0, 123000), ObjectId()]
+    cursor = encode_cursor(values)
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+    assert decode_cursor(cursor, 2) == values
+
+
+@pytest.mark.parametrize("bad", ["", "not-a-cursor", encode_cursor(["only-one"])])
+def test_decode_rejects_malformed_or_mismatched_cursor(bad):
+    with pytest.raises(ValueError):
+        decode_cursor(bad, 2)
+
+
+def test_full_sort_appends_id_tiebreaker():
+    assert full_sort([("created_at", -1)]) == [("created_at", -1), ("_id", -1)]
+    assert full_sort([("date_ist", 1), ("batch", 1)]) == [("date_ist", 1), ("batch", 1), ("_id", 1)]
+
+
+def test_after_filter_follows_sort_direction():
+    oid = ObjectId()
+    assert after_filter([("_id", 1)], [oid]) == {"_id": {"$gt": oid}}
+    assert after_filter([("created_at", -1), ("_id", -1)], ["t", oid]) == {
+        "created_at": {"$lte": "t"},
+        "$or": [{"created_at": {"$lt": "t"}}, {"created_at": "t", "_id": {"$lt": oid}}],
+    }
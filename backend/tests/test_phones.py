@@ -0,0 +1,57 @@
+"""
+Phone normalization (no database) and the phone_e164 backfill against the test database.
+"""
+import sys
+from pathlib import Path
+
+_backend = Path(__file__).resolve().parent.parent
+if str(_backend) not in sys.path:
+    sys.path.insert(0, str(_backend))
+
+import pytest
+
+from phones import backfill_phone_e164, normalize_phone
+
+
+@pytest.mark.parametrize("raw", ["9876543210", " 98765 43210 ", "+91 98765-43210", "09876543210", "919876543210", "0091 9876543210", "(+91) 98765.43210"])
+def test_normalize_indian_formats(raw):
+    assert normalize_phone(raw) == "+919876543210"
+
+
+def test_normalize_keeps_other_country_codes():
+    assert normalize_phone("+44 20 7946 0958") == "+442079460958"
+
+
+@pytest.mark.parametrize("raw", [None, "", "   ", "12345", "0123456789", "98765x43210", "+0123456789", "+1234567890123456"])
+def test_normalize_rejects_non_numbers(raw):
+    assert normalize_phone(raw) is None
+
+
+@pytest.fixture
+async def members():
+    from indexes import INDEXES
+    from main import db
+    coll = db["gym_members_phone_test"]
+    await coll.drop()
+    await coll.create_indexes([m for m in INDEXES["gym_members"] if m.document["name"] == "phone_e164_unique"])
+    yield coll
+    await coll.drop()
+
+
+@pytest.mark.asyncio
+async def test_backfill_sets_canonical_phone_and_reports_conflicts(members):
+    await members.insert_many([
+        {"name": "Spaced", "phone": "+91 98765 43210"},
+        {"name": "Plain", "phone": "9876543210"},
+        {"name": "Other", "phone": "9123456780"},
+        {"name": "Junk", "phone": "n/a"},
+        {"name": "Done", "phone": "9000000001", "phone_e164": "+919000000001"},
+    ])
+    result = await backfill_phone_e164(members, batch_size=2)
+    assert result["scanned"] == 4 and result["updated"] == 2
+    assert [r["phone"] for r in result["invalid"]] == ["n/a"]
+    assert len(result["conflicts"]) == 1 and result["conflicts"][0]["phone_e164"] == "+919876543210"
+    assert (await members.find_one({"name": "Other"}))["phone_e164"] == "+919123456780"
+
+    again = await backfill_phone_e164(members)
+    assert again["updated"] == 0 and again["scanned"] == 2
@@ -0,0 +1,96 @@
+"""
+Projection tests through the real endpoints: a member carrying large PT plans and legacy inline
+media (not yet moved to the media store) is read by every member endpoint. Lean reads must not
+carry the inline blobs, yet still link the photo / ID document, which are served from the inline data.
+"""
+import sys
+from pathlib import Path
+
+_backend = Path(__file__).resolve().parent.parent
+if str(_backend) not in sys.path:
+    sys.path.insert(0, str(_backend))
+
+import base64
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from main import app, members_collection
+
+pytestmark = pytest.mark.asyncio
+
+PHOTO = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 1200  # ~300 KB
+ID_DOCUMENT = b"%PDF-1.4 " + bytes(range(256)) * 400
+LEAN_RESPONSE_MAX = 100_000  # the PT plans below are ~64 KB as JSON; the inline photo alone is ~410 KB
+
+
+@pytest.fixture
+async def client():
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            yield ac
+
+
+@pytest.fixture
+async def legacy_member():
+    phone = "8" + str(uuid.uuid4().int)[:9]
+    result = await members_collection.insert_one({
+        "name": "Projection Test",
+        "phone": phone,
+        "phone_e164": "+91" + phone,
+        "email": "proj@example.com",
+        "membership_type": "PT",
+        "batch": "Morning",
+        "status": "Active",
+        # Newest member, so it heads GET /members
+        "created_at": datetime.now(timezone.utc) + timedelta(days=365),
+        "workout_schedule": "Squats 5x5\n" * 2000,
+        "diet_chart": "Oats, eggs, dal\n" * 2500,
+        "photo_base64": base64.b64encode(PHOTO).decode(),
+        "id_document_base64": base64.b64encode(ID_DOCUMENT).decode(),
+        "id_document_type": "Passport",
+    })
+    yield {"id": str(result.inserted_id), "phone": phone}
+    await members_collection.delete_one({"_id": result.inserted_id})
+
+
+def _assert_lean_with_media_links(r, member_id: str):
+    assert r.status_code == 200, r.text
+    assert len(r.content) < LEAN_RESPONSE_MAX, f"{len(r.content)} bytes"
+    row = r.json()
+    assert row["photo_url"] == f"/members/{member_id}/photo"
+    assert row["id_document_url"] == f"/members/{member_id}/id-document"
+    assert row["photo_base64"] is None and row["id_document_base64"] is None
+    assert row["workout_schedule"].startswith("Squats")
+
+
+async def test_lean_member_reads_link_legacy_media(client, legacy_member):
+    mid = legacy_member["id"]
+    _assert_lean_with_media_links(await client.get(f"/members/{mid}", params={"include_media": False}), mid)
+    _assert_lean_with_media_links(await client.get(f"/members/by-phone/{legacy_member['phone']}"), mid)
+    _assert_lean_with_media_links(await client.patch(f"/members/{mid}", json={"email": "proj2@example.com"}), mid)
+    _assert_lean_with_media_links(await client.patch(f"/members/{mid}", json={}), mid)
+
+    r_list = await client.get("/members", params={"limit": 1})
+    assert r_list.status_code == 200 and len(r_list.content) < LEAN_RESPONSE_MAX
+    (row,) = r_list.json()
+    assert row["id"] == mid and row["photo_url"] == f"/members/{mid}/photo" and row["photo_base64"] is None
+
+
+async def test_brief_list_has_no_plans_or_media(client, legacy_member):
+    r = await client.get("/members", params={"limit": 1, "brief": True})
+    assert r.status_code == 200 and len(r.content) < 1024
+    (row,) = r.json()
+    assert row["id"] == legacy_member["id"]
+    assert row["workout_schedule"] is None and row["photo_url"] is None and row["id_document_type"] is None
+
+
+async def test_legacy_media_served_and_inlined_on_request(client, legacy_member):
+    mid = legacy_member["id"]
+    assert (await client.get(f"/members/{mid}/photo")).content == PHOTO
+    assert (await client.get(f"/members/{mid}/id-document")).content == ID_DOCUMENT
+    full = (await client.get(f"/members/{mid}")).json()  # include_media defaults to true
+    assert base64.b64decode(full["photo_base64"]) == PHOTO
+    assert base64.b64decode(full["id_document_base64"]) == ID_DOCUMENT
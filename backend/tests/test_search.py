@@ -0,0 +1,98 @@
+"""
+Search tokenization and ranking (no database) and member search against the test database.
+"""
+import sys
+from pathlib import Path
+
+_backend = Path(__file__).resolve().parent.parent
+if str(_backend) not in sys.path:
+    sys.path.insert(0, str(_backend))
+
+import pytest
+
+from search import MAX_PREFIX, SEARCH_CANDIDATES, backfill_search_tokens, invoice_search_tokens, member_search_tokens, query_terms, search_members
+
+
+def test_member_tokens_cover_name_prefixes_and_phone_suffixes():
+    tokens = set(member_search_tokens("Ravi Kumar", "+919876543210"))
+    assert {"r", "ra", "ravi", "k", "kumar", "=ravi", "=kumar", "3210", "43210", "9876543210"} <= tokens
+    assert "=rav" not in tokens
+    assert "543" not in tokens  # phone suffixes start at 4 digits
+    assert not any(t.startswith("91") and len(t) > 10 for t in tokens)
+    long_name = member_search_tokens("Venkatanarasimharajuvaripeta", None)
+    assert max(len(t) for t in long_name if not t.startswith("=")) == MAX_PREFIX
+    assert "=venkatanarasimharajuvaripeta" in long_name
+
+
+def test_invoice_tokens_cover_id_suffixes():
+    tokens = set(invoice_search_tokens("65f0c2a1b3d4e5f60718293a", "Asha Rao"))
+    assert {"asha", "rao", "18293a", "0718293a"} <= tokens
+    assert "8293a" not in tokens
+
+
+def test_query_terms():
+    assert query_terms("  Ravi  KU ravi") == ["ravi", "ku"]
+    assert query_terms("+91 98765 43210") == ["9876543210"]
+    assert query_terms("3210") == ["3210"]
+    assert query_terms("   ") == []
+
+
+@pytest.fixture
+async def members():
+    from main import db
+    coll = db["gym_members_search_test"]
+    await coll.drop()
+    people = [
+        ("Ravi Kumar", "+919876543210", "Active"),
+        ("Kumar Ravichandran", "+919000000001", "Active"),
+        ("Ravindra Kulkarni", "+919000000002", "Inactive"),
+        ("Ravindra Kulkarni", "+919000000003", "Active"),
+        ("Asha Rao", "+919111113210", "Active"),
+    ]
+    await coll.insert_many([
+        {"name": name, "phone_e164": phone, "status": status, "search_tokens": member_search_tokens(name, phone)}
+        for name, phone, status in people
+    ])
+    yield coll
+    await coll.drop()
+
+
+@pytest.mark.asyncio
+async def test_search_members_ranks_and_bounds(members):
+    names = [d["name"] for d in await search_members(members, "ravi")]
+    # exact word first, then prefix matches on the first word, then on a later word
+    assert names == ["Ravi Kumar", "Ravindra Kulkarni", "Ravindra Kulkarni", "Kumar Ravichandran"]
+    statuses = [d["status"] for d in await search_members(members, "ravindra ku")]
+    assert statuses == ["Active", "Inactive"]
+    assert [d["name"] for d in await search_members(members, "ravi ku", limit=1)] == ["Ravi Kumar"]
+    assert {d["name"] for d in await search_members(members, "3210")} == {"Ravi Kumar", "Asha Rao"}
+    assert await search_members(members, "ravindrakulkarni") == []
+
+
+@pytest.mark.asyncio
+async def test_exact_word_survives_more_prefix_matches_than_candidates(members):
+    # Inserted before Ravi: a bare prefix scan would fill its SEARCH_CANDIDATES with these first
+    crowd = [f"Ravikiran {i:04d}" for i in range(SEARCH_CANDIDATES + 50)]
+    await members.insert_many([
+        {"name": name, "phone_e164": f"+91800000{i:04d}", "status": "Active", "search_tokens": member_search_tokens(name, f"+91800000{i:04d}")}
+        for i, name in enumerate(crowd)
+    ])
+    await members.delete_many({"name": "Ravi Kumar"})
+    await members.insert_one({"name": "Ravi Kumar", "phone_e164": "+919876543210", "status": "Active",
+                              "search_tokens": member_search_tokens("Ravi Kumar", "+919876543210")})
+    assert (await search_members(members, "ravi", limit=5))[0]["name"] == "Ravi Kumar"
+    assert (await search_members(members, "ravi k", limit=5))[0]["name"] == "Ravi Kumar"
+    names = [d["name"] for d in await search_members(members, "ra", limit=5)]
+    assert len(names) == 5
+
+
+@pytest.mark.asyncio
+async def test_backfill_adds_exact_tokens_to_old_members(members):
+    from main import db
+    await members.update_many({}, {"$set": {"search_tokens": ["ravi", "kumar"]}})
+    invoices = db["invoices_search_test"]
+    await invoices.drop()
+    result = await backfill_search_tokens(members, invoices)
+    assert result == {"members": 5, "invoices": 0}
+    assert "=ravi" in (await members.find_one({"name": "Ravi Kumar"}))["search_tokens"]
+    assert (await backfill_search_tokens(members, invoices))["members"] == 0
@@ -0,0 +1,38 @@
+"""
+Chart bucket arithmetic (no database): IST day / Monday-week / month buckets covering a date range.
+"""
+import sys
+from pathlib import Path
+
+_backend = Path(__file__).resolve().parent.parent
+if str(_backend) not in sys.path:
+    sys.path.insert(0, str(_backend))
+
+from datetime import date, datetime, timezone
+
+import pytest
+
+from series import bucket_end, bucket_start, bucket_starts, ist_day
+
+
+@pytest.mark.parametrize("granularity, day, start, end", [
+    ("day", date(2025, 2, 14), date(2025, 2, 14), date(2025, 2, 15)),
+    ("week", date(2025, 2, 16), date(2025, 2, 10), date(2025, 2, 17)),  # Sunday belongs to the week from Monday
+    ("week", date(2025, 2, 10), date(2025, 2, 10), date(2025, 2, 17)),
+    ("month", date(2025, 2, 28), date(2025, 2, 1), date(2025, 3, 1)),
+    ("month", date(2024, 12, 31), date(2024, 12, 1), date(2025, 1, 1)),
+])
+def test_bucket_bounds(granularity, day, start, end):
+    assert bucket_start(day, granularity) == start
+    assert bucket_end(start, granularity) == end
+
+
+def test_bucket_starts_cover_range_with_whole_buckets():
+    assert bucket_starts(date(2024, 11, 15), date(2025, 1, 1), "month") == [date(2024, 11, 1), date(2024, 12, 1), date(2025, 1, 1)]
+    assert bucket_starts(date(2025, 2, 12), date(2025, 2, 17), "week") == [date(2025, 2, 10), date(2025, 2, 17)]
+    assert len(bucket_starts(date(2024, 1, 1), date(2024, 12, 31), "day")) == 366
+
+
+def test_ist_day_of_utc_times():
+    assert ist_day(datetime(2025, 2, 13, 18, 29)) == "2025-02-13"  # naive = UTC; 23:59 IST
+    assert ist_day(datetime(2025, 2, 13, 18, 30, tzinfo=timezone.utc)) == "2025-02-14"
@@ -0,0 +1,41 @@
+"""
+Multi-document transactions for Jupiter Arena (transactions).
+
+Enrollment and the fee ledger change several documents that must agree (member + fees +
+invoice, invoice + its fee lines + the member's balance). MongoDB runs those writes in one
+transaction on a replica set or through mongos; a standalone server has no transactions, and
+the callers fall back to ordered writes (enrollment.py compensates, ledger.py reconciles).
+
+Usage: from transactions import Transactions
+  transactions = Transactions(client)
+  if await transactions.supported(): ...
+  result = await transactions.run(write)  # await write(session) in a transaction, or write(None) without
+"""
+
+from pymongo.errors import OperationFailure
+
+
+class Transactions:
+    def __init__(self, client):
+        self.client = client
+        self._supported: bool | None = None  # detected on first use
+
+    async def supported(self) -> bool:
+        """Multi-document transactions need a replica set member or mongos."""
+        if self._supported is None:
+            try:
+                hello = await self.client.admin.command("hello")
+            except OperationFailure:  # servers before 4.4.2
+                hello = await self.client.admin.command("isMaster")
+            self._supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        return self._supported
+
+    async def run(self, write):
+        """
+        Return await write(session) run in one transaction (retried on transient errors, so write
+        must be safe to re-run), or await write(None) where the server has no transactions.
+        """
+        if not await self.supported():
+            return await write(None)
+        async with await self.client.start_session() as session:
+            return await session.with_transaction(write)